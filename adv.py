@@ -1,30 +1,29 @@
 import streamlit as st
+import resources
+import course_store
 import os
 import tempfile
 from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS
 from langchain.document_loaders import PyPDFLoader
 from langchain.chains import RetrievalQA
-from pydantic import BaseModel, ValidationError
-from typing import List
 import json
-from pymongo import MongoClient
 
 # Load environment variables
 load_dotenv()
 
-# Initialize MongoDB client
-db_client = MongoClient(os.getenv("MONGO_URI"))
+# Initialize MongoDB client (shared across reruns)
+try:
+    db_client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
+    st.stop()
 db = db_client["quiz-cluster"]
 
-# Initialize LLM
-llm = ChatOpenAI(model="gpt-4", api_key=os.getenv("OPENAI_API_KEY"))
-
-# Embeddings
-from langchain.embeddings.openai import OpenAIEmbeddings
-embeddings = OpenAIEmbeddings()
+# Initialize LLM and embeddings (shared across reruns)
+llm = resources.get_llm("gpt-4")
+embeddings = resources.get_embeddings()
 
 # Streamlit App
 def generate_quiz_page():
@@ -49,7 +48,10 @@ def generate_quiz_page():
             try:
                 # Load and split the document
                 loader = PyPDFLoader(temp_file_path)
-                docs = loader.load()
+                try:
+                    docs = loader.load()
+                finally:
+                    os.remove(temp_file_path)
 
                 if not docs:
                     st.error("Failed to extract content from the uploaded document. Please try another file.")
@@ -131,11 +133,11 @@ Ensure the questions are relevant to the content of the uploaded document.
             if st.button("✅ Post Quiz"):
                 result_to_send = st.session_state['generated_quiz']
                 
-                # Check if the subject name exists as a database
-                if subject_name in db_client.list_database_names():
-                    subject_db = db_client[subject_name]  # Access subject database
-                    subject_db["quiz"].insert_one(result_to_send)  # Store in "quiz" collection
-                    st.success(f"Quiz successfully stored in '{subject_name}' database under 'quiz' collection!")
+                # Look up the course by subject name (a course ID, name or legacy database name)
+                course = course_store.find_course(db_client["quiz-db"]["courses"], subject_name)
+                if course:
+                    course_store.get_collection(db_client, course, "quiz").insert_one(result_to_send)  # Store in the course's "quiz" collection
+                    st.success(f"Quiz successfully stored in the '{course['course_name']}' course!")
                 else:
                     st.warning("Subject name not found in the database. Quiz not stored.")
 
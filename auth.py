@@ -1,20 +1,22 @@
 import streamlit as st
-import bcrypt
-from pymongo import MongoClient
+import resources
+import session_auth
 from dotenv import load_dotenv
-import os
 
 # Load environment variables from .env file
 load_dotenv()
 
 # MongoDB connection details
-MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = "quiz-db"
 STUDENT_COLLECTION = "student_meta"
 TEACHER_COLLECTION = "teacher_meta"
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
+# Connect to MongoDB (shared across reruns)
+try:
+    client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
+    st.stop()
 db = client[DB_NAME]
 student_collection = db[STUDENT_COLLECTION]
 teacher_collection = db[TEACHER_COLLECTION]
@@ -29,13 +31,27 @@ def get_user_by_username_and_role(username, role):
         user = None
     return user
 
-# Function to check password
-def check_password(stored_password_hash, entered_password):
-    return bcrypt.checkpw(entered_password.encode('utf-8'), stored_password_hash)
+def get_course_ids(user, role):
+    """Courses to cache in the session token: created courses for teachers, enrolled courses for students."""
+    if role == "Teacher":
+        return db["courses"].distinct("course_id", {"creator_name": user.get("full_name")})
+    student = client["master_db"]["students"].find_one({"student_id": user["username"]}, {"_id": 0, "enrolled_courses": 1})
+    return (student or {}).get("enrolled_courses", [])
 
 # Streamlit login page
 st.title("Login Page")
 
+# Already logged in (e.g. after a browser refresh): the signed session token is enough
+profile = session_auth.restore_session()
+if profile:
+    st.success(f"Logged in as {profile['role']} {profile['username']}.")
+    if profile["role"] == "Student":
+        st.session_state.student_id = profile["username"]
+    if st.button("Logout", key="logout_button"):
+        session_auth.end_session()
+        st.rerun()
+    st.stop()
+
 # User login form
 role = st.selectbox("Select Role", ["Teacher", "Student"], key="login_role")
 username = st.text_input("Username", key="login_username")
@@ -46,16 +62,26 @@ if st.button("Login", key="login_button"):
     if username and password and role:
         user = get_user_by_username_and_role(username, role)
         if user:
-            # Check if password is correct
-            stored_password_hash = user["password"]
-            if check_password(stored_password_hash, password):
-                st.success(f"Welcome {role} {username}!")
-                if role == "Student":
-                    # Store student_id in session state for use in the student-landing page
-                    st.session_state.student_id = username
-                    
+            # Check if password is correct (bcrypt runs on the rate-limited auth pool)
+            collection = teacher_collection if role == "Teacher" else student_collection
+            try:
+                valid = session_auth.check_password(collection, user, password)
+            except session_auth.LoginError as e:
+                st.error(str(e))
             else:
-                st.error("Invalid username or password.")
+                if valid:
+                    session_auth.start_session({
+                        "username": username,
+                        "name": user.get("full_name", username),
+                        "role": role,
+                        "course_ids": get_course_ids(user, role),
+                    })
+                    st.success(f"Welcome {role} {username}!")
+                    if role == "Student":
+                        # Store student_id in session state for use in the student-landing page
+                        st.session_state.student_id = username
+                else:
+                    st.error("Invalid username or password.")
         else:
             st.error("User not found.")
     else:
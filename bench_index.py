@@ -0,0 +1,178 @@
+"""Recall vs latency of each FAISS index type against the flat baseline.
+
+Every configuration is built the way index_cache builds it (a flat index
+converted with convert_index), written to disk and opened memory-mapped,
+then searched one query at a time like the quiz pages do. For each one
+the report shows the build time, file size, per-query latency (p50/p95)
+and recall@k: the share of the exact (flat) top k that it also returns.
+IVF is measured at each --nprobe and HNSW at each --ef-search, which
+gives the recall/latency trade-off of those settings.
+
+Vectors are synthetic clusters (roughly how chunks of a course's
+documents group by topic), or the chunks of a generated PDF embedded
+with the local hashed backend:
+
+    python bench_index.py --vectors 20000 100000 --dim 384
+    python bench_index.py --pdf-pages 1000 --output index_report.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+import index_cache
+
+CONFIGS = [
+    ("flat", "fp16"),
+    ("flat", "pq"),
+    ("ivf", "none"),
+    ("ivf", "fp16"),
+    ("ivf", "pq"),
+    ("hnsw", "none"),
+    ("hnsw", "fp16"),
+]
+
+
+def clustered_vectors(n, dim, seed=0, points_per_cluster=200):
+    """L2-normalized points around n / points_per_cluster random centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // points_per_cluster), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def pdf_vectors(pages, queries):
+    """(chunk vectors, query vectors) of a generated PDF, with the hashed backend."""
+    import bench_pipeline
+    import embedding_backends
+    import pdf_extract
+
+    embeddings = embedding_backends.HashedNgramEmbeddings()
+    pdf_bytes = bench_pipeline.generate_pdf(pages)
+    vector_store = index_cache.build_index(
+        pdf_extract.iter_pdf_pages(pdf_bytes, "bench.pdf"), embeddings, index_type="flat", compression="none"
+    )
+    vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+    query_vectors = np.array(
+        embeddings.embed_documents([f"key concepts of chapter {i % 100 + 1} term{i}" for i in range(queries)]),
+        dtype=np.float32,
+    )
+    return vectors, query_vectors
+
+
+def search_all(index, queries, k):
+    """(ids of the top k per query, per-query latencies in ms), one query per search call."""
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    return np.array(ids), np.array(latencies)
+
+
+def recall(found, exact, k):
+    return float(np.mean([len(set(a[:k]) & set(b[:k])) / k for a, b in zip(found, exact)]))
+
+
+def measure(index, queries, exact, ks):
+    search_all(index, queries, max(ks))  # Warm-up: fault the memory-mapped pages in, as a serving process would have
+    found, latencies = search_all(index, queries, max(ks))
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        **{f"recall@{k}": round(recall(found, exact, k), 3) for k in ks},
+    }
+
+
+def open_mmapped(index, directory, name):
+    """Write an index and open it memory-mapped, as load_index does. Returns (index, file size in bytes)."""
+    path = os.path.join(directory, f"{name}.faiss")
+    faiss.write_index(index, path)
+    mapped = faiss.read_index(path, index_cache.MMAP_FLAGS)
+    return mapped, os.path.getsize(path)
+
+
+def run(vectors, queries, ks, nprobes, ef_searches, directory, configs=CONFIGS):
+    dim = vectors.shape[1]
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(vectors)
+    flat, size = open_mmapped(flat, directory, "flat")
+    exact, _ = search_all(flat, queries, max(ks))
+    rows = [{
+        "spec": "Flat", "setting": "", "build_s": 0.0, "size_mb": round(size / 2 ** 20, 2),
+        **measure(flat, queries, exact, ks),
+    }]
+
+    for index_type, compression in configs:
+        spec = index_cache.index_spec(len(vectors), dim, index_type, compression)
+        if spec in {row["spec"] for row in rows}:
+            continue  # e.g. PQ fell back to fp16 for a small corpus
+        start = time.perf_counter()
+        built = index_cache.convert_index(flat, index_type, compression)
+        build_seconds = time.perf_counter() - start
+        index, size = open_mmapped(built, directory, f"{index_type}_{compression}")
+        common = {"spec": spec, "build_s": round(build_seconds, 3), "size_mb": round(size / 2 ** 20, 2)}
+
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            settings = [(f"nprobe={nprobe}", lambda nprobe=nprobe: setattr(ivf, "nprobe", nprobe)) for nprobe in nprobes]
+        elif hasattr(index, "hnsw"):
+            settings = [(f"efSearch={ef}", lambda ef=ef: setattr(index.hnsw, "efSearch", ef)) for ef in ef_searches]
+        else:
+            settings = [("", lambda: None)]
+        for setting, apply in settings:
+            apply()
+            rows.append({**common, "setting": setting, **measure(index, queries, exact, ks)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of FAISS index types against the flat index.")
+    parser.add_argument("--vectors", type=int, nargs="+", default=[20000, 100000], help="Synthetic corpus sizes")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--pdf-pages", type=int, help="Use the chunks of a generated PDF instead of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 20], help="Recall cut-offs (4 per call, 20 for MMR)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument(
+        "--configs", nargs="+", default=[f"{t}:{c}" for t, c in CONFIGS],
+        help="Index types to compare as type:compression (PQ training is slow on large corpora)",
+    )
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+    configs = [tuple(config.split(":", 1)) for config in args.configs]
+
+    if args.pdf_pages:
+        datasets = {f"pdf-{args.pdf_pages}": pdf_vectors(args.pdf_pages, args.queries)}
+    else:
+        datasets = {
+            str(n): (clustered_vectors(n, args.dim), clustered_vectors(args.queries, args.dim, seed=n))
+            for n in args.vectors
+        }
+
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (vectors, queries) in datasets.items():
+            report[name] = run(vectors, queries, args.k, args.nprobe, args.ef_search, directory, configs)
+
+    recall_columns = [f"recall@{k}" for k in args.k]
+    print(f"{'vectors':>9} {'index':<18}{'setting':<14}{'build s':>9}{'MB':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          + "".join(f"{column:>11}" for column in recall_columns))
+    for name, rows in report.items():
+        for row in rows:
+            print(f"{name:>9} {row['spec']:<18}{row['setting']:<14}{row['build_s']:>9}{row['size_mb']:>9}"
+                  f"{row['p50_ms']:>9}{row['p95_ms']:>9}" + "".join(f"{row[column]:>11}" for column in recall_columns))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Micro-benchmarks for each stage of the RAG quiz pipeline.
+
+Runs PDF extraction, splitting (1000/200), embedding, FAISS indexing,
+retrieval, the LLM call and JSON parsing on generated PDFs of 10, 100 and
+1,000 pages. Embeddings use the local hashed backend (embedding_backends.py)
+and the LLM is a canned response, so results depend only on this machine and
+the code. build_index (the streaming split + embed + index path the pages
+use) is measured too.
+
+For each stage the best of --repeat runs is reported, with the peak
+Python heap allocation (tracemalloc, one extra run) and the number of
+items it produced (pages, chunks, vectors, ...). With --baseline the run
+fails (exit code 1) when a stage is slower or allocates more than the
+baseline allows:
+
+    python bench_pipeline.py --output bench.json
+    python bench_pipeline.py --save-baseline bench_baseline.json
+    python bench_pipeline.py --baseline bench_baseline.json --tolerance 0.25
+
+The committed bench_baseline.json was recorded with the defaults on a
+single-CPU Linux machine. Timings depend on the hardware, so save a new
+baseline on the machine that runs the check before relying on it.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import FAISS
+
+import embedding_backends
+import index_cache
+import pdf_extract
+import quiz_gen
+import quiz_schema
+
+# Slowdowns smaller than this many seconds are noise, not regressions
+MIN_REGRESSION_SECONDS = 0.02
+QUERIES = [f"key concepts of chapter {i}" for i in range(1, 11)]
+NUM_QUESTIONS = 10
+
+
+class CannedLLM:
+    """Returns the same valid quiz JSON for every prompt."""
+
+    model_name = "bench-canned"
+
+    def __init__(self, num_questions=NUM_QUESTIONS):
+        self.response = json.dumps({"questions": [
+            {
+                "question_id": i,
+                "question": f"Which statement about topic {i} is correct?",
+                "options": [{"option_text": f"Statement {j}", "is_correct": j == 0} for j in range(4)],
+            }
+            for i in range(1, num_questions + 1)
+        ]}, indent=2)
+
+    def invoke(self, prompt):
+        class Message:
+            content = self.response
+        return Message()
+
+
+def generate_pdf(pages, seed=0):
+    """A PDF of pages filled with deterministic pseudo-text (about 2,500 characters per page)."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(2000)] + ["the", "of", "and", "a", "in", "is", "to"]
+    doc = fitz.open()
+    for page_number in range(pages):
+        text = f"Chapter {page_number // 10 + 1}, page {page_number + 1}.\n" + " ".join(rng.choices(vocabulary, k=380))
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 40, 570, 800), text, fontsize=8)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
+def _count(result):
+    """Items a stage produced (pages, chunks, vectors, questions), or None for raw LLM text."""
+    if isinstance(result, FAISS):
+        return result.index.ntotal
+    if isinstance(result, dict):
+        return len(result.get("questions", []))
+    if isinstance(result, str):
+        return None
+    return len(result)
+
+
+def measure(stage, repeat):
+    """Best time of repeat runs, then peak traced allocation of one more. Returns (result, metrics)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics = {"seconds": round(best, 4), "peak_kb": round(peak / 1024, 1)}
+    count = _count(result)
+    if count is not None:
+        metrics["count"] = count
+    return result, metrics
+
+
+def run_pipeline(pdf_bytes, repeat):
+    embeddings = embedding_backends.HashedNgramEmbeddings()
+    llm = CannedLLM()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=index_cache.CHUNK_SIZE, chunk_overlap=index_cache.CHUNK_OVERLAP)
+    results = {}
+
+    pages, results["extract"] = measure(lambda: list(pdf_extract.iter_pdf_pages(pdf_bytes, "bench.pdf")), repeat)
+    chunks, results["split"] = measure(lambda: splitter.split_documents(pages), repeat)
+    texts = [chunk.page_content for chunk in chunks]
+    vectors, results["embed"] = measure(lambda: embeddings.embed_documents(texts), repeat)
+    vector_store, results["index"] = measure(
+        lambda: FAISS.from_embeddings(
+            list(zip(texts, vectors)), embeddings, metadatas=[chunk.metadata for chunk in chunks]
+        ),
+        repeat,
+    )
+    docs, results["retrieve"] = measure(
+        lambda: [
+            doc
+            for query in QUERIES
+            for doc in vector_store.max_marginal_relevance_search(query, k=quiz_gen.CHUNKS_PER_CALL, fetch_k=20)
+        ],
+        repeat,
+    )
+    prompt = quiz_gen.questions_prompt(quiz_gen.format_docs(docs[:quiz_gen.CHUNKS_PER_CALL]), NUM_QUESTIONS, "Benchmark", 1, 1)
+    text, results["llm"] = measure(lambda: llm.invoke(prompt).content, repeat)
+    _, results["parse"] = measure(lambda: quiz_schema.extract_json(text), repeat)
+    _, results["build_index"] = measure(lambda: index_cache.build_index(pages, embeddings), repeat)
+    return results
+
+
+def regressions(report, baseline, tolerance, min_seconds=MIN_REGRESSION_SECONDS):
+    """(size, stage, metric, baseline value, new value) for every metric past the baseline."""
+    found = []
+    for size, stages in report["sizes"].items():
+        for stage, metrics in stages.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(stage)
+            if not base:
+                continue
+            if (
+                metrics["seconds"] > base["seconds"] * (1 + tolerance)
+                and metrics["seconds"] - base["seconds"] > min_seconds
+            ):
+                found.append((size, stage, "seconds", base["seconds"], metrics["seconds"]))
+            if metrics["peak_kb"] > base["peak_kb"] * (1 + tolerance):
+                found.append((size, stage, "peak_kb", base["peak_kb"], metrics["peak_kb"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the RAG quiz pipeline.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Fail if a stage regresses past this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown/growth over the baseline")
+    parser.add_argument("--min-seconds", type=float, default=MIN_REGRESSION_SECONDS, help="Ignore smaller slowdowns")
+    parser.add_argument("--save-baseline", help="Write the results as a new baseline")
+    args = parser.parse_args()
+
+    report = {"pdf_workers": pdf_extract.PDF_WORKERS, "repeat": args.repeat, "sizes": {}}
+    for pages in args.pages:
+        report["sizes"][str(pages)] = run_pipeline(generate_pdf(pages), args.repeat)
+
+    print(f"{'pages':>6} {'stage':<12}{'seconds':>10}{'peak KB':>12}{'count':>8}")
+    for size, stages in report["sizes"].items():
+        for stage, metrics in stages.items():
+            print(f"{size:>6} {stage:<12}{metrics['seconds']:>10}{metrics['peak_kb']:>12}{metrics.get('count', '-'):>8}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance, args.min_seconds)
+        for size, stage, metric, before, after in found:
+            print(f"REGRESSION {size} pages, {stage}: {metric} {before} -> {after}")
+        if found:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Process-level cache of the course catalog (course_id -> course_name, db_name, storage).
+
+Course details almost never change, so pages look them up here instead
+of querying quiz-db.courses on every rerun. Cache misses are fetched in a
+single $in query, and unknown IDs are never cached, so a course created
+by another process is found on its first lookup.
+"""
+import os
+import threading
+import time
+
+# How long a cached course entry is trusted (override in the .env file)
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", "300"))
+
+_lock = threading.Lock()
+_cache = {}  # course_id -> (entry, fetched_at)
+
+
+def get_courses(courses_collection, course_ids):
+    """Return {course_id: {"course_id", "course_name", "db_name", "storage"}} for the course IDs that exist.
+
+    Entries can be passed to course_store.get_collection.
+    """
+    now = time.time()
+    found, missing = {}, []
+    with _lock:
+        for course_id in course_ids:
+            cached = _cache.get(course_id)
+            if cached and now - cached[1] < CATALOG_TTL_SECONDS:
+                found[course_id] = cached[0]
+            else:
+                missing.append(course_id)
+
+    if missing:
+        projection = {"_id": 0, "course_id": 1, "course_name": 1, "db_name": 1, "storage": 1}
+        fetched = {
+            course["course_id"]: {
+                "course_id": course["course_id"],
+                "course_name": course["course_name"],
+                "db_name": course.get("db_name"),
+                "storage": course.get("storage", "per_course"),
+            }
+            for course in courses_collection.find({"course_id": {"$in": missing}}, projection)
+        }
+        with _lock:
+            for course_id, entry in fetched.items():
+                _cache[course_id] = (entry, now)
+        found.update(fetched)
+    return found
+
+
+def get_course(courses_collection, course_id):
+    """Catalog entry for one course, or None if it doesn't exist."""
+    return get_courses(courses_collection, [course_id]).get(course_id)
+
+
+def invalidate(course_id=None):
+    """Drop one course (or the whole catalog) from the cache, e.g. after a course is created or changed."""
+    with _lock:
+        if course_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(course_id, None)
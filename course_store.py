@@ -0,0 +1,303 @@
+"""Data-access layer for per-course data (quizzes, test scores, enrollments, quiz statistics).
+
+Courses are stored in one of two ways:
+
+- "per_course" (the original layout): each course has its own database,
+  named after the course, with quiz, test_scores, enroll_stud and
+  quiz_stats collections.
+- "shared": all courses share the quizzes, test_scores, enrollments and
+  quiz_stats collections in quiz-db, partitioned by course_id. This avoids
+  a database (and its WiredTiger files) per course, and names can't collide.
+
+STORAGE_MODE decides where new courses go; each course document records
+its own layout in its "storage" field, so both kinds can coexist while
+existing courses are moved over. Pages always go through get_collection
+and use the per-course collection names; in shared mode the returned
+collection adds the course_id to every filter and every written document.
+
+Move per-course databases into the shared collections with:
+    python course_store.py migrate [--batch-size N] [--drop] [course_id ...]
+
+Other processes keep writing to the old database until their cached
+course entry expires, so --drop waits MIGRATION_DRAIN_SECONDS after the
+switch and copies once more before dropping anything.
+"""
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import course_catalog
+import db_indexes
+
+# Where new courses are stored: "per_course" or "shared" (override in the .env file)
+STORAGE_MODE = os.getenv("STORAGE_MODE", "per_course")
+# Documents copied per insert_many when migrating a course
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+# Wait after switching a course before the final copy and drop: longer than any
+# cached course entry (course catalog, per-session query cache) is trusted
+MIGRATION_DRAIN_SECONDS = float(
+    os.getenv("MIGRATION_DRAIN_SECONDS", str(course_catalog.CATALOG_TTL_SECONDS + 60))
+)
+
+SHARED_DB = "quiz-db"
+# Per-course collection name -> shared collection name
+SHARED_COLLECTIONS = {
+    "quiz": "quizzes",
+    "test_scores": "test_scores",
+    "enroll_stud": "enrollments",
+    "quiz_stats": "quiz_stats",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class CourseCollection:
+    """One course's slice of a shared collection.
+
+    Mirrors the pymongo Collection methods the app uses; filters are scoped
+    to the course and inserted or replacing documents get its course_id.
+    """
+
+    def __init__(self, collection, course_id):
+        self.collection = collection
+        self.course_id = course_id
+
+    @property
+    def name(self):
+        return self.collection.name
+
+    def _scope(self, filter=None):
+        return {**(filter or {}), "course_id": self.course_id}
+
+    def _tag(self, document):
+        return {**document, "course_id": self.course_id}
+
+    def find(self, filter=None, *args, **kwargs):
+        return self.collection.find(self._scope(filter), *args, **kwargs)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        return self.collection.find_one(self._scope(filter), *args, **kwargs)
+
+    def count_documents(self, filter=None, **kwargs):
+        return self.collection.count_documents(self._scope(filter), **kwargs)
+
+    def distinct(self, key, filter=None, **kwargs):
+        return self.collection.distinct(key, self._scope(filter), **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        return self.collection.aggregate([{"$match": {"course_id": self.course_id}}] + list(pipeline), **kwargs)
+
+    def insert_one(self, document, **kwargs):
+        document["course_id"] = self.course_id  # Like pymongo, which adds _id to the caller's document
+        return self.collection.insert_one(document, **kwargs)
+
+    def insert_many(self, documents, **kwargs):
+        documents = list(documents)
+        for document in documents:
+            document["course_id"] = self.course_id
+        return self.collection.insert_many(documents, **kwargs)
+
+    def replace_one(self, filter, replacement, **kwargs):
+        return self.collection.replace_one(self._scope(filter), self._tag(replacement), **kwargs)
+
+    # Upserts copy the course_id from the filter into the new document
+    def update_one(self, filter, update, **kwargs):
+        return self.collection.update_one(self._scope(filter), update, **kwargs)
+
+    def update_many(self, filter, update, **kwargs):
+        return self.collection.update_many(self._scope(filter), update, **kwargs)
+
+    def find_one_and_update(self, filter, update, **kwargs):
+        return self.collection.find_one_and_update(self._scope(filter), update, **kwargs)
+
+    def delete_one(self, filter, **kwargs):
+        return self.collection.delete_one(self._scope(filter), **kwargs)
+
+    def delete_many(self, filter, **kwargs):
+        return self.collection.delete_many(self._scope(filter), **kwargs)
+
+    def bulk_write(self, requests, **kwargs):
+        """Supports the UpdateOne requests grading.save_scores sends."""
+        scoped = []
+        for request in requests:
+            if not isinstance(request, UpdateOne):
+                raise TypeError(f"Unsupported bulk write request: {type(request).__name__}")
+            scoped.append(UpdateOne(self._scope(request._filter), request._doc, upsert=request._upsert))
+        return self.collection.bulk_write(scoped, **kwargs)
+
+
+def is_shared(course):
+    return course.get("storage") == "shared"
+
+
+def get_collection(client, course, name):
+    """A course's collection by its per-course name ("quiz", "test_scores", "enroll_stud" or "quiz_stats").
+
+    course is the course document (or catalog entry) with course_id, db_name and storage.
+    """
+    if is_shared(course):
+        return CourseCollection(client[SHARED_DB][SHARED_COLLECTIONS[name]], course["course_id"])
+    return client[course["db_name"]][name]
+
+
+def find_course(courses_collection, name):
+    """Course document whose ID, name or database name is the given name, or None."""
+    return courses_collection.find_one({"$or": [{"course_id": name}, {"course_name": name}, {"db_name": name}]})
+
+
+def create_course(client, courses_collection, course_id, course_name, creator_name, mode=None):
+    """Create a course in the given storage mode (STORAGE_MODE by default) and return its document.
+
+    Raises DuplicateKeyError if the course ID is taken.
+    """
+    mode = mode or STORAGE_MODE
+    course = {"course_id": course_id, "course_name": course_name, "creator_name": creator_name, "storage": mode}
+    if mode != "shared":
+        # Sanitize database name (replace special characters with underscores)
+        db_name = re.sub(r"[^a-zA-Z0-9_]", "_", course_name.lower())
+        if courses_collection.find_one({"db_name": db_name}, {"_id": 1}):
+            # Another course has the same name, don't share its database
+            db_name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{course_name}_{course_id}".lower())
+        course["db_name"] = db_name
+    courses_collection.insert_one(course)
+    course_catalog.invalidate(course_id)
+
+    if mode != "shared":
+        db_indexes.ensure_course_indexes(client[course["db_name"]])  # Creates the course's collections with their indexes
+    return course
+
+
+def _course_filter(course_id):
+    """Documents of a per-course collection that belong to the course (older ones have no course_id)."""
+    return {"course_id": {"$in": [course_id, None]}}
+
+
+def _copy_collection(source, target, course_id, batch_size):
+    """Copy the course's documents of source into target with the course_id added. Returns (copied, skipped).
+
+    Documents keep their _id, so copying again only adds what is new.
+    """
+    copied = skipped = 0
+
+    def flush(batch):
+        nonlocal copied, skipped
+        try:
+            copied += len(target.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            copied += e.details["nInserted"]
+            skipped += len(errors)
+
+    batch = []
+    for document in source.find(_course_filter(course_id)).sort("_id", 1).batch_size(batch_size):
+        document["course_id"] = course_id
+        batch.append(document)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return copied, skipped
+
+
+def migrate_course(client, course, batch_size=MIGRATION_BATCH_SIZE, drop=False, drain_seconds=MIGRATION_DRAIN_SECONDS):
+    """Move a per-course database into the shared collections.
+
+    Data is copied, the course is switched to shared storage, then copied
+    once more to pick up writes made during the first pass. With drop=True
+    it waits until drain_seconds have passed since the switch (so no
+    process still writes to the old database), copies a last time and
+    drops the old database if every document made it across.
+    Raises ValueError if another course uses the same database.
+    Returns {collection name: (copied, skipped)}.
+    """
+    courses = client[SHARED_DB]["courses"]
+    other = courses.find_one({"db_name": course["db_name"], "_id": {"$ne": course["_id"]}}, {"course_id": 1})
+    if other is not None:
+        raise ValueError(
+            f"Database {course['db_name']} is also used by course {other['course_id']}, migrate it by hand"
+        )
+
+    source_db = client[course["db_name"]]
+    shared_db = client[SHARED_DB]
+
+    def copy_all(results):
+        for name, shared_name in SHARED_COLLECTIONS.items():
+            copied, skipped = _copy_collection(source_db[name], shared_db[shared_name], course["course_id"], batch_size)
+            before = results.get(name, (0, 0))
+            results[name] = (before[0] + copied, before[1] + skipped)
+        return results
+
+    results = copy_all({})
+    # $min keeps the time of the first switch when a course is migrated again
+    switched = courses.find_one_and_update(
+        {"_id": course["_id"]},
+        {"$set": {"storage": "shared"}, "$min": {"storage_switched_at": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    course_catalog.invalidate(course["course_id"])
+    copy_all(results)
+
+    if drop:
+        switched_at = switched["storage_switched_at"]
+        if switched_at.tzinfo is None:
+            switched_at = switched_at.replace(tzinfo=timezone.utc)
+        wait = drain_seconds - (datetime.now(timezone.utc) - switched_at).total_seconds()
+        if wait > 0:
+            logger.info("Waiting %.0fs for cached entries of %s to expire before dropping", wait, course["course_id"])
+            time.sleep(wait)
+        copy_all(results)
+
+        shared_course = {**course, "storage": "shared"}
+        complete = all(
+            get_collection(client, shared_course, name).count_documents({})
+            >= source_db[name].count_documents(_course_filter(course["course_id"]))
+            for name in SHARED_COLLECTIONS
+        )
+        if complete:
+            client.drop_database(course["db_name"])
+            courses.update_one({"_id": course["_id"]}, {"$unset": {"db_name": ""}})
+        else:
+            logger.warning("Not dropping %s: some documents were not copied", course["db_name"])
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move per-course databases into the shared collections.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("course_ids", nargs="*", help="Courses to migrate (default: every per-course course)")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--drop", action="store_true", help="Drop each old database once it is copied")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    import resources
+
+    client = resources.get_mongo_client()
+    db_indexes.migrate(client)  # The shared collections' indexes must exist before copying
+    courses = client[SHARED_DB]["courses"]
+    if args.course_ids:
+        # Named courses are copied again even if already shared, to catch up late writes
+        selected = list(courses.find({"course_id": {"$in": args.course_ids}, "db_name": {"$exists": True}}))
+    else:
+        selected = list(courses.find({"storage": {"$ne": "shared"}, "db_name": {"$exists": True}}))
+
+    for course in selected:
+        try:
+            results = migrate_course(client, course, args.batch_size, args.drop)
+        except ValueError as e:
+            print(f"{course['course_id']}: skipped, {e}")
+            continue
+        summary = ", ".join(f"{name} {copied} copied/{skipped} skipped" for name, (copied, skipped) in results.items())
+        print(f"{course['course_id']}: {summary}")
+    if not selected:
+        print("No per-course databases to migrate.")
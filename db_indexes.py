@@ -0,0 +1,217 @@
+"""Index bootstrap and schema migrations for every collection the app queries.
+
+Migrations are numbered and the last applied version is stored in
+quiz-db.schema_migrations, so running them again is cheap. They run once
+per process when the shared MongoClient is created, and can be run or
+checked from the command line:
+
+    python db_indexes.py migrate   # apply pending migrations
+    python db_indexes.py check     # report missing indexes (and duplicates blocking unique ones)
+"""
+import logging
+import os
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+# Quiz generation metrics (see metrics.py) expire after this many days (override in the .env file).
+# A changed value is applied to the existing TTL index the next time migrate() runs.
+METRICS_RETENTION_DAYS = int(os.getenv("METRICS_RETENTION_DAYS", "90"))
+
+# Indexes on the shared databases: (database, collection) -> indexes
+GLOBAL_INDEXES = {
+    ("quiz-db", "teacher_meta"): [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    ("quiz-db", "student_meta"): [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    ("quiz-db", "courses"): [
+        IndexModel([("course_id", ASCENDING)], unique=True, name="course_id_unique"),
+        IndexModel([("creator_name", ASCENDING)], name="creator_name"),
+    ],
+    ("quiz-db", "quiz_jobs"): [
+        IndexModel([("teacher_name", ASCENDING), ("created_at", DESCENDING)], name="teacher_recent"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        # Set only while a job is unfinished, so an identical submission can't queue it twice
+        IndexModel([("active_key", ASCENDING)], unique=True, sparse=True, name="active_key_unique"),
+    ],
+    ("quiz-db", "metrics"): [
+        IndexModel(
+            [("started_at", DESCENDING)], expireAfterSeconds=METRICS_RETENTION_DAYS * 86400, name="started_at_ttl"
+        ),
+        IndexModel([("teacher", ASCENDING), ("started_at", DESCENDING)], name="teacher_recent"),
+    ],
+    ("master_db", "students"): [
+        IndexModel([("student_id", ASCENDING)], unique=True, name="student_id_unique"),
+        IndexModel([("enrolled_courses", ASCENDING)], name="enrolled_courses"),
+    ],
+}
+
+# Indexes in every per-course database: collection -> indexes
+COURSE_INDEXES = {
+    "quiz": [
+        IndexModel([("quiz_id", ASCENDING), ("student_id", ASCENDING)], name="quiz_student"),
+    ],
+    "test_scores": [
+        IndexModel([("quiz_id", ASCENDING), ("student_id", ASCENDING)], unique=True, name="quiz_student_unique"),
+        IndexModel([("quiz_id", ASCENDING), ("score", DESCENDING)], name="quiz_score"),
+    ],
+    "quiz_stats": [
+        IndexModel([("quiz_id", ASCENDING)], unique=True, name="quiz_id_unique"),
+    ],
+    "enroll_stud": [
+        IndexModel([("student_id", ASCENDING)], unique=True, name="student_id_unique"),
+    ],
+}
+
+# Collections shared by all courses in shared storage mode (see course_store.py), in quiz-db
+SHARED_INDEXES = {
+    "quizzes": [
+        IndexModel([("course_id", ASCENDING), ("quiz_id", ASCENDING), ("student_id", ASCENDING)], name="course_quiz_student"),
+    ],
+    "test_scores": [
+        IndexModel(
+            [("course_id", ASCENDING), ("quiz_id", ASCENDING), ("student_id", ASCENDING)],
+            unique=True, name="course_quiz_student_unique",
+        ),
+        IndexModel([("course_id", ASCENDING), ("quiz_id", ASCENDING), ("score", DESCENDING)], name="course_quiz_score"),
+    ],
+    "quiz_stats": [
+        IndexModel([("course_id", ASCENDING), ("quiz_id", ASCENDING)], unique=True, name="course_quiz_unique"),
+    ],
+    "enrollments": [
+        IndexModel([("course_id", ASCENDING), ("student_id", ASCENDING)], unique=True, name="course_student_unique"),
+        IndexModel([("student_id", ASCENDING)], name="student_id"),
+    ],
+}
+
+
+def course_db_names(client):
+    """Databases of the courses still stored one database per course."""
+    courses = client["quiz-db"]["courses"].find(
+        {"storage": {"$ne": "shared"}, "db_name": {"$exists": True}}, {"_id": 0, "db_name": 1}
+    )
+    return [course["db_name"] for course in courses if course.get("db_name")]
+
+
+def ensure_global_indexes(client):
+    for (db_name, collection_name), indexes in GLOBAL_INDEXES.items():
+        client[db_name][collection_name].create_indexes(indexes)
+
+
+def ensure_course_indexes(course_db):
+    """Create the per-course indexes; called when a course database is created."""
+    for collection_name, indexes in COURSE_INDEXES.items():
+        course_db[collection_name].create_indexes(indexes)
+
+
+def _migration_1(client):
+    ensure_global_indexes(client)
+    for db_name in course_db_names(client):
+        ensure_course_indexes(client[db_name])
+
+
+def _migration_2(client):
+    for collection_name, indexes in SHARED_INDEXES.items():
+        client["quiz-db"][collection_name].create_indexes(indexes)
+
+
+def _migration_3(client):
+    client["quiz-db"]["metrics"].create_indexes(GLOBAL_INDEXES[("quiz-db", "metrics")])
+
+
+def _migration_4(client):
+    client["quiz-db"]["quiz_jobs"].create_indexes(GLOBAL_INDEXES[("quiz-db", "quiz_jobs")])
+
+
+def _migration_5(client):
+    client["quiz-db"]["metrics"].create_indexes(GLOBAL_INDEXES[("quiz-db", "metrics")])
+
+
+# Append new migrations here, never change or reorder existing ones
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5]
+
+
+def apply_metrics_retention(client):
+    """Update the metrics TTL index to METRICS_RETENTION_DAYS if it was created with another value.
+
+    create_indexes keeps an existing index's expireAfterSeconds, so the new
+    value is applied with collMod. Returns True if the index was changed.
+    """
+    expire = METRICS_RETENTION_DAYS * 86400
+    index = client["quiz-db"]["metrics"].index_information().get("started_at_ttl")
+    if index is None or index.get("expireAfterSeconds") == expire:
+        return False
+    logger.info("Setting the metrics retention to %d days", METRICS_RETENTION_DAYS)
+    client["quiz-db"].command("collMod", "metrics", index={"name": "started_at_ttl", "expireAfterSeconds": expire})
+    return True
+
+
+def migrate(client):
+    """Apply pending migrations and the current metrics retention. Returns the schema version afterwards."""
+    versions = client["quiz-db"]["schema_migrations"]
+    current = (versions.find_one({"_id": "schema"}) or {}).get("version", 0)
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        logger.info("Applying schema migration %d", version)
+        migration(client)
+        versions.update_one({"_id": "schema"}, {"$set": {"version": version}}, upsert=True)
+        current = version
+    apply_metrics_retention(client)
+    return current
+
+
+def missing_indexes(client):
+    """List (database, collection, IndexModel) for every expected index that doesn't exist."""
+    expected = [(db_name, collection_name, indexes) for (db_name, collection_name), indexes in GLOBAL_INDEXES.items()]
+    expected += [("quiz-db", collection_name, indexes) for collection_name, indexes in SHARED_INDEXES.items()]
+    for db_name in course_db_names(client):
+        expected += [(db_name, collection_name, indexes) for collection_name, indexes in COURSE_INDEXES.items()]
+
+    missing = []
+    for db_name, collection_name, indexes in expected:
+        existing = client[db_name][collection_name].index_information()
+        for index in indexes:
+            if index.document["name"] not in existing:
+                missing.append((db_name, collection_name, index))
+    return missing
+
+
+def duplicate_keys(collection, index, limit=5):
+    """Key values that occur more than once and would block a unique index, as ({field: value}, count), most first."""
+    fields = [field for field, _ in index.document["key"].items()]
+    pipeline = []
+    if index.document.get("sparse"):
+        # A sparse index skips documents that have none of its fields
+        pipeline.append({"$match": {"$or": [{field: {"$exists": True}} for field in fields]}})
+    pipeline += [
+        {"$group": {"_id": {field: f"${field}" for field in fields}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    return [(group["_id"], group["count"]) for group in collection.aggregate(pipeline, allowDiskUse=True)]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    # Don't let the client migrate on its own, so "check" reports the current state
+    os.environ["MONGO_AUTO_MIGRATE"] = "0"
+    import resources
+
+    client = resources.get_mongo_client()
+    if command == "migrate":
+        print(f"Schema version: {migrate(client)}")
+    missing = missing_indexes(client)
+    for db_name, collection_name, index in missing:
+        print(f"Missing index: {db_name}.{collection_name} {index.document['name']}")
+        if index.document.get("unique"):
+            for key, count in duplicate_keys(client[db_name][collection_name], index):
+                print(f"  blocked by {count} documents with {key}")
+    if not missing:
+        print("All indexes present.")
+    sys.exit(1 if missing else 0)
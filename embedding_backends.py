@@ -0,0 +1,110 @@
+"""Embedding backends, selected with EMBEDDINGS_BACKEND.
+
+- "openai": OpenAIEmbeddings behind the chunk-level embedding cache
+  (one API round-trip per batch of new chunks).
+- "hashed": a local CPU backend. Each text becomes a signed feature-hashing
+  vector of its words, word bigrams and character trigrams, with sublinear
+  term frequencies, L2-normalized. Nothing leaves the machine and a batch
+  is embedded with one NumPy bincount, so large PDFs index in seconds and
+  the pipeline runs offline. Retrieval is lexical rather than semantic.
+
+Each backend has a distinct model name (embeddings.model), which is part
+of the index cache key and recorded with every saved index, so an index
+is never searched with vectors from another backend.
+"""
+import functools
+import os
+import re
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EMBED_BATCH_SIZE, CachedEmbeddings
+
+# Which backend embeds chunks and queries: "openai" or "hashed" (override in the .env file)
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai")
+# Vector size of the hashed backend
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))
+
+BACKENDS = ("openai", "hashed")
+
+_TOKEN = re.compile(r"\w+")
+CHAR_NGRAM = 3
+CHAR_NGRAM_WEIGHT = 0.5
+
+
+def _crc(feature):
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+@functools.lru_cache(maxsize=200_000)
+def _word_features(word):
+    """(feature hashes, weights) of a word: the word itself and its character n-grams."""
+    padded = f"<{word}>"
+    grams = [padded[i:i + CHAR_NGRAM] for i in range(max(1, len(padded) - CHAR_NGRAM + 1))]
+    hashes = np.array([_crc("w:" + word)] + [_crc("c:" + gram) for gram in grams], dtype=np.int64)
+    weights = np.full(len(hashes), CHAR_NGRAM_WEIGHT, dtype=np.float64)
+    weights[0] = 1.0
+    return hashes, weights
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """Local feature-hashing embeddings computed with NumPy in batches."""
+
+    def __init__(self, dim=LOCAL_EMBEDDING_DIM, batch_size=EMBED_BATCH_SIZE):
+        self.dim = dim
+        self.batch_size = batch_size
+        # Change the version when the features change, so old indexes are not reused
+        self.model = f"hashed-ngram-v1-{dim}"
+
+    def _text_features(self, text):
+        words = _TOKEN.findall(text.lower())
+        if not words:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        features = [_word_features(word) for word in words]
+        bigrams = np.array([_crc(f"b:{a} {b}") for a, b in zip(words, words[1:])], dtype=np.int64)
+        hashes = np.concatenate([h for h, _ in features] + [bigrams])
+        weights = np.concatenate([w for _, w in features] + [np.ones(len(bigrams))])
+        return hashes, weights
+
+    def _embed(self, texts):
+        """Embed a batch: all features are accumulated into the matrix with one bincount."""
+        rows, hashes, weights = [], [], []
+        for row, text in enumerate(texts):
+            text_hashes, text_weights = self._text_features(text)
+            rows.append(np.full(len(text_hashes), row, dtype=np.int64))
+            hashes.append(text_hashes)
+            weights.append(text_weights)
+        hashes = np.concatenate(hashes)
+        # The top hash bit picks the sign, so collisions tend to cancel out
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+        matrix = np.bincount(
+            np.concatenate(rows) * self.dim + hashes % self.dim,
+            weights=np.concatenate(weights) * signs,
+            minlength=len(texts) * self.dim,
+        ).reshape(len(texts), self.dim)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
+
+
+def create_embeddings(backend=None):
+    """Embeddings client for a backend (EMBEDDINGS_BACKEND by default)."""
+    backend = backend or EMBEDDINGS_BACKEND
+    if backend == "openai":
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        return CachedEmbeddings(OpenAIEmbeddings())
+    if backend == "hashed":
+        # Cheaper to recompute than to look up in the embedding cache
+        return HashedNgramEmbeddings()
+    raise ValueError(f"Unknown EMBEDDINGS_BACKEND {backend!r}, expected one of {', '.join(BACKENDS)}")
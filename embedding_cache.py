@@ -0,0 +1,231 @@
+"""Chunk-level embedding cache.
+
+Wraps an embeddings client so each chunk is only embedded once per model.
+Vectors are kept in an append-only float32 matrix that is memory-mapped on
+read, next to a key file holding one "text hash, row" line per vector.
+Rows are explicit, so a vector whose key was never written (a crash
+between the two writes, or a race without file locks) only wastes space
+instead of shifting every later key onto the wrong vector.
+
+One wrapper is shared by every session of the process, so hit/miss
+counts are collected per caller with track_stats() instead of on it.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows, fall back to the in-process lock only
+    fcntl = None
+
+# Cache location and batch size for embedding calls (override in the .env file)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+
+logger = logging.getLogger(__name__)
+
+_stats = contextvars.ContextVar("embedding_stats", default=None)
+
+
+@contextmanager
+def track_stats():
+    """Count the chunks reused from the cache ("hits") and embedded ("misses") by calls inside the block.
+
+    Counts are kept per context (Streamlit session thread), so concurrent sessions don't mix.
+    """
+    stats = {"hits": 0, "misses": 0}
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+def record_stats(hits, misses):
+    """Add to the counts of the enclosing track_stats() block, if any."""
+    stats = _stats.get()
+    if stats is not None:
+        stats["hits"] += hits
+        stats["misses"] += misses
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different chunks share an embedding."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Append-only matrix of vectors for a single embedding model."""
+
+    def __init__(self, path):
+        self.path = path
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.keys_path = os.path.join(path, "keys.txt")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock_path = os.path.join(path, ".lock")
+        self.dim = None
+        self.rows = {}
+        self._keys_offset = 0
+        self._legacy_rows = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """Pick up rows appended since the last read (possibly by another process)."""
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            new_keys = f.read()
+        # Only consume complete lines, a writer may be mid-append
+        complete = new_keys[: new_keys.rfind(b"\n") + 1]
+        self._keys_offset += len(complete)
+        for line in complete.decode("utf-8", "replace").splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                self.rows.setdefault(parts[0], int(parts[1]))
+            elif len(parts) == 1:
+                # Files written before rows were stored: the row is the line number
+                self.rows.setdefault(parts[0], self._legacy_rows)
+            self._legacy_rows += 1
+
+        # Rows are only valid once their vector has been written
+        n_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        if n_rows and (self._matrix is None or self._matrix.shape[0] != n_rows):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+
+    def lookup(self, keys):
+        """Return a dict of key -> vector for the keys already in the store."""
+        with self._lock:
+            self._refresh()
+            n_rows = 0 if self._matrix is None else self._matrix.shape[0]
+            found = {}
+            for key in keys:
+                row = self.rows.get(key)
+                if row is not None and row < n_rows:
+                    found[key] = self._matrix[row]
+            return found
+
+    def _write_vectors(self, data):
+        """Append whole rows of vector data and return the row number of the first one, or None."""
+        row_bytes = 4 * self.dim
+        fd = os.open(self.vectors_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            if fcntl:
+                # Holding the file lock: drop a partial row left by an interrupted write
+                size = os.fstat(fd).st_size
+                if size % row_bytes:
+                    os.ftruncate(fd, size - size % row_bytes)
+            # O_APPEND writes land at the end even if another process appends too
+            written = os.write(fd, data)
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+        finally:
+            os.close(fd)
+        start = end - written
+        if written != len(data) or start % row_bytes:
+            logger.warning("Embedding cache %s: unaligned write, not caching %d vectors", self.path, len(data) // row_bytes)
+            return None
+        return start // row_bytes
+
+    def append(self, keys, vectors):
+        """Append new vectors to the store."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            lock_file = open(self.lock_path, "w")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._refresh()
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                    with open(self.meta_path, "w") as f:
+                        json.dump({"dim": self.dim}, f)
+
+                # Skip keys another process added while we were embedding
+                new = [i for i, key in enumerate(keys) if key not in self.rows]
+                if not new:
+                    return
+                # Vectors first, then keys with their rows, so a key never points at a missing vector
+                first_row = self._write_vectors(vectors[new].tobytes())
+                if first_row is None:
+                    return
+                lines = "".join(f"{keys[i]} {first_row + n}\n" for n, i in enumerate(new))
+                with open(self.keys_path, "ab") as f:
+                    if f.tell() and not self._ends_with_newline():
+                        lines = "\n" + lines  # Don't glue onto a line torn by a crash
+                    f.write(lines.encode("utf-8"))
+                self._refresh()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _ends_with_newline(self):
+        with open(self.keys_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model, cache_dir=EMBEDDING_CACHE_DIR):
+    """One store per model per process."""
+    path = os.path.join(cache_dir, re.sub(r"[^a-zA-Z0-9_.-]", "_", model))
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path)
+        return _stores[path]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the wrapped client."""
+
+    def __init__(self, embeddings, cache_dir=EMBEDDING_CACHE_DIR, batch_size=EMBED_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.store = get_store(self.model, cache_dir)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        keys = [text_key(text) for text in texts]
+        found = self.store.lookup(set(keys))
+
+        # Embed each missing chunk once, in large batches
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = normalize_text(text)
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start:start + self.batch_size]
+            vectors = self.embeddings.embed_documents([missing[key] for key in batch_keys])
+            self.store.append(batch_keys, vectors)
+            found.update(zip(batch_keys, np.asarray(vectors, dtype=np.float32)))
+
+        record_stats(hits=len(texts) - len(missing_keys), misses=len(missing_keys))
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
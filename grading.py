@@ -0,0 +1,180 @@
+"""Vectorized grading of quiz submissions.
+
+A posted quiz is compiled into an answer key: the index of the correct
+option for each question, as a NumPy array. A batch of submissions becomes
+an (students x questions) matrix of chosen option indices (-1 for
+unanswered), and is graded with a single comparison against the keys, so
+grading a class costs one pass over a small integer matrix.
+
+Per-student variants (see quiz_variants.py) have their own question order
+and option order, so each student's row is compared with the key of their
+own variant; students without one use the shared quiz's key.
+
+Scores are percentages (0-100) and are written to test_scores with one
+bulk_write, with the quiz_stats document updated once per batch. Each row
+carries the write_id of the batch that last wrote it: a batch reads the
+rows it replaces, then writes each one only if its write_id is still the
+one it read. A row changed in between (a concurrent submission of the
+same student) fails that condition on the unique (quiz, student) index
+and is read and written again, so its stats delta is always taken from
+the score the write actually replaced.
+
+Time grading a synthetic class with:
+    python grading.py bench [students] [questions]
+"""
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import uuid
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import score_stats
+
+UNANSWERED = -1
+NO_QUESTION = -2  # Key padding for variants with fewer questions; never matches an answer
+# Rounds of re-reading rows changed by a concurrent batch before giving up
+SAVE_ATTEMPTS = 5
+
+
+def compile_key(quiz):
+    """Answer key of a quiz document: the correct option index of each question."""
+    return np.array(
+        [
+            next((i for i, option in enumerate(question.get("options", [])) if option.get("is_correct")), NO_QUESTION)
+            for question in quiz.get("questions", [])
+        ],
+        dtype=np.int16,
+    )
+
+
+def load_keys(quiz_collection, quiz_id):
+    """Answer keys of a posted quiz as {student_id: key}, with None for the shared quiz, in one query."""
+    projection = {"_id": 0, "student_id": 1, "questions.options.is_correct": 1}
+    return {quiz.get("student_id"): compile_key(quiz) for quiz in quiz_collection.find({"quiz_id": quiz_id}, projection)}
+
+
+def _padded(rows, width, fill):
+    if all(len(row) == width for row in rows):
+        return np.array(rows, dtype=np.int16).reshape(len(rows), width)
+    matrix = np.full((len(rows), width), fill, dtype=np.int16)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row[:width]
+    return matrix
+
+
+def grade_matrix(answers, keys):
+    """Grade an answer matrix against a key matrix of the same shape.
+
+    Returns (correct answers per row, questions per row) as integer arrays.
+    """
+    correct = np.count_nonzero(answers == keys, axis=1)
+    totals = np.count_nonzero(keys != NO_QUESTION, axis=1)
+    return correct, totals
+
+
+def grade(submissions, keys):
+    """Grade submissions ({"student_id", "answers": [option index or -1 per question]}).
+
+    keys is the dict returned by load_keys. Returns one {"student_id",
+    "score", "correct", "total"} per submission, in order; submissions of
+    students with no key are skipped.
+    """
+    submissions = [s for s in submissions if s["student_id"] in keys or None in keys]
+    if not submissions:
+        return []
+    student_keys = [keys.get(s["student_id"], keys.get(None)) for s in submissions]
+    width = max(len(key) for key in student_keys)
+
+    key_matrix = _padded([key.tolist() for key in student_keys], width, NO_QUESTION)
+    answer_matrix = _padded([list(s["answers"]) for s in submissions], width, UNANSWERED)
+    correct, totals = grade_matrix(answer_matrix, key_matrix)
+    scores = np.round(100.0 * correct / np.maximum(totals, 1), 2)
+
+    return [
+        {"student_id": s["student_id"], "score": float(score), "correct": int(c), "total": int(t)}
+        for s, score, c, t in zip(submissions, scores, correct, totals)
+    ]
+
+
+def _write_scores(scores_collection, quiz_id, results, write_id, now):
+    """One conditional bulk upsert of results. Returns (results written, scores they replaced, results to retry)."""
+    previous = {
+        row["student_id"]: row
+        for row in scores_collection.find(
+            {"quiz_id": quiz_id, "student_id": {"$in": [result["student_id"] for result in results]}},
+            {"_id": 0, "student_id": 1, "score": 1, "write_id": 1},
+        )
+    }
+    requests = [
+        UpdateOne(
+            # A missing write_id also matches rows written before rows had one, and absent rows (upsert)
+            {"quiz_id": quiz_id, "student_id": result["student_id"],
+             "write_id": previous.get(result["student_id"], {}).get("write_id")},
+            {"$set": {
+                "score": result["score"], "correct": result["correct"], "total": result["total"],
+                "submitted_at": now, "write_id": write_id,
+            }},
+            upsert=True,
+        )
+        for result in results
+    ]
+    try:
+        scores_collection.bulk_write(requests, ordered=False)
+        failed = set()
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        # The row changed since it was read, so the upsert tried to insert a second one
+        failed = {error["index"] for error in errors}
+
+    written = [result for i, result in enumerate(results) if i not in failed]
+    replaced = [
+        previous[result["student_id"]]["score"] for result in written if "score" in previous.get(result["student_id"], {})
+    ]
+    return written, replaced, [result for i, result in enumerate(results) if i in failed]
+
+
+def save_scores(scores_collection, stats_collection, quiz_id, results):
+    """Upsert graded results into test_scores with one bulk_write and update the quiz's statistics.
+
+    Only the last result of each student in the batch is kept. A resubmission
+    replaces the previous score, whose contribution is removed from quiz_stats.
+    Relies on the unique (quiz_id, student_id) index on test_scores.
+    """
+    pending = list({result["student_id"]: result for result in results}.values())
+    if not pending:
+        return
+    write_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    added, removed = [], []
+    for _ in range(SAVE_ATTEMPTS):
+        written, replaced, pending = _write_scores(scores_collection, quiz_id, pending, write_id, now)
+        added += [result["score"] for result in written]
+        removed += replaced
+        if not pending:
+            break
+    stats_collection.update_one({"quiz_id": quiz_id}, score_stats.stats_update(added, removed), upsert=True)
+    if pending:
+        raise RuntimeError(f"Scores of {len(pending)} student(s) kept changing while being saved, they were not written.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "bench":
+        sys.exit("Usage: python grading.py bench [students] [questions]")
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    questions = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    rng = np.random.default_rng(0)
+    keys = {None: rng.integers(0, 4, questions).astype(np.int16)}
+    submissions = [
+        {"student_id": f"s{i}", "answers": rng.integers(-1, 4, questions).tolist()} for i in range(students)
+    ]
+    start = time.process_time()
+    results = grade(submissions, keys)
+    elapsed = time.process_time() - start
+    print(f"Graded {len(results)} submissions x {questions} questions in {elapsed * 1000:.1f} ms CPU")
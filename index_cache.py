@@ -0,0 +1,297 @@
+"""On-disk cache of FAISS indexes built from uploaded PDFs.
+
+Indexes are keyed by a hash of the PDF bytes plus the splitter and
+embedding settings, so re-uploading the same document skips extraction
+and embedding and goes straight to retrieval. Each entry also records the
+embedding model that built it, and is only loaded with that model.
+
+Indexes are built flat while a document streams in, then rebuilt as
+FAISS_INDEX_TYPE (flat, IVF or HNSW) with optional fp16 or product
+quantization compression. Cached indexes are opened memory-mapped and
+read-only (IO_FLAG_MMAP_IFC, which maps the vector storage of every index
+type; IO_FLAG_MMAP alone only maps IVF inverted lists), so Streamlit
+worker processes share the page cache instead of each holding a copy. bench_index.py reports recall and latency of each
+type against the flat index.
+"""
+import hashlib
+import json
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+
+import faiss
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import FAISS
+
+import metrics
+
+# Cache location and size limit (override in the .env file)
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", ".index_cache")
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "2048"))
+
+# Splitter settings used by every quiz page
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Chunks embedded and added to the index per step while a document streams in
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+
+# Index type: "flat", "ivf", "hnsw" or "auto" (flat up to FAISS_FLAT_MAX_VECTORS, IVF above)
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+FAISS_FLAT_MAX_VECTORS = int(os.getenv("FAISS_FLAT_MAX_VECTORS", "20000"))
+# Vector compression: "none", "fp16" (half the memory) or "pq" (product quantization)
+FAISS_COMPRESSION = os.getenv("FAISS_COMPRESSION", "none")
+# Search breadth: IVF lists probed per query, HNSW candidate list size
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Open cached indexes memory-mapped (set to 0 to read them into memory)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") != "0"
+# Don't combine with IO_FLAG_MMAP: FAISS then fails to read IVF indexes
+MMAP_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+FAISS_HNSW_M = 32
+# PQ trains 256 centroids per sub-quantizer, FAISS wants 39 points per centroid
+PQ_MIN_VECTORS = 256 * 39
+
+_lock = threading.Lock()
+
+
+def embedding_model_name(embeddings):
+    """Name used to tell apart indexes built with different embedding models."""
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+def index_key(pdf_bytes, embeddings, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Content-addressed key for a PDF and the settings used to index it."""
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(f"|{chunk_size}|{chunk_overlap}|{embedding_model_name(embeddings)}".encode("utf-8"))
+    digest.update(f"|{FAISS_INDEX_TYPE}|{FAISS_COMPRESSION}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _pq_subquantizers(dim):
+    """Largest usual sub-quantizer count that divides dim (at least 4 dimensions each)."""
+    return next((m for m in (64, 48, 32, 24, 16, 8) if dim % m == 0 and dim // m >= 4), 1)
+
+
+def index_spec(n_vectors, dim, index_type=None, compression=None):
+    """faiss.index_factory string for an index of n_vectors vectors."""
+    index_type = index_type or FAISS_INDEX_TYPE
+    compression = compression or FAISS_COMPRESSION
+    if index_type == "auto":
+        index_type = "flat" if n_vectors <= FAISS_FLAT_MAX_VECTORS else "ivf"
+    if compression == "pq" and n_vectors < PQ_MIN_VECTORS:
+        compression = "fp16"  # Too few vectors to train the quantizer
+    codecs = {"none": "Flat", "fp16": "SQfp16", "pq": f"PQ{_pq_subquantizers(dim)}"}
+    if compression not in codecs:
+        raise ValueError(f"Unknown FAISS_COMPRESSION {compression!r}, expected one of {', '.join(codecs)}")
+    codec = codecs[compression]
+
+    if index_type == "flat":
+        return codec
+    if index_type == "ivf":
+        nlist = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+        return f"IVF{nlist},{codec}"
+    if index_type == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}" if codec == "Flat" else f"HNSW{FAISS_HNSW_M}_{codec}"
+    raise ValueError(f"Unknown FAISS_INDEX_TYPE {index_type!r}, expected flat, ivf, hnsw or auto")
+
+
+def convert_index(index, index_type=None, compression=None):
+    """Rebuild a flat index as the configured type. Vector ids, and so the docstore mapping, are kept."""
+    spec = index_spec(index.ntotal, index.d, index_type, compression)
+    if spec == "Flat":
+        return index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    converted = faiss.index_factory(index.d, spec, index.metric_type)
+    converted.train(vectors)
+    converted.add(vectors)
+    ivf = faiss.try_extract_index_ivf(converted)
+    if ivf is not None:
+        ivf.make_direct_map()  # MMR search reconstructs candidate vectors by id
+    tune_index(converted)
+    return converted
+
+
+def tune_index(index):
+    """Apply the search settings, which are not stored in the index file."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = FAISS_NPROBE
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+
+
+def _entry_path(key):
+    return os.path.join(INDEX_CACHE_DIR, key)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def load_index(key, embeddings):
+    """Load a cached index, or return None if it is not in the cache or was built with other embeddings."""
+    path = _entry_path(key)
+    if not os.path.isdir(path):
+        return None
+    try:
+        with open(os.path.join(path, "embeddings.json")) as f:
+            if json.load(f)["model"] != embedding_model_name(embeddings):
+                return None
+    except FileNotFoundError:
+        pass  # Saved before models were recorded; the key already includes the model
+    except (OSError, ValueError, KeyError):
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    try:
+        vector_store = _read_local(path, embeddings)
+    except Exception:
+        # Corrupt or partially written entry, drop it and rebuild
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    # Touch the entry so LRU eviction keeps recently used indexes
+    os.utime(path, None)
+    return vector_store
+
+
+def _read_local(path, embeddings):
+    """FAISS.load_local, but with the index file memory-mapped (unless FAISS_MMAP=0)."""
+    flags = MMAP_FLAGS if FAISS_MMAP else 0
+    index = faiss.read_index(os.path.join(path, "index.faiss"), flags)
+    tune_index(index)
+    # Written by save_local in this cache, so as trusted as the rest of it
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def save_index(key, vector_store, embeddings):
+    """Save an index (FAISS file + docstore + embedding model) and evict old entries if over the limit."""
+    os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+    path = _entry_path(key)
+    # Write into a temporary directory first so readers never see half an index
+    tmp_path = tempfile.mkdtemp(prefix=f".{key}-", dir=INDEX_CACHE_DIR)
+    try:
+        vector_store.save_local(tmp_path)
+        with open(os.path.join(tmp_path, "embeddings.json"), "w") as f:
+            json.dump({
+                "model": embedding_model_name(embeddings),
+                "dim": vector_store.index.d,
+                "index": type(vector_store.index).__name__,
+            }, f)
+        with _lock:
+            if os.path.isdir(path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            else:
+                try:
+                    os.rename(tmp_path, path)
+                except OSError:
+                    # _lock is per process: another process saved the same index first
+                    if not os.path.isdir(path):
+                        raise
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    evict()
+
+
+def evict(max_bytes=None):
+    """Remove least recently used indexes until the cache fits in max_bytes."""
+    if max_bytes is None:
+        max_bytes = INDEX_CACHE_MAX_MB * 1024 * 1024
+    if not os.path.isdir(INDEX_CACHE_DIR):
+        return
+
+    with _lock:
+        entries = []
+        for name in os.listdir(INDEX_CACHE_DIR):
+            path = os.path.join(INDEX_CACHE_DIR, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), _dir_size(path), path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def build_index(docs, embeddings, batch_size=INDEX_BATCH_SIZE, index_type=None, compression=None):
+    """Split and embed documents as they arrive, adding them to FAISS in batches.
+
+    docs can be a generator, so embedding of early pages overlaps with
+    extraction of later ones. The flat index is converted to index_type and
+    compression (FAISS_INDEX_TYPE and FAISS_COMPRESSION by default) at the end. Returns None if no chunks were produced.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    vector_store = None
+    batch = []
+    split_seconds, chunk_count = 0.0, 0
+
+    def flush():
+        nonlocal vector_store
+        # Embedding and FAISS are separate steps so they can be timed separately
+        texts = [chunk.page_content for chunk in batch]
+        metadatas = [chunk.metadata for chunk in batch]
+        with metrics.span("embed", chunks=len(texts)):
+            vectors = embeddings.embed_documents(texts)
+        with metrics.span("faiss_add", vectors=len(vectors)):
+            if vector_store is None:
+                vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+            else:
+                vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        batch.clear()
+
+    for doc in docs:
+        # Chunking, page by page (chunks never span pages, same as split_documents)
+        start = time.perf_counter()
+        chunks = text_splitter.split_documents([doc])
+        split_seconds += time.perf_counter() - start
+        chunk_count += len(chunks)
+        batch.extend(chunks)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    metrics.add_span("split", split_seconds, chunks=chunk_count)
+    if vector_store is not None:
+        with metrics.span("faiss_train", vectors=vector_store.index.ntotal) as entry:
+            vector_store.index = convert_index(vector_store.index, index_type, compression)
+            entry["index"] = type(vector_store.index).__name__
+    return vector_store
+
+
+def get_or_build_index(pdf_bytes, embeddings, load_docs):
+    """Return (vector_store, cache_hit) for a PDF.
+
+    load_docs is only called on a cache miss and should return (or yield)
+    the document pages. Returns (None, False) if no text could be extracted.
+    """
+    key = index_key(pdf_bytes, embeddings)
+    with metrics.span("index_load") as entry:
+        vector_store = load_index(key, embeddings)
+        entry["hit"] = vector_store is not None
+    if vector_store is not None:
+        return vector_store, True
+
+    vector_store = build_index(load_docs(), embeddings)
+    if vector_store is None:
+        return None, False
+    with metrics.span("index_save", vectors=vector_store.index.ntotal):
+        save_index(key, vector_store, embeddings)
+    return vector_store, False
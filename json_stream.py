@@ -0,0 +1,68 @@
+"""Incremental parsing of a streamed quiz JSON document.
+
+The LLM writes the quiz as one JSON object. This parser is fed the text
+as it streams in and returns each element of the "questions" array as
+soon as its closing brace arrives, so the preview can show questions
+before the whole completion has finished.
+"""
+import json
+import re
+
+
+class QuestionStreamParser:
+    def __init__(self, array_key="questions"):
+        self.array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key))
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.object_start = None
+
+    def feed(self, text):
+        """Add streamed text and return the list of question dicts completed by it."""
+        self.buffer += text
+        completed = []
+
+        if not self.in_array:
+            match = self.array_start.search(self.buffer, self.pos)
+            if not match:
+                # Keep scanning near the end in case the key is split across chunks
+                self.pos = max(0, len(self.buffer) - 64)
+                return completed
+            self.in_array = True
+            self.pos = match.end()
+
+        i = self.pos
+        while i < len(self.buffer) and not self.done:
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0 and char == "{":
+                    self.object_start = i
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0 and char == "]":
+                    self.done = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and self.object_start is not None:
+                        try:
+                            completed.append(json.loads(self.buffer[self.object_start:i + 1]))
+                        except json.JSONDecodeError:
+                            # Left for validation of the full document
+                            pass
+                        self.object_start = None
+            i += 1
+        self.pos = i
+        return completed
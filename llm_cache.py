@@ -0,0 +1,99 @@
+"""Persistent cache of LLM responses for quiz generation.
+
+Responses are keyed on the model name, the whitespace-normalized prompt
+and the IDs of the retrieved chunks, so re-clicking "Generate Quiz" with
+the same document and settings doesn't pay for another GPT-4 call.
+Entries expire after a TTL and the least recently used ones are evicted
+once the cache is full.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Cache location, expiry and size (override in the .env file)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+
+@contextmanager
+def _connect():
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=10)
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def chunk_id(doc):
+    """Stable ID of a retrieved chunk (a hash of its text, docstore IDs change when an index is rebuilt)."""
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(model, prompt, chunk_ids=()):
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    digest = hashlib.sha256(f"{model}\n{normalized}\n".encode("utf-8"))
+    digest.update("\n".join(chunk_ids).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get(key):
+    """Return the cached response for key, or None if missing or expired."""
+    now = time.time()
+    with _lock, _connect() as conn:
+        row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row and now - row[1] <= LLM_CACHE_TTL_HOURS * 3600:
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            _stats["hits"] += 1
+            return row[0]
+        if row:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        _stats["misses"] += 1
+        return None
+
+
+def put(key, response):
+    """Store a response and evict expired and least recently used entries."""
+    now = time.time()
+    with _lock, _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, now, now))
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - LLM_CACHE_TTL_HOURS * 3600,))
+        conn.execute(
+            "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)",
+            (LLM_CACHE_MAX_ENTRIES,),
+        )
+
+
+def record_bypass():
+    with _lock:
+        _stats["bypassed"] += 1
+
+
+def stats():
+    """Hit/miss counters for this process, plus the hit rate."""
+    with _lock:
+        counts = dict(_stats)
+    lookups = counts["hits"] + counts["misses"]
+    counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+    return counts
+
+
+def clear():
+    with _lock, _connect() as conn:
+        conn.execute("DELETE FROM responses")
@@ -0,0 +1,464 @@
+"""Offline load test for the Streamlit pages.
+
+Drives teacher-side.py, student-landing.py and auth.py through Streamlit's
+AppTest with concurrent simulated users, against an in-process MongoDB
+stand-in (mongomock) and fake LLM/embeddings clients with a configurable
+latency. The stand-ins are put into the resources registry, so the pages
+run unchanged. Everything runs in this process, like sessions on one
+Streamlit server.
+
+Traffic is a weighted mix of teacher scenarios (login, course list, quiz
+generation, visualization) and student scenarios (login, course list,
+enroll). AppTest can't upload files, so quiz generation renders the page
+and then runs the generation pipeline directly on a prebuilt index.
+
+Reports p50/p95/p99 latency per scenario, MongoDB operations per rerun
+(from a sequential calibration pass, so they can be attributed to a page)
+and peak RSS:
+
+    python loadtest.py --students 200 --teachers 20 --concurrency 40 --requests 1000
+
+Needs mongomock in addition to requirements.txt (pip install mongomock);
+mongomock's bulk_write only works with pymongo < 4.9.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the caches of this run out of the working directory
+_cache_dir = tempfile.mkdtemp(prefix="loadtest-")
+os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(_cache_dir, "embeddings")
+os.environ["INDEX_CACHE_DIR"] = os.path.join(_cache_dir, "indexes")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_cache_dir, "llm_cache.sqlite3")
+os.environ.setdefault("MPLBACKEND", "Agg")
+# session_auth refuses to start without a signing secret; tokens of this run never leave it
+os.environ.setdefault("SESSION_SECRET", secrets.token_urlsafe(32))
+
+import numpy as np
+
+try:
+    import mongomock
+    import mongomock.gridfs
+except ImportError:
+    sys.exit("The load test needs mongomock: pip install mongomock")
+import streamlit as st
+import streamlit_option_menu
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from streamlit.testing.v1 import AppTest
+
+import course_store
+import db_indexes
+import grading
+import index_cache
+import quiz_gen
+import resources
+import session_auth
+from embedding_cache import CachedEmbeddings
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "loadtest"
+
+TEACHER_SCENARIOS = {"teacher_login": 1, "course_list": 3, "quiz_generation": 1, "visualization": 2}
+STUDENT_SCENARIOS = {"student_login": 1, "student_courses": 4, "enroll": 1}
+
+
+class FakeChatModel:
+    """Stands in for ChatOpenAI: answers every prompt with valid quiz JSON after a delay."""
+
+    model_name = "fake-chat"
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _reply(self, prompt):
+        text = prompt if isinstance(prompt, str) else "\n".join(str(getattr(m, "content", m)) for m in prompt)
+        match = re.search(r"Write (\d+) questions", text) or re.search(r"(\d+) (?:multiple-choice )?questions", text)
+        count = int(match.group(1)) if match else quiz_gen.QUESTIONS_PER_CALL
+        time.sleep(self.latency)
+        return json.dumps({"questions": [
+            {
+                "question_id": i,
+                "question": f"Generated question {i}?",
+                "options": [{"option_text": f"Option {j}", "is_correct": j == i % 4} for j in range(4)],
+            }
+            for i in range(1, count + 1)
+        ]})
+
+    def invoke(self, prompt):
+        return _Message(self._reply(prompt))
+
+    def stream(self, prompt):
+        text = self._reply(prompt)
+        for start in range(0, len(text), 64):
+            yield _Message(text[start:start + 64])
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeEmbeddings(Embeddings):
+    """Stands in for OpenAIEmbeddings: hashed random vectors after a delay per call."""
+
+    model = "fake-embeddings"
+
+    def __init__(self, latency, dim=256):
+        self.latency = latency
+        self.dim = dim
+
+    def _vector(self, text):
+        return np.random.default_rng(abs(hash(text)) % (2 ** 32)).standard_normal(self.dim).astype(float).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+
+class MongoOpCounter:
+    """Counts calls to mongomock collection methods (nested calls inside mongomock count once)."""
+
+    METHODS = [
+        "find", "find_one", "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+        "delete_one", "delete_many", "aggregate", "distinct", "count_documents", "bulk_write",
+        "find_one_and_update", "create_indexes",
+    ]
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._depth = threading.local()
+        for name in self.METHODS:
+            self._wrap(mongomock.collection.Collection, name)
+
+    def _wrap(self, cls, name):
+        original = getattr(cls, name)
+        counter = self
+
+        def counted(*args, **kwargs):
+            depth = getattr(counter._depth, "value", 0)
+            if depth == 0:
+                with counter._lock:
+                    counter.count += 1
+            counter._depth.value = depth + 1
+            try:
+                return original(*args, **kwargs)
+            finally:
+                counter._depth.value = depth
+
+        setattr(cls, name, counted)
+
+
+def _option_menu(menu_title, options, default_index=0, **kwargs):
+    # The real option menu is a custom component, which AppTest can't click
+    return st.session_state.get("_loadtest_page", options[default_index])
+
+
+def share_test_runtime():
+    """Make AppTest safe to run from several threads.
+
+    Each AppTest run installs its own mock Runtime singleton and clears it
+    when done, and compiles the script again; concurrent runs trip over
+    both. Serve one shared mock runtime instead, and compile each script
+    once under a lock, as a real server's script cache would.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+    compile_lock = threading.Lock()
+    bytecode = {}
+    get_bytecode = ScriptCache.get_bytecode
+
+    def shared_get_bytecode(self, script_path):
+        with compile_lock:
+            script_path = os.path.abspath(script_path)
+            if script_path not in bytecode:
+                bytecode[script_path] = get_bytecode(self, script_path)
+            return bytecode[script_path]
+
+    ScriptCache.get_bytecode = shared_get_bytecode
+
+
+def install_stand_ins(llm_latency, embed_latency):
+    mongomock.gridfs.enable_gridfs_integration()
+    client = mongomock.MongoClient()
+    resources._resources["mongo"] = client
+    resources._resources["llm:gpt-4"] = FakeChatModel(llm_latency)
+    resources._resources["embeddings"] = CachedEmbeddings(FakeEmbeddings(embed_latency))
+    streamlit_option_menu.option_menu = _option_menu
+    share_test_runtime()
+    db_indexes.migrate(client)
+    return client
+
+
+def seed(client, teachers, students, courses_per_teacher, quizzes_per_course, rng):
+    """Create teachers, students, courses, quizzes and scores. Returns (teacher list, student IDs, course IDs)."""
+    quiz_db = client["quiz-db"]
+    password_hash = session_auth.hash_password(PASSWORD)
+    teacher_list, course_ids = [], []
+    for t in range(teachers):
+        username, name = f"teacher{t}", f"Teacher {t}"
+        quiz_db["teacher_meta"].insert_one({"username": username, "password": password_hash, "full_name": name})
+        teacher_courses = []
+        for c in range(courses_per_teacher):
+            course = course_store.create_course(client, quiz_db["courses"], f"C{t}-{c}", f"Course {t} {c}", name)
+            teacher_courses.append(course["course_id"])
+            course_ids.append(course["course_id"])
+        teacher_list.append({"username": username, "name": name, "course_ids": teacher_courses})
+
+    student_ids = [f"student{s}" for s in range(students)]
+    quiz_db["student_meta"].insert_many([{"username": s, "password": password_hash} for s in student_ids])
+    enrolled = defaultdict(list)
+    for student_id in student_ids:
+        for course_id in rng.sample(course_ids, min(2, len(course_ids))):
+            enrolled[course_id].append(student_id)
+        client["master_db"]["students"].insert_one({
+            "student_id": student_id,
+            "enrolled_courses": [c for c in course_ids if student_id in enrolled[c]],
+        })
+
+    for course in quiz_db["courses"].find():
+        quizzes = course_store.get_collection(client, course, "quiz")
+        for q in range(quizzes_per_course):
+            quiz_id = f"{course['course_id']}-Q{q}"
+            quiz = json.loads(FakeChatModel(0)._reply("Write 10 questions"))
+            quizzes.insert_one({"quiz_id": quiz_id, "title": f"Quiz {q}", **quiz})
+            keys = grading.load_keys(quizzes, quiz_id)
+            submissions = [
+                {"student_id": s, "answers": [rng.randrange(-1, 4) for _ in range(10)]}
+                for s in enrolled[course["course_id"]]
+            ]
+            grading.save_scores(
+                course_store.get_collection(client, course, "test_scores"),
+                course_store.get_collection(client, course, "quiz_stats"),
+                quiz_id,
+                grading.grade(submissions, keys),
+            )
+    return teacher_list, student_ids, course_ids
+
+
+def build_generation_index(embeddings):
+    docs = [
+        Document(page_content=f"Section {i}. " + " ".join(f"term{(i * 7 + j) % 500}" for j in range(150)), metadata={"page": i})
+        for i in range(40)
+    ]
+    return index_cache.build_index(docs, embeddings)
+
+
+def _widget(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+class Scenarios:
+    """One method per scenario; each returns the number of reruns it made."""
+
+    def __init__(self, client, teachers, student_ids, course_ids, vector_store, timeout, rng):
+        self.client = client
+        self.teachers = teachers
+        self.student_ids = student_ids
+        self.course_ids = course_ids
+        self.vector_store = vector_store
+        self.timeout = timeout
+        self.rng = rng
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _app(self, script, page=None, profile=None, **state):
+        at = AppTest.from_file(os.path.join(ROOT, script), default_timeout=self.timeout)
+        if page:
+            at.session_state["_loadtest_page"] = page
+        if profile:
+            at.session_state["profile"] = profile
+        for key, value in state.items():
+            at.session_state[key] = value
+        return at
+
+    def _run(self, name, action):
+        start = time.perf_counter()
+        at = action()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.timings[name].append(elapsed)
+            if at is not None and at.exception:
+                self.errors[name] += 1
+        return at
+
+    def _teacher_profile(self, teacher):
+        return {**teacher, "role": "Teacher"}
+
+    def _student_profile(self, student_id):
+        student = self.client["master_db"]["students"].find_one({"student_id": student_id}) or {}
+        return {"username": student_id, "name": student_id, "role": "Student", "course_ids": student.get("enrolled_courses", [])}
+
+    def teacher_login(self):
+        teacher = self.rng.choice(self.teachers)
+        at = self._run("teacher_login", lambda: self._app("teacher-side.py", page="🔑 Login").run())
+        _widget(at.text_input, "Username").set_value(teacher["username"])
+        _widget(at.text_input, "Password").set_value(PASSWORD)
+        self._run("teacher_login", lambda: _widget(at.button, "Login").click().run())
+        return 2
+
+    def course_list(self):
+        teacher = self.rng.choice(self.teachers)
+        at = self._app("teacher-side.py", page="🏠 Home", profile=self._teacher_profile(teacher))
+        self._run("course_list", at.run)
+        _widget(at.text_input, "Enter Course Name").set_value("Typing")  # A widget change is a full rerun too
+        self._run("course_list", at.run)
+        return 2
+
+    def quiz_generation(self):
+        teacher = self.rng.choice(self.teachers)
+        at = self._app("teacher-side.py", page="📝 Quiz Generation", profile=self._teacher_profile(teacher))
+        self._run("quiz_generation", at.run)
+
+        def generate():
+            quiz_fields = {"quiz_id": "load", "title": "Load test", "questions": []}
+            data = quiz_gen.generate_quiz_parallel(
+                resources.get_llm("gpt-4"), self.vector_store, 10, quiz_fields, "Load test", fresh=True
+            )
+            quiz_gen.complete_quiz(resources.get_llm("gpt-4"), self.vector_store, data, quiz_fields, 10, "Load test")
+
+        self._run("quiz_generation_pipeline", generate)
+        return 1
+
+    def visualization(self):
+        teacher = self.rng.choice(self.teachers)
+        at = self._app("teacher-side.py", page="📊 Visualization", profile=self._teacher_profile(teacher))
+        self._run("visualization", at.run)
+        self._run("visualization", lambda: _widget(at.button, "Show Visualization").click().run())
+        return 2
+
+    def student_login(self):
+        student_id = self.rng.choice(self.student_ids)
+        at = self._run("student_login", lambda: self._app("auth.py").run())
+        _widget(at.selectbox, "Select Role").set_value("Student")
+        _widget(at.text_input, "Username").set_value(student_id)
+        _widget(at.text_input, "Password").set_value(PASSWORD)
+        self._run("student_login", lambda: _widget(at.button, "Login").click().run())
+        return 2
+
+    def student_courses(self):
+        profile = self._student_profile(self.rng.choice(self.student_ids))
+        state = {}
+        if profile["course_ids"]:
+            state = {"active_course": profile["course_ids"][0], "active_course_id": profile["course_ids"][0]}
+        self._run("student_courses", self._app("student-landing.py", profile=profile, **state).run)
+        return 1
+
+    def enroll(self):
+        profile = self._student_profile(self.rng.choice(self.student_ids))
+        at = self._run("enroll", self._app("student-landing.py", profile=profile).run)
+        _widget(at.text_input, "Enter the course ID to join a new course").set_value(self.rng.choice(self.course_ids))
+        self._run("enroll", lambda: _widget(at.button, "Join Course").click().run())
+        return 2
+
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {"count": len(samples), "p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit pages with local stand-ins.")
+    parser.add_argument("--teachers", type=int, default=20)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--courses-per-teacher", type=int, default=2)
+    parser.add_argument("--quizzes-per-course", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=40, help="Simulated users active at once")
+    parser.add_argument("--requests", type=int, default=500, help="Scenarios to run in total")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per fake embeddings call")
+    parser.add_argument("--timeout", type=float, default=60, help="AppTest timeout per rerun in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = install_stand_ins(args.llm_latency, args.embed_latency)
+    counter = MongoOpCounter()
+    print("Seeding data...")
+    teachers, student_ids, course_ids = seed(
+        client, args.teachers, args.students, args.courses_per_teacher, args.quizzes_per_course, rng
+    )
+    vector_store = build_generation_index(resources.get_embeddings())
+    scenarios = Scenarios(client, teachers, student_ids, course_ids, vector_store, args.timeout, rng)
+    weights = {**TEACHER_SCENARIOS, **STUDENT_SCENARIOS}
+
+    # Calibration: one run of each scenario on its own, so Mongo operations can be attributed to it
+    ops_per_rerun = {}
+    for name in weights:
+        before = counter.count
+        reruns = getattr(scenarios, name)()
+        ops_per_rerun[name] = round((counter.count - before) / reruns, 1)
+    scenarios.timings.clear()
+    scenarios.errors.clear()
+
+    # Teachers and students are picked in proportion to their numbers
+    teacher_share = args.teachers / (args.teachers + args.students)
+    plan = []
+    for _ in range(args.requests):
+        pool = TEACHER_SCENARIOS if rng.random() < teacher_share else STUDENT_SCENARIOS
+        plan.append(rng.choices(list(pool), weights=list(pool.values()))[0])
+
+    print(f"Running {args.requests} scenarios with {args.concurrency} concurrent users...")
+    ops_before = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(getattr(scenarios, name)) for name in plan]:
+            try:
+                future.result()
+            except Exception:
+                scenarios.errors["harness"] += 1
+    wall = time.perf_counter() - start
+
+    report = {
+        "scenarios": {
+            name: {**percentiles(samples), "errors": scenarios.errors.get(name, 0), "mongo_ops_per_rerun": ops_per_rerun.get(name)}
+            for name, samples in sorted(scenarios.timings.items())
+        },
+        "wall_seconds": round(wall, 1),
+        "mongo_ops_total": counter.count - ops_before,
+        "harness_errors": scenarios.errors.get("harness", 0),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # ru_maxrss is in KiB on Linux
+    }
+
+    print(f"\n{'scenario':<26}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'ops/rerun':>11}")
+    for name, row in report["scenarios"].items():
+        ops = "" if row["mongo_ops_per_rerun"] is None else row["mongo_ops_per_rerun"]
+        print(f"{name:<26}{row['count']:>7}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}{ops:>11}")
+    print(f"\nWall time {report['wall_seconds']} s, {report['mongo_ops_total']} Mongo operations, "
+          f"{report['harness_errors']} harness errors, peak RSS {report['peak_rss_mb']} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
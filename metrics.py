@@ -0,0 +1,286 @@
+"""Stage timings and LLM token/cost metrics for quiz generation.
+
+A quiz generation request runs inside trace(), which collects the named
+spans (PDF extraction, embedding, FAISS, retrieval, LLM calls, parsing)
+and LLM calls (prompt/completion tokens, cost, cache hits) recorded while
+it runs, including on worker threads started with copy_context(). When
+the trace ends it is written as one document to the quiz-db.metrics
+collection. If METRICS_PROM_FILE is set, per-stage histograms and token
+and cost counters for this process are also written in Prometheus text
+format for node_exporter's textfile collector. Each process writes its
+own file, with its pid added to the name and to every series (e.g.
+quiz.prom becomes quiz.1234.prom), and removes it when it exits.
+
+Spans and LLM calls outside a trace are timed but not stored.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Price per 1,000 tokens in USD (GPT-4 8K by default; override in the .env file)
+LLM_PROMPT_COST_PER_1K = float(os.getenv("LLM_PROMPT_COST_PER_1K", "0.03"))
+LLM_COMPLETION_COST_PER_1K = float(os.getenv("LLM_COMPLETION_COST_PER_1K", "0.06"))
+# Optional Prometheus textfile; each process writes its own copy next to it
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE")
+
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+_prom_lock = threading.Lock()
+_stage_hist = defaultdict(lambda: {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0})
+_counters = defaultdict(float)
+_prom_pid = None
+
+
+def _collection():
+    import resources
+    return resources.get_mongo_client()["quiz-db"]["metrics"]
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Collect the spans and LLM calls of one request and store them when it ends."""
+    record = {
+        "run_id": uuid.uuid4().hex,
+        "name": name,
+        **attrs,
+        "started_at": datetime.now(timezone.utc),
+        "spans": [],
+        "llm_calls": [],
+    }
+    token = _current.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        calls = record["llm_calls"]
+        record["prompt_tokens"] = sum(call["prompt_tokens"] for call in calls)
+        record["completion_tokens"] = sum(call["completion_tokens"] for call in calls)
+        record["cost_usd"] = round(sum(call["cost_usd"] for call in calls), 6)
+        _store(record)
+
+
+def _record_span(entry):
+    record = _current.get()
+    if record is not None:
+        record["spans"].append(entry)
+
+
+def add_span(name, seconds, **attrs):
+    """Record a stage timed by the caller (e.g. summed over a loop)."""
+    _record_span({"name": name, **attrs, "seconds": round(seconds, 4)})
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a stage. Attributes (counts, k, ...) can also be set on the yielded dict."""
+    entry = {"name": name, **attrs}
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry["seconds"] = round(time.perf_counter() - start, 4)
+        _record_span(entry)
+
+
+def timed_iter(name, iterable, **attrs):
+    """Iterate while timing only the time spent producing items, recorded as one span (e.g. lazy PDF extraction)."""
+    iterator = iter(iterable)
+    entry = {"name": name, **attrs, "items": 0}
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            entry["items"] += 1
+            yield item
+    finally:
+        entry["seconds"] = round(elapsed, 4)
+        _record_span(entry)
+
+
+_encoding = None
+
+
+def _estimate_tokens(text):
+    """Token count with tiktoken, or about 4 characters per token if it can't load its encoding (e.g. offline)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def _usage(response):
+    """(prompt tokens, completion tokens) reported by the API, or None."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return None
+
+
+def record_llm_call(model, prompt_text, completion_text, response=None, cached=False, chunks=None):
+    """Record one LLM call in the current trace.
+
+    Token counts come from the response's usage data, or are estimated from
+    the text when the API doesn't report them (e.g. streaming).
+    """
+    record = _current.get()
+    if record is None:
+        return
+    if cached:
+        prompt_tokens = completion_tokens = 0
+        estimated = False
+    else:
+        usage = _usage(response) if response is not None else None
+        estimated = usage is None
+        prompt_tokens, completion_tokens = usage or (_estimate_tokens(prompt_text), _estimate_tokens(completion_text))
+    record["llm_calls"].append({
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": round(
+            prompt_tokens / 1000 * LLM_PROMPT_COST_PER_1K + completion_tokens / 1000 * LLM_COMPLETION_COST_PER_1K, 6
+        ),
+        "cached": cached,
+        "estimated": estimated,
+        "chunks": chunks,
+    })
+
+
+def _store(record):
+    try:
+        _collection().insert_one(record)
+    except Exception:
+        logger.exception("Could not store quiz generation metrics")
+    if METRICS_PROM_FILE:
+        try:
+            _update_prometheus(record)
+        except OSError:
+            logger.exception("Could not write %s", _prom_path())
+
+
+def _prom_path(pid=None):
+    """This process's textfile: METRICS_PROM_FILE with the pid before its extension."""
+    root, ext = os.path.splitext(METRICS_PROM_FILE)
+    return f"{root}.{pid or os.getpid()}{ext}"
+
+
+def _remove_prom_file(pid):
+    try:
+        os.remove(_prom_path(pid))
+    except OSError:
+        pass
+
+
+def _update_prometheus(record):
+    global _prom_pid
+    with _prom_lock:
+        if _prom_pid != os.getpid():
+            # First write in this process; a forked child drops the counts it inherited from its parent
+            _prom_pid = os.getpid()
+            _stage_hist.clear()
+            _counters.clear()
+            atexit.register(_remove_prom_file, _prom_pid)
+        for entry in record["spans"]:
+            hist = _stage_hist[entry["name"]]
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if entry["seconds"] <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += entry["seconds"]
+            hist["count"] += 1
+        _counters["prompt"] += record["prompt_tokens"]
+        _counters["completion"] += record["completion_tokens"]
+        _counters["cost"] += record["cost_usd"]
+        _counters["runs"] += 1
+
+        # Series from different processes must differ in a label, or node_exporter rejects them
+        pid = f'pid="{_prom_pid}"'
+        lines = [
+            "# HELP quiz_stage_seconds Time spent in each quiz generation stage.",
+            "# TYPE quiz_stage_seconds histogram",
+        ]
+        for stage, hist in sorted(_stage_hist.items()):
+            for bound, count in zip(HISTOGRAM_BUCKETS, hist["buckets"]):
+                lines.append(f'quiz_stage_seconds_bucket{{{pid},stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'quiz_stage_seconds_bucket{{{pid},stage="{stage}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'quiz_stage_seconds_sum{{{pid},stage="{stage}"}} {hist["sum"]:.4f}')
+            lines.append(f'quiz_stage_seconds_count{{{pid},stage="{stage}"}} {hist["count"]}')
+        lines += [
+            "# HELP quiz_llm_tokens_total LLM tokens used by quiz generation.",
+            "# TYPE quiz_llm_tokens_total counter",
+            f'quiz_llm_tokens_total{{{pid},kind="prompt"}} {int(_counters["prompt"])}',
+            f'quiz_llm_tokens_total{{{pid},kind="completion"}} {int(_counters["completion"])}',
+            "# HELP quiz_llm_cost_usd_total Estimated LLM cost of quiz generation in USD.",
+            "# TYPE quiz_llm_cost_usd_total counter",
+            f'quiz_llm_cost_usd_total{{{pid}}} {_counters["cost"]:.6f}',
+            "# HELP quiz_generation_runs_total Traced quiz generation requests.",
+            "# TYPE quiz_generation_runs_total counter",
+            f'quiz_generation_runs_total{{{pid}}} {int(_counters["runs"])}',
+        ]
+
+        # Write and rename, so the collector never reads a partial file
+        directory = os.path.dirname(os.path.abspath(METRICS_PROM_FILE))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(f.name, _prom_path())
+
+
+# Fields of a run the Ops page reads
+RUN_SUMMARY_FIELDS = (
+    "run_id", "name", "teacher", "course_id", "started_at", "seconds", "error",
+    "prompt_tokens", "completion_tokens", "cost_usd", "spans.name", "spans.seconds",
+)
+
+
+def recent_runs(collection, since, teacher=None, limit=5000):
+    """Traced runs since a datetime (of one teacher if given), newest first, with only the summary fields."""
+    query = {"started_at": {"$gte": since}}
+    if teacher is not None:
+        query["teacher"] = teacher
+    return list(
+        collection.find(query, {"_id": 0, **{field: 1 for field in RUN_SUMMARY_FIELDS}})
+        .sort("started_at", -1)
+        .limit(limit)
+    )
+
+
+def stage_totals(runs):
+    """One row per (run, stage) with the stage's total seconds in that run, for percentiles per stage."""
+    rows = []
+    for run in runs:
+        totals = defaultdict(float)
+        for entry in run.get("spans", []):
+            totals[entry["name"]] += entry["seconds"]
+        rows += [{"stage": stage, "seconds": seconds} for stage, seconds in totals.items()]
+        rows.append({"stage": "total", "seconds": run.get("seconds", 0.0)})
+    return rows
@@ -0,0 +1,105 @@
+"""In-memory PDF text extraction with PyMuPDF.
+
+Pages are extracted in a process pool straight from the uploaded bytes
+(no temp files) and yielded in page order as they become available, so
+chunking and embedding can start before the whole book is parsed.
+
+The pool is started once per server process (with spawn, so workers
+don't inherit the server's threads and sockets) and shared by all
+uploads. Each upload's bytes are handed to the workers through a shared
+memory block rather than pickled into every task.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import fitz  # PyMuPDF
+from langchain_core.documents import Document
+
+# Number of extraction processes and pages handed to each task (override in the .env file)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Each worker opens a document once and keeps it for the rest of its tasks: (shared memory name, document)
+_worker_doc = (None, None)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _open_shared(name, size):
+    global _worker_doc
+    if _worker_doc[0] != name:
+        if _worker_doc[1] is not None:
+            _worker_doc[1].close()
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            _worker_doc = (name, fitz.open(stream=bytes(block.buf[:size]), filetype="pdf"))
+        finally:
+            block.close()
+    return _worker_doc[1]
+
+
+def _extract_range(task):
+    name, size, start, stop = task
+    doc = _open_shared(name, size)
+    return [doc[i].get_text() for i in range(start, stop)]
+
+
+def _page_document(text, page, source):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def iter_pdf_pages(pdf_bytes, source="uploaded.pdf", workers=PDF_WORKERS):
+    """Yield one Document per non-empty page, in page order."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+        # Small documents aren't worth starting worker processes for
+        if workers <= 1 or page_count <= PAGES_PER_TASK:
+            for i in range(page_count):
+                text = doc[i].get_text()
+                if text.strip():
+                    yield _page_document(text, i, source)
+            return
+
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    block = shared_memory.SharedMemory(create=True, size=len(pdf_bytes))
+    block.buf[:len(pdf_bytes)] = pdf_bytes
+    executor = _get_executor()
+    # map() returns results in order while later ranges are still being extracted
+    results = executor.map(_extract_range, [(block.name, len(pdf_bytes), start, stop) for start, stop in ranges])
+    try:
+        for (start, _), texts in zip(ranges, results):
+            for offset, text in enumerate(texts):
+                if text.strip():
+                    yield _page_document(text, start + offset, source)
+    except BrokenProcessPool:
+        # A worker died: start a new pool for the next upload
+        _discard_executor(executor)
+        raise
+    finally:
+        # Cancels the ranges not yet extracted if the caller stopped early
+        results.close()
+        block.close()
+        block.unlink()
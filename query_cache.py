@@ -0,0 +1,43 @@
+"""Session-scoped cache for read queries repeated on every Streamlit rerun.
+
+Each browser session keeps its own entries in st.session_state, keyed by
+a tuple such as ("courses", teacher_name) or ("quizzes", course_id), and
+trusts them for QUERY_CACHE_TTL_SECONDS. Pages that write through the same
+session (creating a course, posting a quiz) invalidate the affected keys,
+so their own changes show up immediately; changes made elsewhere show up
+once the entry expires.
+"""
+import os
+import time
+
+import streamlit as st
+
+# How long a cached query result is trusted (override in the .env file)
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "60"))
+
+_STATE_KEY = "_query_cache"
+
+
+def _entries():
+    if _STATE_KEY not in st.session_state:
+        st.session_state[_STATE_KEY] = {}
+    return st.session_state[_STATE_KEY]
+
+
+def cached(key, load, ttl=None):
+    """Result of load() for this key, reused until it is older than ttl seconds."""
+    ttl = QUERY_CACHE_TTL_SECONDS if ttl is None else ttl
+    entries = _entries()
+    entry = entries.get(key)
+    if entry is not None and time.monotonic() - entry[1] < ttl:
+        return entry[0]
+    value = load()
+    entries[key] = (value, time.monotonic())
+    return value
+
+
+def invalidate(*prefix):
+    """Drop every entry whose key starts with prefix (everything if no prefix is given)."""
+    entries = _entries()
+    for key in [key for key in entries if key[:len(prefix)] == prefix]:
+        del entries[key]
@@ -0,0 +1,182 @@
+"""Quiz delivery and submission path for students.
+
+When a quiz opens, the whole class asks for the same quiz at once, then
+submits within a few minutes. Quizzes are loaded once per process: one
+query fetches the shared quiz and every per-student variant, each is
+serialized to JSON with the answer key removed, and their compiled answer
+keys are kept next to them for grading. Concurrent requests for a quiz
+that isn't cached yet wait for a single load. Posting a quiz invalidates
+the course's entries.
+
+Submissions are acknowledged immediately and queued. A background thread
+grades and writes them in batches (see grading.py) when SUBMIT_BATCH_SIZE
+submissions are waiting or every SUBMIT_FLUSH_SECONDS, so writes to
+test_scores grow with the number of batches rather than the class size.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+import course_store
+import grading
+
+# How long a serialized quiz is served without re-reading it (override in the .env file)
+QUIZ_PAYLOAD_TTL_SECONDS = float(os.getenv("QUIZ_PAYLOAD_TTL_SECONDS", "600"))
+# Flush the submission buffer at this many submissions, or after this many seconds
+SUBMIT_BATCH_SIZE = int(os.getenv("SUBMIT_BATCH_SIZE", "200"))
+SUBMIT_FLUSH_SECONDS = float(os.getenv("SUBMIT_FLUSH_SECONDS", "2"))
+
+_lock = threading.Lock()
+_quizzes = {}  # (course_id, quiz_id) -> (entry, loaded_at)
+_quiz_lists = {}  # course_id -> (quiz list, loaded_at)
+_loading = defaultdict(threading.Lock)  # (course_id, quiz_id) -> lock held while loading
+
+
+def _public_quiz(quiz):
+    """Copy of a quiz document without _id, course_id and the is_correct flags."""
+    public = {key: value for key, value in quiz.items() if key not in ("_id", "course_id", "questions")}
+    public["questions"] = [
+        {
+            **{key: value for key, value in question.items() if key != "options"},
+            "options": [{"option_text": option.get("option_text", "")} for option in question.get("options", [])],
+        }
+        for question in quiz.get("questions", [])
+    ]
+    return public
+
+
+def _load_quiz(client, course, quiz_id):
+    """Serialize every version of a quiz (shared and per-student) in one query."""
+    payloads, keys = {}, {}
+    for quiz in course_store.get_collection(client, course, "quiz").find({"quiz_id": quiz_id}):
+        student_id = quiz.get("student_id")
+        payloads[student_id] = json.dumps(_public_quiz(quiz), default=str)
+        keys[student_id] = grading.compile_key(quiz)
+    return {"payloads": payloads, "keys": keys}
+
+
+def _get_quiz(client, course, quiz_id):
+    cache_key = (course["course_id"], quiz_id)
+    with _lock:
+        cached = _quizzes.get(cache_key)
+        load_lock = _loading[cache_key]
+    if cached and time.monotonic() - cached[1] < QUIZ_PAYLOAD_TTL_SECONDS:
+        return cached[0]
+
+    with load_lock:
+        # Another thread may have loaded it while we waited
+        with _lock:
+            cached = _quizzes.get(cache_key)
+        if cached and time.monotonic() - cached[1] < QUIZ_PAYLOAD_TTL_SECONDS:
+            return cached[0]
+        entry = _load_quiz(client, course, quiz_id)
+        with _lock:
+            _quizzes[cache_key] = (entry, time.monotonic())
+        return entry
+
+
+def get_quiz_payload(client, course, quiz_id, student_id):
+    """JSON of the student's version of a quiz without the answers, or None if there is none."""
+    payloads = _get_quiz(client, course, quiz_id)["payloads"]
+    return payloads.get(student_id, payloads.get(None))
+
+
+def list_quizzes(client, course):
+    """[(quiz_id, title)] of the quizzes posted to a course, cached like the quizzes themselves."""
+    with _lock:
+        cached = _quiz_lists.get(course["course_id"])
+    if cached and time.monotonic() - cached[1] < QUIZ_PAYLOAD_TTL_SECONDS:
+        return cached[0]
+    quizzes = [
+        (row["_id"], row.get("title") or row["_id"])
+        for row in course_store.get_collection(client, course, "quiz").aggregate([
+            {"$group": {"_id": "$quiz_id", "title": {"$first": "$title"}}},
+            {"$sort": {"_id": 1}},
+        ])
+    ]
+    with _lock:
+        _quiz_lists[course["course_id"]] = (quizzes, time.monotonic())
+    return quizzes
+
+
+def invalidate(course_id, quiz_id=None):
+    """Drop a course's cached quizzes (or one quiz), e.g. after a quiz is posted."""
+    with _lock:
+        _quiz_lists.pop(course_id, None)
+        for key in [key for key in _quizzes if key[0] == course_id and quiz_id in (None, key[1])]:
+            del _quizzes[key]
+
+
+class SubmissionBuffer:
+    """Queues submissions and grades and writes them in batches on a background thread."""
+
+    def __init__(self, batch_size=SUBMIT_BATCH_SIZE, flush_seconds=SUBMIT_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._pending = []  # (client, course, quiz_id, submission, future)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, client, course, quiz_id, student_id, answers):
+        """Queue a submission and return a Future of its graded result ({"score", "correct", "total"})."""
+        future = Future()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="submission-flush", daemon=True)
+                self._thread.start()
+            self._pending.append((client, course, quiz_id, {"student_id": student_id, "answers": answers}, future))
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size, timeout=self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """Grade and write everything queued so far, one bulk write per quiz."""
+        with self._condition:
+            pending, self._pending = self._pending, []
+
+        groups = defaultdict(list)
+        for client, course, quiz_id, submission, future in pending:
+            groups[(course["course_id"], quiz_id)].append((client, course, submission, future))
+
+        for (_, quiz_id), items in groups.items():
+            client, course = items[0][0], items[0][1]
+            futures = {}
+            try:
+                # Latest submission per student wins within a batch
+                latest = {}
+                for _, _, submission, future in items:
+                    latest[submission["student_id"]] = submission
+                    futures.setdefault(submission["student_id"], []).append(future)
+                results = grading.grade(list(latest.values()), _get_quiz(client, course, quiz_id)["keys"])
+                grading.save_scores(
+                    course_store.get_collection(client, course, "test_scores"),
+                    course_store.get_collection(client, course, "quiz_stats"),
+                    quiz_id,
+                    results,
+                )
+                graded = {result["student_id"]: result for result in results}
+                for student_id, student_futures in futures.items():
+                    for future in student_futures:
+                        if student_id in graded:
+                            future.set_result(graded[student_id])
+                        else:
+                            future.set_exception(ValueError("This quiz is not available to you."))
+            except Exception as e:
+                for _, _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+submissions = SubmissionBuffer()
+# Don't lose queued submissions on a clean shutdown
+atexit.register(submissions.flush)
@@ -0,0 +1,311 @@
+"""Quiz generation against a FAISS index.
+
+Small quizzes are a single (streamed) call. Large quizzes are split into
+sub-requests of a few questions each; every sub-request gets its own
+slice of retrieved context, they run concurrently, and the partial
+question lists are merged into one quiz with renumbered question_ids.
+All LLM calls go through the response cache in llm_cache; only responses
+that parse and validate are stored, so a broken one is never replayed.
+Stages are recorded as metrics spans (see metrics.py).
+"""
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm_cache
+import metrics
+import quiz_schema
+
+# Questions asked for per LLM call, and how many calls may run at once (override in the .env file)
+QUESTIONS_PER_CALL = int(os.getenv("QUESTIONS_PER_CALL", "5"))
+GEN_MAX_CONCURRENCY = int(os.getenv("GEN_MAX_CONCURRENCY", "4"))
+
+# Context chunks given to each sub-request (same as the default retriever k)
+CHUNKS_PER_CALL = 4
+
+QUESTION_FORMAT = """{
+    "questions": [
+        {
+            "question_id": 1,
+            "question": "",
+            "options": [
+                {"option_text": "", "is_correct": false or true},
+                {"option_text": "", "is_correct": false or true},
+                {"option_text": "", "is_correct": false or true},
+                {"option_text": "", "is_correct": false or true}
+            ]
+        },
+        ...
+    ]
+}"""
+
+
+def split_count(num_questions, per_call=QUESTIONS_PER_CALL):
+    """Split a question count into sub-request sizes, e.g. 12 -> [5, 5, 2]."""
+    sizes = [per_call] * (num_questions // per_call)
+    if num_questions % per_call:
+        sizes.append(num_questions % per_call)
+    return sizes
+
+
+def format_docs(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def retrieve_contexts(vector_store, query, parts, k=CHUNKS_PER_CALL):
+    """Retrieve diverse chunks for the whole quiz and deal them out to each part.
+
+    A short document may have fewer chunks than there are parts; then the
+    chunks are shared, each part starting at a different one, so no part is
+    asked for questions without context.
+    """
+    with metrics.span("retrieve", k=parts * k) as entry:
+        docs = vector_store.max_marginal_relevance_search(query, k=parts * k, fetch_k=max(parts * k * 2, 20))
+        entry["chunks"] = len(docs)
+    if 0 < len(docs) < parts:
+        return [[docs[(i + j) % len(docs)] for j in range(min(k, len(docs)))] for i in range(parts)]
+    return [docs[i::parts] for i in range(parts)]
+
+
+def questions_prompt(context, num_questions, description, part, parts, instructions=""):
+    return f"""
+You are a teacher and need to write quiz questions for your class based on the provided document excerpts.
+
+Document excerpts:
+{context}
+
+Test description: {description}
+
+Write {num_questions} questions (part {part} of {parts} of the quiz) based only on the excerpts above.
+
+Each question should have 4 options, out of which only one is correct.
+{instructions}
+Format the output as a JSON object with the following structure:
+
+{QUESTION_FORMAT}
+    """
+
+
+def _response_key(llm, prompt, docs):
+    return llm_cache.cache_key(llm_cache.model_name(llm), prompt, [llm_cache.chunk_id(doc) for doc in docs])
+
+
+def _lookup(key, fresh):
+    # fresh=True skips the lookup ("give me a fresh variant"), the new response is still stored
+    if fresh:
+        llm_cache.record_bypass()
+        return None
+    text = llm_cache.get(key)
+    # Entries stored before responses were validated may be broken
+    return text if text is not None and quiz_schema.is_valid_output(text) else None
+
+
+def _store(key, text):
+    if quiz_schema.is_valid_output(text):
+        llm_cache.put(key, text)
+
+
+def _prompt_text(prompt, messages):
+    return "\n".join(content for _, content in messages) if messages else prompt
+
+
+def invoke_cached(llm, prompt, docs, fresh=False, messages=None):
+    """Call the LLM through the response cache. messages defaults to the prompt itself."""
+    key = _response_key(llm, prompt, docs)
+    text = _lookup(key, fresh)
+    if text is not None:
+        metrics.record_llm_call(llm_cache.model_name(llm), prompt, text, cached=True, chunks=len(docs))
+        return text
+    with metrics.span("llm", chunks=len(docs)):
+        response = llm.invoke(messages or prompt)
+    text = response.content
+    metrics.record_llm_call(llm_cache.model_name(llm), _prompt_text(prompt, messages), text, response, chunks=len(docs))
+    _store(key, text)
+    return text
+
+
+def parse_questions(text):
+    """Questions from a sub-request; an unusable response counts as no questions."""
+    with metrics.span("parse"):
+        try:
+            return quiz_schema.extract_json(text).get("questions", [])
+        except ValueError:
+            return []
+
+
+def merge_questions(quiz_fields, question_lists):
+    """Reduce step: concatenate partial question lists and renumber question_ids."""
+    questions = [question for part in question_lists for question in part]
+    for i, question in enumerate(questions, start=1):
+        question["question_id"] = i
+    return {**quiz_fields, "questions": questions}
+
+
+def generate_questions(llm, vector_store, sizes, description, instructions="", on_part=None, fresh=False):
+    """Run one sub-request per entry in sizes concurrently and return their question lists in order.
+
+    instructions is either one string for every sub-request or a list with
+    one string per sub-request. on_part(questions) is called from the
+    calling thread as each sub-request finishes, so a preview can show
+    parts before the whole quiz is done.
+    """
+    contexts = retrieve_contexts(vector_store, description, len(sizes))
+    if isinstance(instructions, str):
+        instructions = [instructions] * len(sizes)
+
+    def generate_part(i):
+        prompt = questions_prompt(format_docs(contexts[i]), sizes[i], description, i + 1, len(sizes), instructions[i])
+        return parse_questions(invoke_cached(llm, prompt, contexts[i], fresh))
+
+    question_lists = [None] * len(sizes)
+    with ThreadPoolExecutor(max_workers=min(GEN_MAX_CONCURRENCY, len(sizes))) as executor:
+        # copy_context: spans recorded on the worker threads belong to the caller's trace
+        futures = {executor.submit(contextvars.copy_context().run, generate_part, i): i for i in range(len(sizes))}
+        for future in as_completed(futures):
+            question_lists[futures[future]] = future.result()
+            if on_part:
+                on_part(question_lists[futures[future]])
+    return question_lists
+
+
+def generate_quiz_parallel(llm, vector_store, num_questions, quiz_fields, description, instructions="", on_part=None, fresh=False):
+    """Generate a quiz with concurrent sub-requests and merge them into one quiz dict."""
+    question_lists = generate_questions(
+        llm, vector_store, split_count(num_questions), description, instructions, on_part, fresh
+    )
+    return merge_questions(quiz_fields, question_lists)
+
+
+def complete_quiz(llm, vector_store, data, quiz_fields, num_questions, description):
+    """Validate a generated quiz and ask again only for the invalid or missing questions.
+
+    Returns (quiz, errors): errors lists the problems found in the first
+    attempt. Questions that are still invalid after the retry are dropped.
+    """
+    quiz, errors = quiz_schema.normalize_quiz(data, quiz_fields)
+    questions = quiz["questions"][:num_questions]
+    bad = [i for i, _ in errors if i < num_questions]
+    missing = num_questions - len(questions)
+
+    replacements = []
+    if (bad or missing) and vector_store is not None:
+        problems = "\n".join(f"- {message}" for _, message in errors) or "- some questions were missing"
+        instructions = f"A previous attempt had these problems, avoid them:\n{problems}\n"
+        # fresh: a retry must not get the same cached response back
+        new_lists = generate_questions(
+            llm, vector_store, split_count(len(bad) + missing), description, instructions, fresh=True
+        )
+        new_questions, new_errors = quiz_schema.validate_questions([q for part in new_lists for q in part])
+        invalid = {i for i, _ in new_errors}
+        replacements = [q for i, q in enumerate(new_questions) if i not in invalid]
+
+    # Swap replacements in for the invalid questions, then fill in missing ones
+    for i in bad:
+        questions[i] = replacements.pop(0) if replacements else None
+    questions.extend(replacements[:missing])
+    quiz = merge_questions(quiz, [[q for q in questions if q is not None]])
+    return quiz, errors
+
+
+def finalize_quiz(llm, vector_store, data, quiz_fields, num_questions, description):
+    """complete_quiz for the pages. Returns (quiz, warning) with warning None if nothing had to change.
+
+    Without a vector store nothing is regenerated, and the warning says so.
+    """
+    quiz, errors = complete_quiz(llm, vector_store, data, quiz_fields, num_questions, description)
+    # Questions past the requested count are cut anyway
+    problems = [message for i, message in errors if i < num_questions]
+    short = num_questions - len(quiz["questions"])
+    if not problems and short <= 0:
+        return quiz, None
+
+    details = ": " + "; ".join(problems) if problems else ""
+    if vector_store is None:
+        warning = f"{len(problems)} invalid question(s) were removed{details}." if problems else ""
+        if short > 0:
+            warning += (
+                f" The quiz has {len(quiz['questions'])} of {num_questions} questions; no document index is loaded "
+                "to generate the rest, upload the document again."
+            )
+        return quiz, warning.strip()
+
+    warning = f"{len(problems)} invalid question(s) were regenerated{details}." if problems else ""
+    if short > 0:
+        warning += f" {short} question(s) could not be generated and were left out."
+    return quiz, warning.strip()
+
+
+def replace_questions(llm, vector_store, quiz, indices, description, feedback=""):
+    """Regenerate only the questions at indices, concurrently, keeping the rest verbatim.
+
+    Returns (quiz, failed) where failed lists the indices whose replacement
+    was invalid; those questions are left unchanged.
+    """
+    instructions = [
+        f"This question replaces one the teacher rejected: {quiz['questions'][i].get('question', '')!r}. "
+        f"Write a different question. Teacher feedback: {feedback or 'none'}\n"
+        for i in indices
+    ]
+    new_lists = generate_questions(llm, vector_store, [1] * len(indices), description, instructions, fresh=True)
+
+    questions = list(quiz["questions"])
+    failed = []
+    for i, new_questions in zip(indices, new_lists):
+        checked, errors = quiz_schema.validate_questions(new_questions[:1])
+        if not checked or errors:
+            failed.append(i)
+            continue
+        questions[i] = {**checked[0], "question_id": questions[i].get("question_id", i + 1)}
+    return {**quiz, "questions": questions}, failed
+
+
+# Same system prompt RetrievalQA's "stuff" chain uses for chat models
+STUFF_SYSTEM_PROMPT = """Use the following pieces of context to answer the user's question. 
+If you don't know the answer, just say that you don't know, don't try to make up an answer.
+----------------
+{context}"""
+
+
+def stuff_messages(prompt, docs):
+    return [
+        ("system", STUFF_SYSTEM_PROMPT.format(context=format_docs(docs))),
+        ("human", prompt),
+    ]
+
+
+def _retrieve(retriever, prompt):
+    with metrics.span("retrieve", k=retriever.search_kwargs.get("k", CHUNKS_PER_CALL)) as entry:
+        docs = retriever.invoke(prompt)
+        entry["chunks"] = len(docs)
+    return docs
+
+
+def generate_quiz(llm, retriever, prompt, fresh=False):
+    """Single-call quiz generation (same retrieval and prompt as RetrievalQA "stuff"), through the response cache."""
+    docs = _retrieve(retriever, prompt)
+    return invoke_cached(llm, prompt, docs, fresh, stuff_messages(prompt, docs))
+
+
+def stream_quiz(llm, retriever, prompt, fresh=False):
+    """Stream a single-call quiz completion; yields text pieces as they arrive.
+
+    A cached response is yielded in one piece.
+    """
+    docs = _retrieve(retriever, prompt)
+    key = _response_key(llm, prompt, docs)
+    cached = _lookup(key, fresh)
+    if cached is not None:
+        metrics.record_llm_call(llm_cache.model_name(llm), prompt, cached, cached=True, chunks=len(docs))
+        yield cached
+        return
+
+    messages = stuff_messages(prompt, docs)
+    text = ""
+    with metrics.span("llm", chunks=len(docs), streamed=True):
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                text += chunk.content
+                yield chunk.content
+    # Streamed responses carry no usage data, so the tokens are estimated
+    metrics.record_llm_call(llm_cache.model_name(llm), _prompt_text(prompt, messages), text, chunks=len(docs))
+    _store(key, text)
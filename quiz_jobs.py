@@ -0,0 +1,287 @@
+"""Background quiz generation jobs.
+
+Generation (PDF extraction, embedding, FAISS build and the LLM calls) runs
+in a local process pool instead of the Streamlit script thread. Jobs and
+their results are stored in the quiz_jobs collection, and uploads in
+GridFS, so a teacher can navigate away or reload the page and pick the
+result up later. Throughput is limited by QUIZ_JOB_WORKERS.
+
+A worker claims a job atomically and holds a lease on it, renewed while
+it runs. Only jobs whose lease has run out (their worker died with its
+server) are picked up again, and a worker that lost its lease never
+writes its result over the new owner's. Listing jobs (which the Background
+Jobs panel does while it polls) also sweeps for claimable jobs, so jobs left
+behind by a restarted server, or by a crashed worker, are run again without
+waiting for a new submission. Submitting the same upload with
+the same settings while an identical job is still unfinished returns
+that job instead of queueing another.
+"""
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import uuid
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+import gridfs
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import resources
+
+# Number of generation worker processes (override in the .env file)
+QUIZ_JOB_WORKERS = int(os.getenv("QUIZ_JOB_WORKERS", "2"))
+# A running job whose worker hasn't renewed its lease for this long is assumed lost and run again
+QUIZ_JOB_LEASE_SECONDS = int(os.getenv("QUIZ_JOB_LEASE_SECONDS", "120"))
+# How often the Background Jobs panel refreshes while a job is unfinished
+QUIZ_JOB_POLL_SECONDS = float(os.getenv("QUIZ_JOB_POLL_SECONDS", "5"))
+
+UNFINISHED = ("queued", "running")
+
+_executor = None
+_executor_lock = threading.Lock()
+# Futures of the jobs this process has handed to the pool, so a sweep doesn't queue them again
+_submitted = {}
+_last_sweep = 0.0
+
+
+def _collections():
+    quiz_db = resources.get_mongo_client()["quiz-db"]
+    return quiz_db["quiz_jobs"], gridfs.GridFS(quiz_db, collection="quiz_job_files")
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: don't fork a threaded server process with open Mongo sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=QUIZ_JOB_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+
+def _discard_executor(executor):
+    """Drop a pool whose worker died, so the next submission starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(job_id):
+    """Hand a job to the pool, replacing the pool if it is broken."""
+    executor = _get_executor()
+    try:
+        future = executor.submit(run_job, job_id)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        executor = _get_executor()
+        future = executor.submit(run_job, job_id)
+    _submitted[job_id] = future
+    future.add_done_callback(lambda f: _job_done(executor, job_id, f))
+
+
+def _job_done(executor, job_id, future):
+    _submitted.pop(job_id, None)
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        # The job stays "running" until its lease runs out, then a sweep runs it on a new pool
+        _discard_executor(executor)
+
+
+def _claimable(now):
+    """Filter for jobs a worker may take: queued, or running under an expired lease."""
+    return {"$or": [
+        {"status": "queued"},
+        {"status": "running", "lease_until": {"$lt": now}},
+        # Started before jobs had leases
+        {"status": "running", "lease_until": None, "started_at": {"$lt": now - timedelta(seconds=QUIZ_JOB_LEASE_SECONDS)}},
+    ]}
+
+
+def _resume_pending():
+    """Queue claimable jobs (left behind by a restart or a dead worker) not already queued here.
+
+    Runs at most once every QUIZ_JOB_POLL_SECONDS; claiming is atomic, so
+    two server processes queueing the same job is harmless.
+    """
+    global _last_sweep
+    if time.monotonic() - _last_sweep < QUIZ_JOB_POLL_SECONDS:
+        return
+    _last_sweep = time.monotonic()
+    jobs, _ = _collections()
+    for job in jobs.find(_claimable(datetime.now(timezone.utc)), {"_id": 1}):
+        job_id = str(job["_id"])
+        future = _submitted.get(job_id)
+        if future is None or future.done():
+            _submit(job_id)
+
+
+def _request_key(teacher_name, pdf_bytes, params):
+    """Identifies a submission, so a repeated click doesn't queue the same job twice."""
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(json.dumps([teacher_name, params], sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def submit_job(teacher_name, pdf_bytes, filename, params):
+    """Queue a generation job and return its ID.
+
+    params holds quiz_fields, num_questions, description, prompt and fresh.
+    If the same job is already queued or running, its ID is returned instead.
+    """
+    jobs, files = _collections()
+    active_key = _request_key(teacher_name, pdf_bytes, params)
+    existing = jobs.find_one({"active_key": active_key}, {"_id": 1})
+    if existing:
+        return str(existing["_id"])
+
+    file_id = files.put(pdf_bytes, filename=filename)
+    try:
+        job_id = jobs.insert_one({
+            "teacher_name": teacher_name,
+            "status": "queued",
+            "active_key": active_key,  # Unique while the job is unfinished, removed when it ends
+            "filename": filename,
+            "file_id": file_id,
+            "params": params,
+            "created_at": datetime.now(timezone.utc),
+        }).inserted_id
+    except DuplicateKeyError:
+        # A concurrent submission of the same job got there first
+        files.delete(file_id)
+        return str(jobs.find_one({"active_key": active_key}, {"_id": 1})["_id"])
+    _submit(str(job_id))
+    return str(job_id)
+
+
+def get_job(job_id):
+    jobs, _ = _collections()
+    return jobs.find_one({"_id": ObjectId(job_id)}, {"file_id": 0})
+
+
+def list_jobs(teacher_name, limit=10):
+    """Most recent jobs of a teacher, without their results. Also queues any jobs that need resuming."""
+    _resume_pending()
+    jobs, _ = _collections()
+    return list(
+        jobs.find({"teacher_name": teacher_name}, {"result": 0, "file_id": 0, "params.prompt": 0, "active_key": 0})
+        .sort("created_at", -1)
+        .limit(limit)
+    )
+
+
+def run_job(job_id):
+    """Worker entry point: build (or load) the index, generate and validate the quiz, store the result."""
+    import index_cache
+    import metrics
+    import pdf_extract
+    import quiz_gen
+    import quiz_schema
+
+    jobs, files = _collections()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    job = _claim(jobs, job_id, owner)
+    if job is None:
+        return
+    lease = _Lease(jobs, job["_id"], owner)
+    lease.start()
+
+    try:
+        params = job["params"]
+        llm = resources.get_llm("gpt-4")
+        embeddings = resources.get_embeddings()
+        pdf_bytes = files.get(job["file_id"]).read()
+
+        with metrics.trace(
+            "quiz_job", teacher=job["teacher_name"], course_id=params["quiz_fields"].get("course_id"),
+            num_questions=params["num_questions"], job_id=str(job["_id"]),
+        ):
+            vector_store, _ = index_cache.get_or_build_index(
+                pdf_bytes, embeddings,
+                lambda: metrics.timed_iter("pdf_extract", pdf_extract.iter_pdf_pages(pdf_bytes, job["filename"])),
+            )
+            if vector_store is None:
+                raise ValueError("Failed to extract content from the uploaded document.")
+
+            if params["num_questions"] > quiz_gen.QUESTIONS_PER_CALL:
+                data = quiz_gen.generate_quiz_parallel(
+                    llm, vector_store, params["num_questions"], params["quiz_fields"], params["description"],
+                    fresh=params.get("fresh", False),
+                )
+            else:
+                text = quiz_gen.generate_quiz(llm, vector_store.as_retriever(), params["prompt"], params.get("fresh", False))
+                data = quiz_schema.extract_json(text)
+
+            quiz, problems = quiz_gen.complete_quiz(
+                llm, vector_store, data, params["quiz_fields"], params["num_questions"], params["description"]
+            )
+        outcome = {
+            "status": "done",
+            "result": quiz,
+            "index_key": index_cache.index_key(pdf_bytes, embeddings),
+            "repaired_questions": len(problems),
+        }
+    except Exception as e:
+        outcome = {"status": "failed", "error": str(e)}
+    finally:
+        lease.stop()
+
+    _finish(jobs, files, job, owner, outcome)
+
+
+def _claim(jobs, job_id, owner):
+    """Take a job for this worker so it never runs on two at once. Returns the job, or None if it isn't claimable."""
+    now = datetime.now(timezone.utc)
+    return jobs.find_one_and_update(
+        {"_id": ObjectId(job_id), **_claimable(now)},
+        {
+            "$set": {
+                "status": "running", "owner": owner, "started_at": now,
+                "lease_until": now + timedelta(seconds=QUIZ_JOB_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+    )
+
+
+def _finish(jobs, files, job, owner, outcome):
+    """Store a job's outcome, unless another worker has taken the job over (it will store its own)."""
+    finished = jobs.update_one(
+        {"_id": job["_id"], "owner": owner},
+        {"$set": {**outcome, "finished_at": datetime.now(timezone.utc)}, "$unset": {"active_key": ""}},
+    )
+    if finished.matched_count:
+        # The upload is only needed while the job runs
+        files.delete(job["file_id"])
+    return bool(finished.matched_count)
+
+
+class _Lease(threading.Thread):
+    """Renews a running job's lease until stopped, or until another worker has taken the job over."""
+
+    def __init__(self, jobs, job_id, owner):
+        super().__init__(daemon=True)
+        self.jobs, self.job_id, self.owner = jobs, job_id, owner
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(QUIZ_JOB_LEASE_SECONDS / 3):
+            renewed = self.jobs.update_one(
+                {"_id": self.job_id, "owner": self.owner, "status": "running"},
+                {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=QUIZ_JOB_LEASE_SECONDS)}},
+            )
+            if not renewed.matched_count:
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
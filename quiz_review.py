@@ -0,0 +1,52 @@
+"""Quiz review widgets shared by the quiz generation pages.
+
+The generated quiz lives in st.session_state["generated_quiz"] and the
+retriever of its document in st.session_state["retriever"], so the
+teacher can replace single questions across reruns.
+"""
+import streamlit as st
+
+import quiz_gen
+
+
+def finalize_quiz(llm, data, quiz_fields, num_questions, description):
+    """Validate a generated quiz locally, asking the model again only for invalid questions."""
+    retriever = st.session_state.get("retriever")
+    vector_store = retriever.vectorstore if retriever is not None else None
+    quiz, warning = quiz_gen.finalize_quiz(llm, vector_store, data, quiz_fields, num_questions, description)
+    if warning:
+        st.warning(warning)
+    return quiz
+
+
+def review_questions(llm, description):
+    """Show the generated quiz's questions and regenerate the ones the teacher marks for replacement."""
+    if "generated_quiz" not in st.session_state:
+        return
+    quiz = st.session_state["generated_quiz"]
+    version = st.session_state.get("quiz_version", 0)  # Resets the checkboxes after a regeneration
+    st.subheader("🔍 Review Questions")
+    replace = []
+    for i, question in enumerate(quiz["questions"]):
+        with st.expander(f"Q{question.get('question_id', i + 1)}. {question.get('question', '')}"):
+            for option in question.get("options", []):
+                st.write(("✅ " if option.get("is_correct") else "▫️ ") + str(option.get("option_text", "")))
+        if st.checkbox("Replace this question", key=f"replace_{version}_{i}"):
+            replace.append(i)
+
+    if not replace:
+        return
+    question_feedback = st.text_area("What should change in the selected questions?", key=f"question_feedback_{version}")
+    if st.button(f"🔄 Regenerate {len(replace)} Selected Question(s)"):
+        retriever = st.session_state.get("retriever")
+        if retriever is None:
+            st.error("Retriever is not initialized. Please upload a document and generate a quiz first.")
+            return
+        st.info("Regenerating selected questions, please wait...")
+        quiz, failed = quiz_gen.replace_questions(llm, retriever.vectorstore, quiz, replace, description, question_feedback)
+        st.session_state["generated_quiz"] = quiz
+        st.session_state["quiz_version"] = version + 1
+        if failed:
+            st.warning(f"{len(failed)} question(s) could not be regenerated and were kept as they were.")
+        else:
+            st.rerun()
@@ -0,0 +1,161 @@
+"""Shared quiz schema plus local extraction and repair of LLM quiz output.
+
+The models match the JSON structure the quiz prompts ask for. Common
+syntax problems (code fences, stray text, trailing commas, Python
+literals) are fixed locally, and each question is validated on its own
+so only the broken ones need to be asked for again.
+"""
+import json
+import re
+from typing import List, Optional
+
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from json_stream import QuestionStreamParser
+
+
+# Validation Models
+class OptionModel(BaseModel):
+    option_text: str
+    is_correct: bool
+
+
+class QuestionModel(BaseModel):
+    question_id: int
+    # Older prompts asked for "question_text"
+    question: str = Field(validation_alias=AliasChoices("question", "question_text"))
+    options: List[OptionModel]
+
+    @field_validator("question")
+    @classmethod
+    def question_not_empty(cls, question):
+        if not question.strip():
+            raise ValueError("question text is empty")
+        return question
+
+    @field_validator("options")
+    @classmethod
+    def exactly_one_correct(cls, options):
+        if len(options) < 2:
+            raise ValueError("a question needs at least 2 options")
+        correct = sum(option.is_correct for option in options)
+        if correct != 1:
+            raise ValueError(f"exactly one option must be correct, found {correct}")
+        return options
+
+
+class QuizModel(BaseModel):
+    # Pages add their own fields (e.g. src_doc), keep them
+    model_config = ConfigDict(extra="allow")
+
+    quiz_id: str
+    title: str = ""
+    desc: str = ""
+    subject: str = ""
+    course_id: Optional[str] = None
+    questions: List[QuestionModel]
+
+    @field_validator("quiz_id", "course_id", mode="before")
+    @classmethod
+    def id_as_string(cls, value):
+        return value if value is None else str(value)
+
+
+def _repair_syntax(text):
+    # Trailing commas before a closing bracket
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    # Python literals instead of JSON ones
+    text = re.sub(r":\s*True\b", ": true", text)
+    text = re.sub(r":\s*False\b", ": false", text)
+    text = re.sub(r":\s*None\b", ": null", text)
+    # Template placeholder copied verbatim, leave it for the one-correct-option check
+    text = re.sub(r":\s*false or true\b", ": false", text)
+    return text
+
+
+def _extract(text):
+    """(data, complete): complete is False when questions had to be salvaged from broken JSON."""
+    text = text.strip()
+    # Code fences around the JSON
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    # Stray text before or after the object
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1:
+        raise ValueError("No JSON object found in the model output.")
+    candidate = text[start:end + 1] if end > start else text[start:]
+
+    for attempt in (candidate, _repair_syntax(candidate)):
+        try:
+            data = json.loads(attempt)
+            if isinstance(data, dict):
+                return data, True
+        except json.JSONDecodeError:
+            pass
+
+    questions = QuestionStreamParser().feed(_repair_syntax(text[start:]))
+    if not questions:
+        raise ValueError("The model output is not valid JSON and no complete questions could be recovered.")
+    return {"questions": questions}, False
+
+
+def extract_json(text):
+    """Extract the quiz object from raw model output, repairing common syntax problems.
+
+    If the document is still not valid JSON (e.g. the output was cut off),
+    the complete questions are salvaged and returned as {"questions": [...]}.
+    Raises ValueError if nothing usable is found.
+    """
+    return _extract(text)[0]
+
+
+def is_valid_output(text):
+    """Whether model output is a whole JSON object with at least one question, all of them valid.
+
+    Only such responses are worth caching: anything else would be replayed on every retry.
+    """
+    try:
+        data, complete = _extract(text)
+    except ValueError:
+        return False
+    questions = data.get("questions")
+    if not complete or not isinstance(questions, list) or not questions:
+        return False
+    return not validate_questions(questions)[1]
+
+
+def validate_questions(questions):
+    """Validate each question on its own.
+
+    Returns (questions, errors) where questions are normalized dicts (invalid
+    ones are left as they came) and errors is a list of (index, message).
+    """
+    checked, errors = [], []
+    for i, question in enumerate(questions):
+        try:
+            if isinstance(question, dict):
+                question = {"question_id": i + 1, **question}
+            checked.append(QuestionModel.model_validate(question).model_dump())
+        except ValidationError as e:
+            checked.append(question)
+            errors.append((i, "; ".join(error["msg"] for error in e.errors())))
+    return checked, errors
+
+
+def normalize_quiz(data, quiz_fields):
+    """Fill the quiz fields we already know and validate its questions.
+
+    Returns (quiz, errors) with errors as in validate_questions.
+    """
+    fields = {**quiz_fields}
+    # Keep a title the model came up with if we didn't set one
+    if not fields.get("title") and data.get("title"):
+        fields["title"] = data["title"]
+    quiz = QuizModel.model_validate({**fields, "questions": []}).model_dump(exclude_none=True)
+
+    questions = data.get("questions")
+    if not isinstance(questions, list):
+        questions = []
+    quiz["questions"], errors = validate_questions(questions)
+    return quiz, errors
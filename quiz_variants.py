@@ -0,0 +1,38 @@
+"""Per-student quiz variants for anti-cheating.
+
+One pool of questions is generated for a course (with concurrent LLM
+calls against a single index), then every enrolled student gets their
+own sample of the pool with shuffled options. Variants are assembled
+locally and written with one insert_many, so the cost scales with the
+pool size rather than the class size.
+"""
+import copy
+import random
+
+
+def get_roster(enroll_collection, students_collection, course_id):
+    """Student IDs enrolled in a course, from the course's enroll_stud collection and master_db.students."""
+    student_ids = set(enroll_collection.distinct("student_id"))
+    student_ids.update(students_collection.distinct("student_id", {"enrolled_courses": course_id}))
+    return sorted(student_ids)
+
+
+def make_variant(quiz_fields, pool, student_id, num_questions, seed=""):
+    """Sample num_questions from the pool and shuffle their options, reproducibly per student."""
+    rng = random.Random(f"{seed}:{quiz_fields['quiz_id']}:{student_id}")
+    questions = copy.deepcopy(rng.sample(pool, min(num_questions, len(pool))))
+    for i, question in enumerate(questions, start=1):
+        question["question_id"] = i
+        rng.shuffle(question["options"])
+    return {**quiz_fields, "student_id": student_id, "questions": questions}
+
+
+def build_variants(quiz_fields, pool, student_ids, num_questions, seed=""):
+    return [make_variant(quiz_fields, pool, student_id, num_questions, seed) for student_id in student_ids]
+
+
+def post_variants(quiz_collection, variants):
+    """Write all variants in one round-trip. Returns the number inserted."""
+    if not variants:
+        return 0
+    return len(quiz_collection.insert_many(variants, ordered=False).inserted_ids)
@@ -1,56 +1,28 @@
 import streamlit as st
-import os
-import tempfile
+import resources
+import course_store
 from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
 from langchain.chains import RetrievalQA
-from pydantic import BaseModel, ValidationError
-from typing import List
-import json
-from pymongo import MongoClient
+import embedding_cache
+import index_cache
+import quiz_gen
+import quiz_schema
+import pdf_extract
 
 # Load environment variables
 load_dotenv()
 
-# Initialize MongoDB client
-db_client = MongoClient(os.getenv("MONGO_URI"))
+# Initialize MongoDB client (shared across reruns)
+try:
+    db_client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
+    st.stop()
 db = db_client["quiz-cluster"]
 
-# Initialize LLM
-llm = ChatOpenAI(model="gpt-4", api_key=os.getenv("OPENAI_API_KEY"))
-
-# Embeddings
-from langchain.embeddings.openai import OpenAIEmbeddings
-embeddings = OpenAIEmbeddings()
-
-# Validation Models
-class OptionModel(BaseModel):
-    option_text: str
-    is_correct: bool
-
-class QuestionModel(BaseModel):
-    question_id: int
-    question_text: str
-    options: List[OptionModel]
-
-class QuizModel(BaseModel):
-    quiz_id: int
-    title: str
-    description: str
-    source_document: str
-    questions: List[QuestionModel]
-
-def validate_quiz_response(response: dict) -> int:
-    try:
-        quiz = QuizModel(**response)
-        print("Validation successful!")
-        return 0
-    except ValidationError as e:
-        print("Validation error:", e.json())
-        return 1
+# Initialize LLM and embeddings (shared across reruns)
+llm = resources.get_llm("gpt-4")
+embeddings = resources.get_embeddings()
 
 # Utility to format document content
 def format_docs(docs):
@@ -72,25 +44,25 @@ def generate_quiz_page():
     if st.button("Generate Quiz"):
 
         if quiz_file:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(quiz_file.read())
-                temp_file_path = temp_file.name
+            pdf_bytes = quiz_file.getvalue()
+
+            def load_docs():
+                # Extract pages in memory, streaming them into the splitter
+                return pdf_extract.iter_pdf_pages(pdf_bytes, quiz_file.name)
 
             try:
-                # Load and split the document
-                loader = PyPDFLoader(temp_file_path)
-                docs = loader.load()
+                # Load, split and index the document (reused from the index cache on repeat uploads)
+                with embedding_cache.track_stats() as embed_stats:
+                    vector_store, cache_hit = index_cache.get_or_build_index(pdf_bytes, embeddings, load_docs)
 
-                if not docs:
+                if vector_store is None:
                     st.error("Failed to extract content from the uploaded document. Please try another file.")
                     return
+                if cache_hit:
+                    st.caption("Reusing the cached index for this document.")
+                elif isinstance(embeddings, embedding_cache.CachedEmbeddings):
+                    st.caption(f"Embedding cache: {embed_stats['hits']} chunks reused, {embed_stats['misses']} embedded.")
 
-                # Chunking 
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                splits = text_splitter.split_documents(docs)
-
-                # Vector Store - FAISS
-                vector_store = FAISS.from_documents(splits, embeddings)
                 retriever = vector_store.as_retriever()
 
                 # Prompt
@@ -138,14 +110,27 @@ Ensure the questions are relevant to the content of the uploaded document and sh
 
                 if result:
                     st.write("Quiz generated successfully!")
-                    result_to_send = json.loads(result['result'].strip())
+                    # Repair and validate locally, asking again only for invalid questions
+                    quiz_fields = {
+                        "quiz_id": test_id,
+                        "title": "",
+                        "desc": test_description,
+                        "subject": subject_name,
+                        "src_doc": "Uploaded Document",
+                    }
+                    data = quiz_schema.extract_json(result['result'])
+                    result_to_send, warning = quiz_gen.finalize_quiz(
+                        llm, vector_store, data, quiz_fields, num_questions, test_description
+                    )
+                    if warning:
+                        st.warning(warning)
                     st.json(result_to_send)
 
-                    # Check if the subject name matches a database name
-                    if subject_name in db_client.list_database_names():
-                        subject_db = db_client[subject_name]  # Access the subject-specific database
-                        subject_db["quiz"].insert_one(result_to_send)  # Store in "quiz" collection
-                        st.success(f"Quiz successfully stored in the 'quiz' collection of the '{subject_name}' database!")
+                    # Look up the course by subject name (a course ID, name or legacy database name)
+                    course = course_store.find_course(db_client["quiz-db"]["courses"], subject_name)
+                    if course:
+                        course_store.get_collection(db_client, course, "quiz").insert_one(result_to_send)  # Store in the course's "quiz" collection
+                        st.success(f"Quiz successfully stored in the '{course['course_name']}' course!")
                     else:
                         st.warning("Subject name not found in the database. Quiz not stored.")
 
@@ -0,0 +1,130 @@
+"""Process-wide registry for the MongoDB, LLM and embeddings clients.
+
+Streamlit re-runs every page script on each interaction, so clients built
+at the top of a script are rebuilt (and Mongo connection pools reopened)
+on every rerun. Pages get their clients from here instead, which creates
+each one once per process and closes them on shutdown.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+# Load environment variables
+load_dotenv()
+
+# Connection pool sizing (override in the .env file)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_resources = {}
+
+
+def _get_or_create(name, factory):
+    with _lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def get_mongo_client():
+    """Shared MongoClient for this process.
+
+    Raises RuntimeError if MONGO_URI is not set or the schema migration fails:
+    writes rely on its unique indexes, so no client is handed out until they
+    exist. The next call tries again.
+    """
+    def create():
+        uri = os.getenv("MONGO_URI")
+        if not uri:
+            raise RuntimeError("MongoDB connection string not found. Please set it in the .env file.")
+        client = MongoClient(
+            uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
+        # Make sure indexes exist before the first query (set MONGO_AUTO_MIGRATE=0 to skip)
+        if os.getenv("MONGO_AUTO_MIGRATE", "1") != "0":
+            import db_indexes
+            try:
+                db_indexes.migrate(client)
+            except Exception as e:
+                logger.exception("Schema migration failed")
+                client.close()
+                raise RuntimeError(
+                    f"Database schema migration failed ({e}). Run 'python db_indexes.py migrate' to see the error."
+                ) from e
+        return client
+    return _get_or_create("mongo", create)
+
+
+def get_llm(model="gpt-4"):
+    """Shared chat model client."""
+    def create():
+        from langchain.chat_models import ChatOpenAI
+        return ChatOpenAI(model=model, api_key=os.getenv("OPENAI_API_KEY"))
+    return _get_or_create(f"llm:{model}", create)
+
+
+def get_embeddings():
+    """Shared embeddings client for the EMBEDDINGS_BACKEND (see embedding_backends.py)."""
+    def create():
+        import embedding_backends
+        return embedding_backends.create_embeddings()
+    return _get_or_create("embeddings", create)
+
+
+def check_health():
+    """Ping each live resource. Returns a dict of name -> (ok, error message)."""
+    with _lock:
+        resources = dict(_resources)
+
+    status = {}
+    for name, resource in resources.items():
+        if name == "mongo":
+            try:
+                resource.admin.command("ping")
+                status[name] = (True, "")
+            except Exception as e:
+                status[name] = (False, str(e))
+        else:
+            # API clients connect lazily per request, nothing to ping
+            status[name] = (True, "")
+    return status
+
+
+def reset(name):
+    """Close and drop a resource so the next call recreates it (e.g. after a failed health check)."""
+    with _lock:
+        resource = _resources.pop(name, None)
+    if resource is not None and hasattr(resource, "close"):
+        resource.close()
+
+
+def close_all():
+    """Close every resource. Registered to run at interpreter shutdown."""
+    with _lock:
+        names = list(_resources)
+    for name in names:
+        try:
+            reset(name)
+        except Exception:
+            pass
+
+
+atexit.register(close_all)
+
+
+if __name__ == "__main__":
+    # Quick connectivity check: python resources.py
+    get_mongo_client()
+    for name, (ok, error) in check_health().items():
+        print(f"{name}: {'ok' if ok else 'FAILED ' + error}")
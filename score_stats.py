@@ -0,0 +1,147 @@
+"""Quiz score statistics.
+
+The Visualization page only needs a handful of numbers and a histogram.
+Each quiz has a small quiz_stats document (count, running sum and sum of
+squares, fixed-bin histogram, min, max) that is updated whenever a score
+is written, so the dashboard reads one document regardless of class size.
+rebuild_quiz_stats recomputes that document from the raw test_scores
+rows; the percentile and score-list views still query test_scores
+directly.
+
+Rebuild from the command line:
+    python score_stats.py rebuild <course_id> [quiz_id ...]
+"""
+import math
+import os
+import sys
+from datetime import datetime, timezone
+
+# Width of a histogram bin in score points (override in the .env file)
+HIST_BIN_WIDTH = float(os.getenv("HIST_BIN_WIDTH", "10"))
+
+
+def score_percentiles(scores_collection, quiz_id, buckets=10):
+    """Equal-count buckets (deciles by default) as a list of {"min", "max", "count"}."""
+    return [
+        {"min": bucket["_id"]["min"], "max": bucket["_id"]["max"], "count": bucket["count"]}
+        for bucket in scores_collection.aggregate([
+            {"$match": {"quiz_id": quiz_id}},
+            {"$bucketAuto": {"groupBy": "$score", "buckets": buckets, "output": {"count": {"$sum": 1}}}},
+        ])
+    ]
+
+
+def score_page(scores_collection, quiz_id, page, page_size=50):
+    """One page of per-student scores, highest first (page numbers start at 1)."""
+    return list(
+        scores_collection.find({"quiz_id": quiz_id}, {"_id": 0, "student_id": 1, "score": 1})
+        .sort([("score", -1), ("student_id", 1)])
+        .skip((page - 1) * page_size)
+        .limit(page_size)
+    )
+
+
+def _bin(score, bin_width):
+    return str(math.floor(score / bin_width))
+
+
+def stats_update(added, removed=(), bin_width=HIST_BIN_WIDTH):
+    """Update document for quiz_stats after adding (and replacing) some scores.
+
+    min/max only ever widen; a rebuild tightens them again after scores are replaced.
+    """
+    inc = {
+        "count": len(added) - len(removed),
+        "sum": sum(added) - sum(removed),
+        "sum_sq": sum(score * score for score in added) - sum(score * score for score in removed),
+    }
+    for score in added:
+        key = f"histogram.{_bin(score, bin_width)}"
+        inc[key] = inc.get(key, 0) + 1
+    for score in removed:
+        key = f"histogram.{_bin(score, bin_width)}"
+        inc[key] = inc.get(key, 0) - 1
+
+    update = {
+        "$inc": inc,
+        "$set": {"bin_width": bin_width, "updated_at": datetime.now(timezone.utc)},
+    }
+    if added:
+        update["$min"] = {"min": min(added)}
+        update["$max"] = {"max": max(added)}
+    return update
+
+
+def rebuild_quiz_stats(scores_collection, stats_collection, quiz_id, bin_width=HIST_BIN_WIDTH):
+    """Recompute a quiz's statistics document from its test_scores rows."""
+    totals = list(scores_collection.aggregate([
+        {"$match": {"quiz_id": quiz_id}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "sum": {"$sum": "$score"},
+            "sum_sq": {"$sum": {"$multiply": ["$score", "$score"]}},
+            "min": {"$min": "$score"},
+            "max": {"$max": "$score"},
+        }},
+        {"$project": {"_id": 0}},
+    ]))
+    bins = scores_collection.aggregate([
+        {"$match": {"quiz_id": quiz_id}},
+        {"$group": {"_id": {"$floor": {"$divide": ["$score", bin_width]}}, "count": {"$sum": 1}}},
+    ])
+
+    stats = totals[0] if totals else {"count": 0, "sum": 0, "sum_sq": 0}
+    stats.update({
+        "quiz_id": quiz_id,
+        "histogram": {str(int(bucket["_id"])): bucket["count"] for bucket in bins},
+        "bin_width": bin_width,
+        "updated_at": datetime.now(timezone.utc),
+    })
+    stats_collection.replace_one({"quiz_id": quiz_id}, stats, upsert=True)
+    return stats
+
+
+def summarize_stats(stats):
+    """Turn a quiz_stats document into the summary and histogram shown on the dashboard.
+
+    Returns ({"count", "mean", "stddev", "min", "max"}, [(bin start, count), ...]),
+    or (None, []) if the quiz has no scores.
+    """
+    if not stats or stats.get("count", 0) <= 0:
+        return None, []
+    count = stats["count"]
+    mean = stats["sum"] / count
+    summary = {
+        "count": count,
+        "mean": mean,
+        "stddev": math.sqrt(max(0.0, stats["sum_sq"] / count - mean * mean)),
+        "min": stats.get("min"),
+        "max": stats.get("max"),
+    }
+    bin_width = stats.get("bin_width", HIST_BIN_WIDTH)
+    histogram = sorted(
+        (int(key) * bin_width, bin_count)
+        for key, bin_count in stats.get("histogram", {}).items()
+        if bin_count > 0
+    )
+    return summary, histogram
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "rebuild":
+        sys.exit("Usage: python score_stats.py rebuild <course_id> [quiz_id ...]")
+
+    import course_store
+    import resources
+
+    client = resources.get_mongo_client()
+    course = client["quiz-db"]["courses"].find_one({"course_id": sys.argv[2]})
+    if course is None:
+        sys.exit(f"Unknown course: {sys.argv[2]}")
+    scores = course_store.get_collection(client, course, "test_scores")
+    stats_collection = course_store.get_collection(client, course, "quiz_stats")
+    quiz_ids = sys.argv[3:] or scores.distinct("quiz_id")
+    for quiz_id in quiz_ids:
+        stats = rebuild_quiz_stats(scores, stats_collection, quiz_id)
+        print(f"{quiz_id}: {stats['count']} scores")
@@ -0,0 +1,212 @@
+"""Signed session tokens and rate-limited password checks.
+
+A successful login issues a token holding the user's profile (username,
+name, role and course IDs) and an expiry time, signed with HMAC-SHA256
+using SESSION_SECRET from the .env file. The app refuses to start
+without it: the cookie key in config.yaml is committed, so anyone could
+sign tokens with it.
+
+The token is kept in the page URL (query parameter named after the
+cookie), so a browser refresh restores the session from the token alone,
+without a database read. Because URLs end up in browser history,
+Referer headers and shared links, the token is short-lived
+(SESSION_TOKEN_MINUTES) and is replaced with a fresh one while the
+session is in use, so a leaked URL stops working soon after.
+
+bcrypt checks run on a small thread pool (bcrypt releases the GIL) with a
+cap on queued checks, and failed attempts are limited per username, so a
+burst of logins can't tie up the server.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import streamlit as st
+import yaml
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+
+# Password checks running at once, and how many more may wait (override in the .env file)
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "4"))
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", "32"))
+# Failed logins allowed per username within the window
+AUTH_MAX_FAILURES = int(os.getenv("AUTH_MAX_FAILURES", "5"))
+AUTH_WINDOW_SECONDS = int(os.getenv("AUTH_WINDOW_SECONDS", "300"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Lifetime of the token in the URL; it is rotated once a third of it has passed
+SESSION_TOKEN_MINUTES = float(os.getenv("SESSION_TOKEN_MINUTES", "15"))
+
+# Shortest accepted SESSION_SECRET
+MIN_SECRET_LENGTH = 32
+
+
+class LoginError(Exception):
+    """Login refused (wrong credentials, too many attempts or server busy); the message is user-facing."""
+
+
+def _load_cookie_config():
+    """Cookie name from config.yaml and the signing key from SESSION_SECRET. Raises RuntimeError without a usable secret."""
+    with open(CONFIG_PATH) as f:
+        cookie = (yaml.safe_load(f) or {}).get("cookie", {})
+    key = os.getenv("SESSION_SECRET", "")
+    if not key or key == cookie.get("key") or len(key) < MIN_SECRET_LENGTH:
+        raise RuntimeError(
+            f"SESSION_SECRET must be set in the .env file to a random value of at least {MIN_SECRET_LENGTH} "
+            "characters (not the key in config.yaml), e.g. python -c \"import secrets; print(secrets.token_urlsafe(32))\""
+        )
+    return {"name": cookie.get("name", "session"), "key": key}
+
+
+_cookie = _load_cookie_config()
+_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(AUTH_WORKERS + AUTH_MAX_PENDING)
+_failures_lock = threading.Lock()
+_failures = defaultdict(deque)  # username -> times of recent failed logins
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_cookie["key"].encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(profile, minutes=None):
+    """Signed token for a profile dict, valid for minutes (SESSION_TOKEN_MINUTES by default)."""
+    minutes = SESSION_TOKEN_MINUTES if minutes is None else minutes
+    now = time.time()
+    body = {**profile, "iat": int(now), "exp": int(now + minutes * 60)}
+    payload = _b64encode(json.dumps(body, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def _decode(token):
+    """Body of a valid, unexpired token (profile plus iat/exp), or None."""
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        body = json.loads(_b64decode(payload))
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(body, dict) or body.get("exp", 0) < time.time():
+        return None
+    return body
+
+
+def verify_token(token):
+    """Profile stored in a token, or None if it is malformed, tampered with or expired."""
+    body = _decode(token)
+    if body is None:
+        return None
+    return {key: value for key, value in body.items() if key not in ("iat", "exp")}
+
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(BCRYPT_ROUNDS)).decode("ascii")
+
+
+def _is_bcrypt_hash(stored):
+    return isinstance(stored, (bytes, str)) and (stored[:2] in ("$2", b"$2"))
+
+
+def _recent_failures(username, now):
+    attempts = _failures[username]
+    while attempts and now - attempts[0] > AUTH_WINDOW_SECONDS:
+        attempts.popleft()
+    return attempts
+
+
+def check_password(collection, user, password):
+    """Check a password against a user document from collection.
+
+    bcrypt runs on the auth thread pool. Legacy plaintext passwords are
+    compared directly and replaced by a bcrypt hash on success. Raises
+    LoginError if the user is rate limited or the pool is saturated.
+    """
+    username = user["username"]
+    with _failures_lock:
+        if len(_recent_failures(username, time.time())) >= AUTH_MAX_FAILURES:
+            raise LoginError("Too many failed attempts. Please wait a few minutes and try again.")
+
+    stored = user.get("password", "")
+    if _is_bcrypt_hash(stored):
+        if not _slots.acquire(blocking=False):
+            raise LoginError("The server is busy. Please try again in a moment.")
+        try:
+            hashed = stored.encode("ascii") if isinstance(stored, str) else stored
+            ok = _executor.submit(bcrypt.checkpw, password.encode("utf-8"), hashed).result()
+        finally:
+            _slots.release()
+    else:
+        ok = hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8"))
+        if ok:
+            collection.update_one({"_id": user["_id"]}, {"$set": {"password": hash_password(password)}})
+
+    with _failures_lock:
+        if ok:
+            _failures.pop(username, None)
+        else:
+            _recent_failures(username, time.time()).append(time.time())
+    return ok
+
+
+def authenticate(collection, username, password):
+    """The user document for valid credentials, or None. Raises LoginError when rate limited or busy."""
+    user = collection.find_one({"username": username})
+    if user is None or not password:
+        return None
+    return user if check_password(collection, user, password) else None
+
+
+def start_session(profile):
+    """Store the profile in the session and its signed token in the URL."""
+    st.session_state["profile"] = profile
+    st.query_params[_cookie["name"]] = issue_token(profile)
+
+
+def _needs_rotation(token):
+    body = _decode(token) if token else None
+    return body is None or time.time() - body.get("iat", 0) > SESSION_TOKEN_MINUTES * 60 / 3
+
+
+def restore_session():
+    """The logged-in profile, from session state or else from the token in the URL (None if not logged in).
+
+    While the session is in use, the token in the URL is replaced before it expires.
+    """
+    token = st.query_params.get(_cookie["name"])
+    profile = st.session_state.get("profile")
+    if profile is None:
+        profile = verify_token(token) if token else None
+        if profile is None and token:
+            del st.query_params[_cookie["name"]]
+        st.session_state["profile"] = profile
+    if profile is not None and _needs_rotation(token):
+        st.query_params[_cookie["name"]] = issue_token(profile)
+    return profile
+
+
+def update_profile(**changes):
+    """Change fields of the logged-in profile (e.g. course_ids after enrolling) and reissue its token."""
+    profile = st.session_state.get("profile")
+    if profile is not None:
+        start_session({**profile, **changes})
+
+
+def end_session():
+    st.session_state["profile"] = None
+    if _cookie["name"] in st.query_params:
+        del st.query_params[_cookie["name"]]
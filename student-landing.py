@@ -1,27 +1,35 @@
 import streamlit as st
-from pymongo import MongoClient
+import resources
+import course_catalog
+import session_auth
+import quiz_delivery
+import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
-import os
 
 # Load environment variables
 load_dotenv()
 
-# MongoDB connection
-CONNECTION_STRING = os.getenv("MONGO_URI")
-if not CONNECTION_STRING:
-    st.error("MongoDB connection string not found. Please set it in the .env file.")
+# MongoDB connection (shared across reruns)
+try:
+    client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
     st.stop()
 
-client = MongoClient(CONNECTION_STRING)
-
 # Databases and collections
 master_db = client["master_db"]
 students_collection = master_db["students"]
 quiz_db = client["quiz-db"]
 courses_collection = quiz_db["courses"]
 
-# Get student_id from session state
-student_id = st.session_state.get("student_id")
+# Get student_id from session state, or from the signed session token after a browser refresh
+profile = session_auth.restore_session()
+if profile and profile["role"] == "Student":
+    student_id = profile["username"]
+else:
+    profile = None
+    student_id = st.session_state.get("student_id")
 
 if not student_id:
     st.error("You must be logged in to view this page.")
@@ -29,43 +37,36 @@ if not student_id:
 
 def get_enrolled_courses(student_id):
     """Fetch enrolled courses based on course IDs."""
-    student = students_collection.find_one({"student_id": student_id})
-    if not student:
-        return []
-    
-    course_ids = student.get("enrolled_courses", [])
-    courses = []
-    
-    for course_id in course_ids:
-        course = courses_collection.find_one({"course_id": course_id})
-        if course:
-            courses.append((course_id, course["course_name"]))
-    
-    return courses
+    if profile is not None:
+        course_ids = profile["course_ids"]  # Cached in the session token, no database read
+    else:
+        student = students_collection.find_one({"student_id": student_id}, {"_id": 0, "enrolled_courses": 1})
+        if not student:
+            return []
+        course_ids = student.get("enrolled_courses", [])
+    # One catalog lookup for all courses (cached per process, misses fetched with a single $in query)
+    courses = course_catalog.get_courses(courses_collection, course_ids)
+
+    return [(course_id, courses[course_id]["course_name"]) for course_id in course_ids if course_id in courses]
 
 def enroll_in_course(student_id, course_id):
     """Enroll a student in a course using course_id."""
-    course = courses_collection.find_one({"course_id": course_id})
+    course = course_catalog.get_course(courses_collection, course_id)
     if not course:
         return None  # Invalid course ID
-    
-    course_name = course["course_name"]
-    student = students_collection.find_one({"student_id": student_id})
-
-    if not student:
-        students_collection.insert_one({
-            "student_id": student_id,
-            "enrolled_courses": [course_id]
-        })
-    elif course_id not in student["enrolled_courses"]:
-        students_collection.update_one(
-            {"student_id": student_id},
-            {"$push": {"enrolled_courses": course_id}}
-        )
-    else:
+
+    # Atomic upsert: creates the student record if needed, never adds the course twice
+    result = students_collection.update_one(
+        {"student_id": student_id},
+        {"$addToSet": {"enrolled_courses": course_id}},
+        upsert=True,
+    )
+    if result.upserted_id is None and result.modified_count == 0:
         return "already_enrolled"
+    if profile is not None:
+        session_auth.update_profile(course_ids=profile["course_ids"] + [course_id])
 
-    return course_name
+    return course["course_name"]
 
 # Sidebar: Display enrolled courses
 st.sidebar.title("📚 Enrolled Courses")
@@ -76,6 +77,7 @@ if enrolled_courses:
     for course_id, course_name in enrolled_courses:
         if st.sidebar.button(course_name, key=course_id):
             st.session_state["active_course"] = course_name  # Store active course
+            st.session_state["active_course_id"] = course_id
             st.rerun()  # Refresh to show welcome message
 else:
     st.sidebar.write("You are not enrolled in any courses.")
@@ -83,6 +85,53 @@ else:
 # Display welcome message if a course is selected
 if "active_course" in st.session_state:
     st.title(f"Hello, welcome to '{st.session_state['active_course']}' course! 🎓")
+
+    # Quizzes of the active course, served from the in-process quiz cache (answers removed)
+    active_course = course_catalog.get_course(courses_collection, st.session_state.get("active_course_id"))
+    quizzes = quiz_delivery.list_quizzes(client, active_course) if active_course else []
+    if quizzes:
+        st.subheader("📝 Quizzes")
+        quiz_titles = {title: quiz_id for quiz_id, title in quizzes}
+        quiz_id = quiz_titles[st.selectbox("Select Quiz", list(quiz_titles.keys()))]
+        payload = quiz_delivery.get_quiz_payload(client, active_course, quiz_id, student_id)
+
+        if payload is None:
+            st.warning("This quiz is not available to you.")
+        else:
+            quiz = json.loads(payload)
+            with st.form(f"quiz_{quiz_id}"):
+                answers = []
+                for i, question in enumerate(quiz["questions"]):
+                    options = [option["option_text"] for option in question["options"]]
+                    choice = st.radio(
+                        f"Q{i + 1}. {question.get('question', '')}",
+                        range(len(options)),
+                        format_func=lambda j, options=options: options[j],
+                        index=None,
+                        key=f"answer_{quiz_id}_{i}",
+                    )
+                    answers.append(-1 if choice is None else choice)
+                submitted = st.form_submit_button("Submit Quiz")
+
+            if submitted:
+                # Queued for batched grading; the future is kept so a later rerun can show the score
+                st.session_state[f"submission_{quiz_id}"] = quiz_delivery.submissions.submit(
+                    client, active_course, quiz_id, student_id, answers
+                )
+                st.success("✅ Your answers were received.")
+
+            pending = st.session_state.get(f"submission_{quiz_id}")
+            if pending is not None:
+                try:
+                    # Wait briefly right after submitting, so the score can usually be shown at once
+                    result = pending.result(timeout=quiz_delivery.SUBMIT_FLUSH_SECONDS + 3 if submitted else 0)
+                    st.info(f"Score: {result['score']:g}% ({result['correct']}/{result['total']} correct)")
+                except FutureTimeoutError:
+                    st.info("Your score will appear here once grading finishes.")
+                except Exception as e:
+                    st.error(f"Your submission could not be graded: {e}")
+    elif active_course:
+        st.write("No quizzes have been posted to this course yet.")
 else:
     st.title("🎓 Student Dashboard")
     st.write("Select a course from the sidebar to get started.")
@@ -101,6 +150,7 @@ if st.button("Join Course"):
         else:
             st.success(f"Successfully enrolled in {result}!")
             st.session_state["active_course"] = result  # Auto-select the new course
+            st.session_state["active_course_id"] = course_id
             st.rerun()  # Refresh page to update sidebar & welcome message
     else:
         st.error("Please enter a valid course ID.")
@@ -1,28 +1,30 @@
 import streamlit as st
-from pymongo import MongoClient
+import resources
+import course_store
+import session_auth
+import query_cache
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
-import os
-import re  # To sanitize database names
 from streamlit_option_menu import option_menu
 
 # Load environment variables
 load_dotenv()
 
-# MongoDB connection
-CONNECTION_STRING = os.getenv("MONGO_URI")
-if not CONNECTION_STRING:
-    st.error("MongoDB connection string not found. Please set it in the .env file.")
+# MongoDB connection (shared across reruns)
+try:
+    client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
     st.stop()
 
-client = MongoClient(CONNECTION_STRING)
 quiz_db = client["quiz-db"]
 teachers_collection = quiz_db["teacher_meta"]
 courses_collection = quiz_db["courses"]
 
-# Session state for login
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.teacher_name = ""
+# Session state for login (restored from the signed session token after a browser refresh)
+profile = session_auth.restore_session()
+st.session_state.logged_in = bool(profile and profile["role"] == "Teacher")
+st.session_state.teacher_name = profile["name"] if st.session_state.logged_in else ""
 
 # Sidebar Navigation
 with st.sidebar:
@@ -44,14 +46,22 @@ if selected == "🔑 Login":
         password = st.text_input("Password", type="password")
 
         if st.button("Login"):
-            teacher = teachers_collection.find_one({"username": username, "password": password})
-            if teacher:
-                st.session_state.logged_in = True
-                st.session_state.teacher_name = teacher["full_name"]
-                st.success("Login successful! Redirecting to Home...")
-                st.rerun()
+            try:
+                teacher = session_auth.authenticate(teachers_collection, username, password)
+            except session_auth.LoginError as e:
+                st.error(str(e))
             else:
-                st.error("Invalid credentials. Please try again.")
+                if teacher:
+                    session_auth.start_session({
+                        "username": username,
+                        "name": teacher["full_name"],
+                        "role": "Teacher",
+                        "course_ids": courses_collection.distinct("course_id", {"creator_name": teacher["full_name"]}),
+                    })
+                    st.success("Login successful! Redirecting to Home...")
+                    st.rerun()
+                else:
+                    st.error("Invalid credentials. Please try again.")
 
     elif option == "Sign Up":
         full_name = st.text_input("Full Name")
@@ -59,11 +69,16 @@ if selected == "🔑 Login":
         password = st.text_input("Choose a Password", type="password")
 
         if st.button("Sign Up"):
-            if teachers_collection.find_one({"username": username}):
-                st.warning("Username already exists! Choose a different one.")
-            else:
-                teachers_collection.insert_one({"username": username, "password": password, "full_name": full_name})
+            # The unique username index rejects duplicates in the same round-trip as the insert
+            try:
+                teachers_collection.insert_one({
+                    "username": username,
+                    "password": session_auth.hash_password(password),
+                    "full_name": full_name,
+                })
                 st.success("Sign-up successful! Please log in.")
+            except DuplicateKeyError:
+                st.warning("Username already exists! Choose a different one.")
 
 # Home Page - Teacher Dashboard
 if selected == "🏠 Home" and st.session_state.logged_in:
@@ -74,7 +89,9 @@ if selected == "🏠 Home" and st.session_state.logged_in:
     # Fetch courses created by the logged-in teacher
     created_courses = [
         {"course_name": course["course_name"], "course_id": course["course_id"]}
-        for course in courses_collection.find({"creator_name": teacher_name})
+        for course in query_cache.cached(
+            ("courses", teacher_name), lambda: list(courses_collection.find({"creator_name": teacher_name}))
+        )
     ]
 
     # Display created courses with buttons
@@ -93,23 +110,14 @@ if selected == "🏠 Home" and st.session_state.logged_in:
 
     if st.button("Create Course"):
         if new_course_name and new_course_id:
-            if courses_collection.find_one({"course_id": new_course_id}):
+            try:
+                # The unique course_id index rejects duplicate IDs
+                course_store.create_course(client, courses_collection, new_course_id, new_course_name, creator_name)
+            except DuplicateKeyError:
                 st.warning(f"A course with ID '{new_course_id}' already exists.")
             else:
-                sanitized_db_name = re.sub(r"[^a-zA-Z0-9_]", "_", new_course_name.lower())
-                course_data = {
-                    "course_id": new_course_id,
-                    "course_name": new_course_name,
-                    "creator_name": creator_name,
-                    "db_name": sanitized_db_name
-                }
-                courses_collection.insert_one(course_data)
-
-                # Create a new database for the course
-                course_db = client[sanitized_db_name]
-                course_db.create_collection("quiz")
-                course_db.create_collection("test_scores")
-
+                session_auth.update_profile(course_ids=profile["course_ids"] + [new_course_id])
+                query_cache.invalidate("courses", teacher_name)
                 st.success(f"Successfully created the course: {new_course_name}!")
                 st.rerun()
         else:
@@ -117,7 +125,7 @@ if selected == "🏠 Home" and st.session_state.logged_in:
 
     # Logout Button
     if st.button("Logout"):
-        st.session_state.logged_in = False
+        session_auth.end_session()
         st.rerun()
 
 # Handle users who are not logged in and try to access Home
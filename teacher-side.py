@@ -1,20 +1,24 @@
 import streamlit as st
-from pymongo import MongoClient
+import resources
+import course_store
+import session_auth
+import query_cache
+import quiz_delivery
+import metrics
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
-import os
-import re  # To sanitize database names
 from streamlit_option_menu import option_menu
-import tempfile
-from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
-from langchain.chains import RetrievalQA
-from pydantic import BaseModel, ValidationError
-from typing import List
-import json
-from pymongo import MongoClient
+import embedding_cache
+import index_cache
+import pdf_extract
+import quiz_gen
+import quiz_schema
+import quiz_review
+import llm_cache
+import quiz_jobs
+import quiz_variants
+import score_stats
+from json_stream import QuestionStreamParser
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -22,28 +26,45 @@ import matplotlib.pyplot as plt
 # Load environment variables
 load_dotenv()
 
-# MongoDB connection
-CONNECTION_STRING = os.getenv("MONGO_URI")
-if not CONNECTION_STRING:
-    st.error("MongoDB connection string not found. Please set it in the .env file.")
+# MongoDB connection (shared across reruns)
+try:
+    client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
     st.stop()
 
-client = MongoClient(CONNECTION_STRING)
 quiz_db = client["quiz-db"]
 teachers_collection = quiz_db["teacher_meta"]
 courses_collection = quiz_db["courses"]
 
-# Session state for login
-if "logged_in" not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.teacher_name = ""
+
+def get_teacher_courses(teacher_name):
+    """Courses created by a teacher (cached for this session, see query_cache.py)."""
+    return query_cache.cached(
+        ("courses", teacher_name), lambda: list(courses_collection.find({"creator_name": teacher_name}))
+    )
+
+
+def get_course_quizzes(course):
+    """Quiz IDs and titles posted to a course, one per quiz rather than per student variant (cached for this session)."""
+    return query_cache.cached(
+        ("quizzes", course["course_id"]),
+        lambda: [
+            {"quiz_id": quiz_id, "title": title} for quiz_id, title in quiz_delivery.list_quizzes(client, course)
+        ],
+    )
+
+# Session state for login (restored from the signed session token after a browser refresh)
+profile = session_auth.restore_session()
+st.session_state.logged_in = bool(profile and profile["role"] == "Teacher")
+st.session_state.teacher_name = profile["name"] if st.session_state.logged_in else ""
 
 # Sidebar Navigation
 with st.sidebar:
     selected = option_menu(
         menu_title="Teacher Dashboard",
-        options=[ "🔑 Login","🏠 Home", "📝 Quiz Generation", "📊 Visualization"],
-        icons=["house", "person", "clipboard-check", "bar-chart"],
+        options=[ "🔑 Login","🏠 Home", "📝 Quiz Generation", "📊 Visualization", "📈 Ops"],
+        icons=["house", "person", "clipboard-check", "bar-chart", "activity"],
         menu_icon="cast",
         default_index=0,
     )
@@ -58,14 +79,22 @@ if selected == "🔑 Login":
         password = st.text_input("Password", type="password")
 
         if st.button("Login"):
-            teacher = teachers_collection.find_one({"username": username, "password": password})
-            if teacher:
-                st.session_state.logged_in = True
-                st.session_state.teacher_name = teacher["full_name"]
-                st.success("Login successful! Redirecting to Home...")
-                st.rerun()
+            try:
+                teacher = session_auth.authenticate(teachers_collection, username, password)
+            except session_auth.LoginError as e:
+                st.error(str(e))
             else:
-                st.error("Invalid credentials. Please try again.")
+                if teacher:
+                    session_auth.start_session({
+                        "username": username,
+                        "name": teacher["full_name"],
+                        "role": "Teacher",
+                        "course_ids": courses_collection.distinct("course_id", {"creator_name": teacher["full_name"]}),
+                    })
+                    st.success("Login successful! Redirecting to Home...")
+                    st.rerun()
+                else:
+                    st.error("Invalid credentials. Please try again.")
 
     elif option == "Sign Up":
         full_name = st.text_input("Full Name")
@@ -73,11 +102,16 @@ if selected == "🔑 Login":
         password = st.text_input("Choose a Password", type="password")
 
         if st.button("Sign Up"):
-            if teachers_collection.find_one({"username": username}):
-                st.warning("Username already exists! Choose a different one.")
-            else:
-                teachers_collection.insert_one({"username": username, "password": password, "full_name": full_name})
+            # The unique username index rejects duplicates in the same round-trip as the insert
+            try:
+                teachers_collection.insert_one({
+                    "username": username,
+                    "password": session_auth.hash_password(password),
+                    "full_name": full_name,
+                })
                 st.success("Sign-up successful! Please log in.")
+            except DuplicateKeyError:
+                st.warning("Username already exists! Choose a different one.")
 
 # Home Page - Teacher Dashboard
 if selected == "🏠 Home" and st.session_state.logged_in:
@@ -86,7 +120,7 @@ if selected == "🏠 Home" and st.session_state.logged_in:
     st.write(f"Welcome, {teacher_name}!")
 
     # Fetch courses created by the logged-in teacher
-    created_courses = list(courses_collection.find({"creator_name": teacher_name}))
+    created_courses = get_teacher_courses(teacher_name)
 
     # Display created courses with selection buttons
     st.subheader("📚 Your Created Courses")
@@ -107,27 +141,14 @@ if selected == "🏠 Home" and st.session_state.logged_in:
 
     if st.button("Create Course", key="create_course_button"):
         if new_course_name and new_course_id:
-            if courses_collection.find_one({"course_id": new_course_id}):
+            try:
+                # The unique course_id index rejects duplicate IDs
+                course_store.create_course(client, courses_collection, new_course_id, new_course_name, teacher_name)
+            except DuplicateKeyError:
                 st.warning(f"A course with ID '{new_course_id}' already exists. Please choose another ID.")
             else:
-                # Sanitize database name (replace special characters with underscores)
-                sanitized_db_name = re.sub(r"[^a-zA-Z0-9_]", "_", new_course_name.lower())
-
-                # Insert course details into MongoDB
-                course_data = {
-                    "course_id": new_course_id,
-                    "course_name": new_course_name,
-                    "creator_name": teacher_name,
-                    "db_name": sanitized_db_name
-                }
-                courses_collection.insert_one(course_data)
-
-                # Create a separate database for this course
-                course_db = client[sanitized_db_name]
-                course_db.create_collection("quiz")
-                course_db.create_collection("test_scores")
-                course_db.create_collection("enroll_stud")
-
+                session_auth.update_profile(course_ids=profile["course_ids"] + [new_course_id])
+                query_cache.invalidate("courses", teacher_name)
                 st.success(f"🎉 Course '{new_course_name}' created successfully!")
                 st.rerun()
         else:
@@ -135,7 +156,7 @@ if selected == "🏠 Home" and st.session_state.logged_in:
 
     # Logout Button
     if st.button("Logout"):
-        st.session_state.logged_in = False
+        session_auth.end_session()
         st.rerun()
 
 # Handle users who are not logged in and try to access Home
@@ -147,25 +168,21 @@ if selected == "📝 Quiz Generation" and st.session_state.logged_in:
     teacher_name = st.session_state.teacher_name
     
     # Fetch courses created by the logged-in teacher
-    created_courses = list(courses_collection.find({"creator_name": teacher_name}))
+    created_courses = get_teacher_courses(teacher_name)
     
     # Create a dropdown to select course
     if created_courses:
         course_options = {course['course_name']: course for course in created_courses}
         selected_course_name = st.selectbox("Select Course", list(course_options.keys()))
         selected_course = course_options[selected_course_name]
-        db_name = selected_course['db_name']  # Get the sanitized DB name
         course_id = selected_course['course_id']  # Get the course ID
     else:
         st.warning("You don't have any courses. Please create a course first.")
         st.stop()
     
-    # Initialize LLM
-    llm = ChatOpenAI(model="gpt-4", api_key=os.getenv("OPENAI_API_KEY"))
-
-    # Embeddings    
-    from langchain.embeddings.openai import OpenAIEmbeddings
-    embeddings = OpenAIEmbeddings()
+    # Initialize LLM and embeddings (shared across reruns)
+    llm = resources.get_llm("gpt-4")
+    embeddings = resources.get_embeddings()
 
     # Initialize retriever in session state if not already present
     if 'retriever' not in st.session_state:
@@ -176,12 +193,31 @@ if selected == "📝 Quiz Generation" and st.session_state.logged_in:
             st.error("Retriever is not initialized. Please upload a document and generate a quiz first.")
             return None
         
-        rag_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-        )
-        return rag_chain.invoke(prompt)
+        # Same retrieval and prompt as the RetrievalQA "stuff" chain, in front of the response cache
+        return {"result": quiz_gen.generate_quiz(llm, retriever, prompt, fresh=st.session_state.get("fresh_variant", False))}
+
+    def index_upload(quiz_file):
+        """Build (or load from the index cache) the FAISS index for an upload and store its retriever."""
+        pdf_bytes = quiz_file.getvalue()
+
+        def load_docs():
+            # Extract pages in memory, streaming them into the splitter
+            return metrics.timed_iter("pdf_extract", pdf_extract.iter_pdf_pages(pdf_bytes, quiz_file.name))
+
+        # Load, split and index the document (reused from the index cache on repeat uploads)
+        with embedding_cache.track_stats() as embed_stats:
+            vector_store, cache_hit = index_cache.get_or_build_index(pdf_bytes, embeddings, load_docs)
+
+        if vector_store is None:
+            st.error("Failed to extract content from the uploaded document. Please try another file.")
+            return None
+        if cache_hit:
+            st.caption("Reusing the cached index for this document.")
+        elif isinstance(embeddings, embedding_cache.CachedEmbeddings):
+            st.caption(f"Embedding cache: {embed_stats['hits']} chunks reused, {embed_stats['misses']} embedded.")
+
+        st.session_state['retriever'] = vector_store.as_retriever()
+        return vector_store
 
     def generate_quiz_page():
         st.title("Generate Quiz")
@@ -189,36 +225,23 @@ if selected == "📝 Quiz Generation" and st.session_state.logged_in:
 
         # User Inputs
         quiz_id = st.text_input("Enter Test ID:")
-        num_questions = st.slider("Number of Questions", min_value=1, max_value=10, value=5)
+        num_questions = st.slider("Number of Questions", min_value=1, max_value=50, value=5)
         test_description = st.text_area("Describe the test:", "Enter a short description of the test.")
         difficulty = st.slider("Difficulty Level", min_value=1, max_value=3, value=2)
         quiz_file = st.file_uploader("Upload a document (PDF only):", type=["pdf"])
-
-        if st.button("Generate Quiz"):
-            if quiz_file:
-                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                    temp_file.write(quiz_file.read())
-                    temp_file_path = temp_file.name
-
-                try:
-                    # Load and split the document
-                    loader = PyPDFLoader(temp_file_path)
-                    docs = loader.load()
-
-                    if not docs:
-                        st.error("Failed to extract content from the uploaded document. Please try another file.")
-                        return
-
-                    # Chunking 
-                    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                    splits = text_splitter.split_documents(docs)
-
-                    # Vector Store - FAISS
-                    vector_store = FAISS.from_documents(splits, embeddings)
-                    st.session_state['retriever'] = vector_store.as_retriever()
-
-                    # Prompt
-                    prompt = f"""
+        fresh = st.checkbox("Give me a fresh variant (skip cached responses)", key="fresh_variant")
+
+        # Top-level quiz fields, shared by single-call and parallel generation
+        quiz_fields = {
+            "quiz_id": quiz_id,
+            "title": "",
+            "desc": test_description,
+            "subject": selected_course_name,
+            "course_id": course_id,
+        }
+
+        # Prompt
+        prompt = f"""
     You are a teacher and need to generate a quiz for your class based on the provided document.
 
     The quiz should contain {num_questions} questions.
@@ -250,24 +273,136 @@ if selected == "📝 Quiz Generation" and st.session_state.logged_in:
     }}
 
     Ensure the questions are relevant to the content of the uploaded document.
-                    """
+        """
 
-                    st.info("Generating quiz, please wait...")
-                    result = generate_quiz(prompt, st.session_state['retriever'])
-                    if result:
-                        st.success("Quiz generated successfully!")
-                        result_to_send = json.loads(result['result'].strip())
-                        st.session_state['generated_quiz'] = result_to_send
+        run_in_background = st.checkbox("Run in background (you can leave this page and come back later)")
 
-                        # Display quiz preview
+        if st.button("Generate Quiz"):
+            if quiz_file and run_in_background:
+                job_id = quiz_jobs.submit_job(teacher_name, quiz_file.getvalue(), quiz_file.name, {
+                    "quiz_fields": quiz_fields,
+                    "num_questions": num_questions,
+                    "description": test_description,
+                    "prompt": prompt,
+                    "fresh": fresh,
+                })
+                st.success(f"Quiz generation queued (job {job_id}). Its status is shown under Background Jobs.")
+            elif quiz_file:
+                try:
+                    with metrics.trace("generate_quiz", teacher=teacher_name, course_id=course_id, num_questions=num_questions):
+                        vector_store = index_upload(quiz_file)
+                        if vector_store is None:
+                            return
+
+                        st.info("Generating quiz, please wait...")
                         st.subheader("📜 Quiz Preview")
-                        st.json(result_to_send)
+                        if num_questions > quiz_gen.QUESTIONS_PER_CALL:
+                            # Large quizzes: concurrent sub-requests, each part shown as soon as it finishes
+                            def show_part(questions):
+                                for question in questions:
+                                    st.json(question)
+
+                            data = quiz_gen.generate_quiz_parallel(
+                                llm, vector_store, num_questions, quiz_fields, test_description, on_part=show_part, fresh=fresh
+                            )
+                        else:
+                            # Stream the completion and show each question as soon as it is complete
+                            parser = QuestionStreamParser()
+                            text = ""
+                            for piece in quiz_gen.stream_quiz(llm, st.session_state['retriever'], prompt, fresh):
+                                text += piece
+                                for question in parser.feed(piece):
+                                    st.json(question)
+                            data = quiz_schema.extract_json(text)
+
+                        result_to_send = quiz_review.finalize_quiz(llm, data, quiz_fields, num_questions, test_description)
+                        if result_to_send:
+                            st.success("Quiz generated successfully!")
+                            st.session_state['generated_quiz'] = result_to_send
+
+                        cache_stats = llm_cache.stats()
+                        st.caption(
+                            f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                            f"({cache_stats['hit_rate']:.0%} hit rate since the server started)"
+                        )
                 
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
             else:
                 st.error("Please upload a document before generating a quiz.")
 
+        # Batch mode: a different but equivalent quiz for every enrolled student
+        with st.expander("👥 Per-Student Variants (anti-cheating)"):
+            st.write("Generates one pool of questions, then gives each enrolled student their own sample with shuffled options.")
+            pool_size = st.slider("Question pool size", min_value=num_questions, max_value=100, value=2 * num_questions)
+            if st.button("Generate & Post Variants"):
+                if not quiz_file:
+                    st.error("Please upload a document before generating a quiz.")
+                else:
+                    try:
+                        roster = quiz_variants.get_roster(
+                            course_store.get_collection(client, selected_course, "enroll_stud"),
+                            client["master_db"]["students"],
+                            course_id,
+                        )
+                        if not roster:
+                            st.warning("No students are enrolled in this course yet.")
+                            return
+
+                        with metrics.trace("generate_variants", teacher=teacher_name, course_id=course_id, num_questions=pool_size):
+                            vector_store = index_upload(quiz_file)
+                            if vector_store is None:
+                                return
+                            st.info(f"Generating a pool of {pool_size} questions, please wait...")
+                            data = quiz_gen.generate_quiz_parallel(
+                                llm, vector_store, pool_size, quiz_fields, test_description, fresh=fresh
+                            )
+                            pool = quiz_review.finalize_quiz(llm, data, quiz_fields, pool_size, test_description)["questions"]
+
+                        variants = quiz_variants.build_variants(quiz_fields, pool, roster, num_questions)
+                        posted = quiz_variants.post_variants(
+                            course_store.get_collection(client, selected_course, "quiz"), variants
+                        )
+                        query_cache.invalidate("quizzes", course_id)
+                        quiz_delivery.invalidate(course_id)  # Students get the new quiz on their next load
+                        st.success(f"Posted {posted} quiz variants from a pool of {len(pool)} questions.")
+                    except Exception as e:
+                        st.error(f"An error occurred: {str(e)}")
+
+        # Background jobs (read from MongoDB, so they survive page reloads)
+        recent_jobs = quiz_jobs.list_jobs(teacher_name)
+        polling = any(job["status"] in quiz_jobs.UNFINISHED for job in recent_jobs)
+
+        # Only this panel reruns while a job is unfinished, the rest of the page is left alone
+        @st.fragment(run_every=quiz_jobs.QUIZ_JOB_POLL_SECONDS if polling else None)
+        def background_jobs():
+            jobs = quiz_jobs.list_jobs(teacher_name)
+            if polling and not any(job["status"] in quiz_jobs.UNFINISHED for job in jobs):
+                st.rerun()  # Everything finished: stop polling
+            if not jobs:
+                return
+            st.subheader("🗂️ Background Jobs")
+            for job in jobs:
+                job_quiz_id = job["params"]["quiz_fields"]["quiz_id"] or "Untitled"
+                col1, col2 = st.columns([4, 1])
+                col1.write(f"**{job_quiz_id}** ({job['filename']}): {job['status']}")
+                if job["status"] == "failed":
+                    col1.caption(job.get("error", ""))
+                if job["status"] == "done" and col2.button("Open", key=f"open_job_{job['_id']}"):
+                    job = quiz_jobs.get_job(job["_id"])
+                    st.session_state['generated_quiz'] = job["result"]
+                    st.session_state['quiz_version'] = st.session_state.get('quiz_version', 0) + 1
+                    # Reload the job's index from the index cache so questions can be replaced
+                    vector_store = index_cache.load_index(job["index_key"], embeddings)
+                    if vector_store is not None:
+                        st.session_state['retriever'] = vector_store.as_retriever()
+                    st.rerun()
+
+        background_jobs()
+
+        # Review: keep or replace individual questions
+        quiz_review.review_questions(llm, test_description)
+
         # If a quiz is generated, show Post and Discard buttons
         if 'generated_quiz' in st.session_state:
             col1, col2 = st.columns(2)
@@ -276,9 +411,10 @@ if selected == "📝 Quiz Generation" and st.session_state.logged_in:
                 if st.button("✅ Post Quiz"):
                     result_to_send = st.session_state['generated_quiz']
                     
-                    # Use the db_name from the selected course
-                    subject_db = client[db_name]  # Access subject database using correct db name
-                    subject_db["quiz"].insert_one(result_to_send)  # Store in "quiz" collection
+                    # Store in the selected course's "quiz" collection
+                    course_store.get_collection(client, selected_course, "quiz").insert_one(result_to_send)
+                    query_cache.invalidate("quizzes", course_id)
+                    quiz_delivery.invalidate(course_id)  # Students get the new quiz on their next load
                     st.success(f"Quiz successfully stored in '{selected_course_name}' course!")
 
                     # Clear session state after posting
@@ -322,10 +458,23 @@ if selected == "📝 Quiz Generation" and st.session_state.logged_in:
     }}
                 '''
                 st.info("Regenerating quiz, please wait...")
-                new_result = generate_quiz(new_prompt, st.session_state['retriever'])
-                if new_result:
+                retriever = st.session_state['retriever']
+                if num_questions > quiz_gen.QUESTIONS_PER_CALL and retriever is not None:
+                    data = quiz_gen.generate_quiz_parallel(
+                        llm, retriever.vectorstore, num_questions, quiz_fields, test_description,
+                        instructions=f"Teacher feedback on the previous version of this quiz: {feedback}. Improve the questions accordingly.\n",
+                    )
+                else:
+                    new_result = generate_quiz(new_prompt, retriever)
                     # st.write(new_result) uncomment and check JSON if validation Error!
-                    result_to_send = json.loads(new_result['result'].strip())
+                    try:
+                        data = quiz_schema.extract_json(new_result['result']) if new_result else None
+                    except ValueError as e:
+                        st.error(str(e))
+                        data = None
+
+                result_to_send = quiz_review.finalize_quiz(llm, data, quiz_fields, num_questions, test_description) if data else None
+                if result_to_send:
                     st.session_state['generated_quiz'] = result_to_send
                     del st.session_state['discarded_quiz']
                     st.success("Quiz regenerated successfully!")
@@ -340,52 +489,107 @@ if selected == "📊 Visualization" and st.session_state.logged_in:
     teacher_name = st.session_state.teacher_name
     
     # Fetch courses created by the logged-in teacher
-    created_courses = list(courses_collection.find({"creator_name": teacher_name}))
+    created_courses = get_teacher_courses(teacher_name)
     
     # Create a dropdown to select course
     if created_courses:
         course_options = {course['course_name']: course for course in created_courses}
         selected_course_name = st.selectbox("Select Course", list(course_options.keys()))
         selected_course = course_options[selected_course_name]
-        db_name = selected_course['db_name']  # Get the sanitized DB name
-        
-        # Connect to the selected course database
-        course_db = client[db_name]
         
         # Get all quizzes for this course
-        quizzes = list(course_db["quiz"].find({}, {"quiz_id": 1, "title": 1}))
+        quizzes = get_course_quizzes(selected_course)
         
         if quizzes:
-            quiz_options = {quiz.get('title', quiz['quiz_id']): quiz['quiz_id'] for quiz in quizzes}
+            quiz_options = {quiz['title']: quiz['quiz_id'] for quiz in quizzes}
             selected_quiz_title = st.selectbox("Select Quiz", list(quiz_options.keys()))
             selected_quiz_id = quiz_options[selected_quiz_title]
             
             if st.button("Show Visualization"):
-                # Fetch scores of students who attempted the quiz
-                test_scores_collection = course_db["test_scores"]
-                scores_data = list(test_scores_collection.find({"quiz_id": selected_quiz_id}))
-                
-                if scores_data:
-                    # Convert to DataFrame
-                    df = pd.DataFrame(scores_data)
-                    df = df[["student_id", "score"]]  # Select only relevant columns
-                    
-                    # Visualization - Bar Chart
+                st.session_state['visualized_quiz'] = selected_quiz_id
+
+            if st.session_state.get('visualized_quiz') == selected_quiz_id:
+                # Statistics come from the quiz's materialized quiz_stats document (one small read)
+                test_scores_collection = course_store.get_collection(client, selected_course, "test_scores")
+                quiz_stats_collection = course_store.get_collection(client, selected_course, "quiz_stats")
+                stats = quiz_stats_collection.find_one({"quiz_id": selected_quiz_id})
+                if stats is None or st.button("♻️ Rebuild Statistics"):
+                    stats = score_stats.rebuild_quiz_stats(test_scores_collection, quiz_stats_collection, selected_quiz_id)
+                summary, histogram = score_stats.summarize_stats(stats)
+
+                if summary:
+                    col1, col2, col3, col4, col5 = st.columns(5)
+                    col1.metric("Attempts", summary["count"])
+                    col2.metric("Mean", f"{summary['mean']:.1f}")
+                    col3.metric("Std Dev", f"{summary['stddev']:.1f}")
+                    col4.metric("Min", summary["min"])
+                    col5.metric("Max", summary["max"])
+
+                    # Visualization - Histogram
                     st.subheader("Test Scores Visualization")
                     fig, ax = plt.subplots()
-                    ax.bar(df["student_id"], df["score"], color='skyblue')
-                    ax.set_xlabel("Students")
-                    ax.set_ylabel("Scores")
+                    ax.bar(
+                        [f"{start:g}-{start + stats.get('bin_width', score_stats.HIST_BIN_WIDTH):g}" for start, _ in histogram],
+                        [count for _, count in histogram],
+                        color='skyblue',
+                    )
+                    ax.set_xlabel("Scores")
+                    ax.set_ylabel("Students")
                     ax.set_title(f"Scores for Quiz: {selected_quiz_title}")
                     plt.xticks(rotation=45)
                     st.pyplot(fig)
-                    
-                    # Show Data Table
+
+                    # Percentile buckets (aggregated from the raw rows, so only on request)
+                    if st.checkbox("Show score deciles"):
+                        st.subheader("Score Deciles")
+                        st.dataframe(pd.DataFrame(score_stats.score_percentiles(test_scores_collection, selected_quiz_id)))
+
+                    # Show Data Table, one page at a time
                     st.subheader("Raw Scores Data")
-                    st.dataframe(df)
+                    page_size = 50
+                    page_count = max(1, -(-summary["count"] // page_size))
+                    page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+                    st.dataframe(pd.DataFrame(
+                        score_stats.score_page(test_scores_collection, selected_quiz_id, page, page_size)
+                    ))
+                    st.caption(f"Page {page} of {page_count}")
                 else:
                     st.warning("No scores data found for the selected quiz.")
         else:
             st.warning("No quizzes found for this course.")
     else:
-        st.warning("You don't have any courses. Please create a course first.")
\ No newline at end of file
+        st.warning("You don't have any courses. Please create a course first.")
+if selected == "📈 Ops" and st.session_state.logged_in:
+    st.title("📈 Quiz Generation Performance")
+
+    days = st.selectbox("Period", [1, 7, 30], index=1, format_func=lambda d: f"Last {d} day(s)")
+    only_mine = st.checkbox("Only my runs", value=True)
+    since = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=days)
+    runs = metrics.recent_runs(
+        quiz_db["metrics"], since.to_pydatetime(), teacher=st.session_state.teacher_name if only_mine else None
+    )
+
+    if runs:
+        runs_df = pd.DataFrame(runs)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Runs", len(runs_df))
+        col2.metric("Failed", int(runs_df["error"].notna().sum()) if "error" in runs_df else 0)
+        col3.metric("Tokens", f"{int(runs_df['prompt_tokens'].sum() + runs_df['completion_tokens'].sum()):,}")
+        col4.metric("Cost (USD)", f"{runs_df['cost_usd'].sum():.2f}")
+
+        # Latency percentiles per stage (stage time summed within each run)
+        st.subheader("Stage Latency (seconds)")
+        stages = pd.DataFrame(metrics.stage_totals(runs)).groupby("stage")["seconds"]
+        st.dataframe(pd.DataFrame({
+            "runs": stages.count(),
+            "p50": stages.quantile(0.5),
+            "p95": stages.quantile(0.95),
+            "p99": stages.quantile(0.99),
+        }).sort_values("p95", ascending=False))
+
+        st.subheader("Cost per Quiz")
+        st.line_chart(runs_df.set_index("started_at").sort_index()[["cost_usd"]])
+        st.subheader("Tokens per Quiz")
+        st.line_chart(runs_df.set_index("started_at").sort_index()[["prompt_tokens", "completion_tokens"]])
+    else:
+        st.info("No quiz generation runs recorded in this period.")
@@ -1,30 +1,28 @@
 import streamlit as st
-import os
-import tempfile
+import resources
+import course_store
 from dotenv import load_dotenv
-from langchain.chat_models import ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import PyPDFLoader
-from langchain.chains import RetrievalQA
-from pydantic import BaseModel, ValidationError
-from typing import List
-import json
-from pymongo import MongoClient
+import embedding_cache
+import index_cache
+import quiz_gen
+import quiz_schema
+import quiz_review
+import pdf_extract
 
 # Load environment variables
 load_dotenv()
 
-# Initialize MongoDB client
-db_client = MongoClient(os.getenv("MONGO_URI"))
+# Initialize MongoDB client (shared across reruns)
+try:
+    db_client = resources.get_mongo_client()
+except RuntimeError as e:
+    st.error(str(e))
+    st.stop()
 db = db_client["quiz-cluster"]
 
-# Initialize LLM
-llm = ChatOpenAI(model="gpt-4", api_key=os.getenv("OPENAI_API_KEY"))
-
-# Embeddings
-from langchain.embeddings.openai import OpenAIEmbeddings
-embeddings = OpenAIEmbeddings()
+# Initialize LLM and embeddings (shared across reruns)
+llm = resources.get_llm("gpt-4")
+embeddings = resources.get_embeddings()
 
 # Initialize retriever in session state if not already present
 if 'retriever' not in st.session_state:
@@ -35,12 +33,8 @@ def generate_quiz(prompt, retriever):
         st.error("Retriever is not initialized. Please upload a document and generate a quiz first.")
         return None
     
-    rag_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-    )
-    return rag_chain.invoke(prompt)
+    # Same retrieval and prompt as the RetrievalQA "stuff" chain, in front of the response cache
+    return {"result": quiz_gen.generate_quiz(llm, retriever, prompt)}
 
 def generate_quiz_page():
     st.title("Generate Quiz")
@@ -54,27 +48,34 @@ def generate_quiz_page():
     difficulty = st.slider("Difficulty Level", min_value=1, max_value=3, value=2)
     quiz_file = st.file_uploader("Upload a document (PDF only):", type=["pdf"])
 
+    quiz_fields = {
+        "quiz_id": quiz_id,
+        "title": "",
+        "desc": test_description,
+        "subject": subject_name,
+    }
+
     if st.button("Generate Quiz"):
         if quiz_file:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(quiz_file.read())
-                temp_file_path = temp_file.name
+            pdf_bytes = quiz_file.getvalue()
+
+            def load_docs():
+                # Extract pages in memory, streaming them into the splitter
+                return pdf_extract.iter_pdf_pages(pdf_bytes, quiz_file.name)
 
             try:
-                # Load and split the document
-                loader = PyPDFLoader(temp_file_path)
-                docs = loader.load()
+                # Load, split and index the document (reused from the index cache on repeat uploads)
+                with embedding_cache.track_stats() as embed_stats:
+                    vector_store, cache_hit = index_cache.get_or_build_index(pdf_bytes, embeddings, load_docs)
 
-                if not docs:
+                if vector_store is None:
                     st.error("Failed to extract content from the uploaded document. Please try another file.")
                     return
+                if cache_hit:
+                    st.caption("Reusing the cached index for this document.")
+                elif isinstance(embeddings, embedding_cache.CachedEmbeddings):
+                    st.caption(f"Embedding cache: {embed_stats['hits']} chunks reused, {embed_stats['misses']} embedded.")
 
-                # Chunking 
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                splits = text_splitter.split_documents(docs)
-
-                # Vector Store - FAISS
-                vector_store = FAISS.from_documents(splits, embeddings)
                 st.session_state['retriever'] = vector_store.as_retriever()
 
                 # Prompt
@@ -115,7 +116,8 @@ Ensure the questions are relevant to the content of the uploaded document.
                 result = generate_quiz(prompt, st.session_state['retriever'])
                 if result:
                     st.success("Quiz generated successfully!")
-                    result_to_send = json.loads(result['result'].strip())
+                    data = quiz_schema.extract_json(result['result'])
+                    result_to_send = quiz_review.finalize_quiz(llm, data, quiz_fields, num_questions, test_description)
                     st.session_state['generated_quiz'] = result_to_send
 
                     # Display quiz preview
@@ -127,6 +129,9 @@ Ensure the questions are relevant to the content of the uploaded document.
         else:
             st.error("Please upload a document before generating a quiz.")
 
+    # Review: keep or replace individual questions
+    quiz_review.review_questions(llm, test_description)
+
     # If a quiz is generated, show Post and Discard buttons
     if 'generated_quiz' in st.session_state:
         col1, col2 = st.columns(2)
@@ -135,11 +140,11 @@ Ensure the questions are relevant to the content of the uploaded document.
             if st.button("✅ Post Quiz"):
                 result_to_send = st.session_state['generated_quiz']
                 
-                # Check if the subject name exists as a database
-                if subject_name in db_client.list_database_names():
-                    subject_db = db_client[subject_name]  # Access subject database
-                    subject_db["quiz"].insert_one(result_to_send)  # Store in "quiz" collection
-                    st.success(f"Quiz successfully stored in '{subject_name}' database under 'quiz' collection!")
+                # Look up the course by subject name (a course ID, name or legacy database name)
+                course = course_store.find_course(db_client["quiz-db"]["courses"], subject_name)
+                if course:
+                    course_store.get_collection(db_client, course, "quiz").insert_one(result_to_send)  # Store in the course's "quiz" collection
+                    st.success(f"Quiz successfully stored in the '{course['course_name']}' course!")
                 else:
                     st.warning("Subject name not found in the database. Quiz not stored.")
 
@@ -191,7 +196,12 @@ Ensure the questions are relevant to the content of the uploaded document.
             new_result = generate_quiz(new_prompt, st.session_state['retriever'])
             if new_result:
                 # st.write(new_result) uncomment and check JSON if validation Error!
-                result_to_send = json.loads(new_result['result'].strip())
+                try:
+                    data = quiz_schema.extract_json(new_result['result'])
+                except ValueError as e:
+                    st.error(str(e))
+                    return
+                result_to_send = quiz_review.finalize_quiz(llm, data, quiz_fields, num_questions, test_description)
                 st.session_state['generated_quiz'] = result_to_send
                 del st.session_state['discarded_quiz']
                 st.success("Quiz regenerated successfully!")
@@ -0,0 +1,15 @@
+"""Shared setup: the modules live at the repository root, and caches go to a temporary directory."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Set before the modules read their settings at import time
+_cache_dir = tempfile.mkdtemp(prefix="tests-")
+os.environ.setdefault("SESSION_SECRET", "test-secret-" + "x" * 32)
+os.environ.setdefault("EMBEDDING_CACHE_DIR", os.path.join(_cache_dir, "embeddings"))
+os.environ.setdefault("INDEX_CACHE_DIR", os.path.join(_cache_dir, "indexes"))
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_cache_dir, "llm_cache.sqlite3"))
+os.environ.setdefault("MONGO_AUTO_MIGRATE", "0")
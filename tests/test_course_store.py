@@ -0,0 +1,71 @@
+import mongomock
+import pytest
+
+import course_catalog
+import course_store
+
+
+@pytest.fixture
+def client():
+    course_catalog._cache.clear()
+    return mongomock.MongoClient()
+
+
+def _per_course(client, course_id, name, db_name=None):
+    course = {"course_id": course_id, "course_name": name, "storage": "per_course", "db_name": db_name or name}
+    client["quiz-db"]["courses"].insert_one(course)
+    return course
+
+
+def test_create_course_gives_same_named_courses_their_own_database(client):
+    courses = client["quiz-db"]["courses"]
+    first = course_store.create_course(client, courses, "C1", "Physics", "t", mode="per_course")
+    second = course_store.create_course(client, courses, "C2", "Physics", "t", mode="per_course")
+    assert first["db_name"] != second["db_name"]
+
+
+def test_migrate_refuses_a_database_shared_by_two_courses(client):
+    course = _per_course(client, "C1", "physics")
+    _per_course(client, "C2", "physics")
+    client["physics"]["quiz"].insert_one({"quiz_id": "q1", "course_id": "C2"})
+    with pytest.raises(ValueError):
+        course_store.migrate_course(client, course, drop=True, drain_seconds=0)
+    assert client["quiz-db"]["quizzes"].count_documents({}) == 0
+    assert "physics" in client.list_database_names()
+
+
+def test_migrate_copies_only_the_courses_documents_and_drops(client):
+    course = _per_course(client, "C1", "physics")
+    client["physics"]["quiz"].insert_many([
+        {"quiz_id": "q1", "course_id": "C1"},
+        {"quiz_id": "q2"},  # Written before documents were tagged
+        {"quiz_id": "q3", "course_id": "OTHER"},
+    ])
+    client["physics"]["test_scores"].insert_one({"quiz_id": "q1", "student_id": "s1", "score": 50})
+
+    course_store.migrate_course(client, course, drop=True, drain_seconds=0)
+
+    shared = {**course, "storage": "shared"}
+    quizzes = course_store.get_collection(client, shared, "quiz")
+    assert sorted(quiz["quiz_id"] for quiz in quizzes.find({})) == ["q1", "q2"]
+    assert course_store.get_collection(client, shared, "test_scores").count_documents({}) == 1
+    assert "physics" not in client.list_database_names()
+    stored = client["quiz-db"]["courses"].find_one({"course_id": "C1"})
+    assert stored["storage"] == "shared" and "db_name" not in stored
+
+
+def test_drop_waits_for_cached_entries_and_copies_late_writes(client, monkeypatch):
+    course = _per_course(client, "C1", "physics")
+    client["physics"]["quiz"].insert_one({"quiz_id": "q1"})
+
+    def sleep(seconds):
+        assert seconds > 0
+        # A process with a stale catalog entry still writes to the old database
+        client["physics"]["quiz"].insert_one({"quiz_id": "late"})
+
+    monkeypatch.setattr(course_store.time, "sleep", sleep)
+    course_store.migrate_course(client, course, drop=True, drain_seconds=3600)
+
+    quizzes = client["quiz-db"]["quizzes"].find({"course_id": "C1"})
+    assert sorted(quiz["quiz_id"] for quiz in quizzes) == ["late", "q1"]
+    assert "physics" not in client.list_database_names()
@@ -0,0 +1,27 @@
+import mongomock
+
+import db_indexes
+
+
+def _index(db_name, collection_name, name):
+    indexes = db_indexes.GLOBAL_INDEXES.get((db_name, collection_name)) or db_indexes.SHARED_INDEXES[collection_name]
+    return next(index for index in indexes if index.document["name"] == name)
+
+
+def test_check_reports_the_duplicates_blocking_a_unique_index():
+    client = mongomock.MongoClient()
+    teachers = client["quiz-db"]["teacher_meta"]
+    teachers.insert_many([{"username": "ann"}, {"username": "ann"}, {"username": "ann"}, {"username": "bob"}])
+
+    index = _index("quiz-db", "teacher_meta", "username_unique")
+    assert ("quiz-db", "teacher_meta", index) in db_indexes.missing_indexes(client)
+    assert db_indexes.duplicate_keys(teachers, index) == [({"username": "ann"}, 3)]
+
+
+def test_documents_a_sparse_index_skips_are_not_duplicates():
+    client = mongomock.MongoClient()
+    jobs = client["quiz-db"]["quiz_jobs"]
+    jobs.insert_many([{"status": "done"}, {"status": "done"}, {"active_key": "k"}, {"active_key": "k"}])
+    assert db_indexes.duplicate_keys(jobs, _index("quiz-db", "quiz_jobs", "active_key_unique")) == [
+        ({"active_key": "k"}, 2),
+    ]
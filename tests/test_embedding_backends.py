@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import embedding_backends
+import embedding_cache
+
+
+@pytest.fixture
+def embeddings():
+    return embedding_backends.HashedNgramEmbeddings(dim=256, batch_size=3)
+
+
+def test_vectors_are_deterministic_and_normalized(embeddings):
+    texts = ["Photosynthesis converts light", "into chemical energy", "", "Mitochondria"]
+    vectors = np.array(embeddings.embed_documents(texts))
+    assert vectors.shape == (4, 256)
+    assert np.allclose(np.linalg.norm(vectors[[0, 1, 3]], axis=1), 1.0, atol=1e-5)
+    assert not vectors[2].any()  # No words, no features
+    assert np.allclose(vectors, embeddings.embed_documents(texts))
+
+
+def test_batching_does_not_change_the_vectors(embeddings):
+    texts = [f"sentence number {i} about cells" for i in range(7)]
+    batched = embeddings.embed_documents(texts)
+    one_by_one = [embeddings.embed_query(text) for text in texts]
+    assert np.allclose(batched, one_by_one, atol=1e-6)
+
+
+def test_similar_texts_are_closer_than_unrelated_ones(embeddings):
+    query = np.array(embeddings.embed_query("cell membrane transport"))
+    related, unrelated = np.array(embeddings.embed_documents(["transport across the cell membrane", "stock market prices"]))
+    assert query @ related > query @ unrelated
+
+
+def test_uncached_embeddings_report_no_cache_stats(embeddings):
+    with embedding_cache.track_stats() as stats:
+        embeddings.embed_documents(["a", "b"])
+        embeddings.embed_query("c")
+    assert stats == {"hits": 0, "misses": 0}
+
+
+def test_the_model_name_includes_the_dimension():
+    assert embedding_backends.HashedNgramEmbeddings(dim=64).model != embedding_backends.HashedNgramEmbeddings(dim=128).model
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        embedding_backends.create_embeddings("word2vec")
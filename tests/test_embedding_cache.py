@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+import embedding_cache
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+
+DIM = 4
+
+
+def _vectors(*values):
+    return np.array([[value] * DIM for value in values], dtype=np.float32)
+
+
+def _assert_aligned(store, expected):
+    found = store.lookup(set(expected))
+    assert set(found) == set(expected)
+    for key, value in expected.items():
+        assert np.allclose(found[key], value), key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / "model"))
+
+
+def test_append_and_lookup(store):
+    store.append(["a", "b"], _vectors(1, 2))
+    store.append(["b", "c"], _vectors(9, 3))  # b is already stored and keeps its vector
+    _assert_aligned(store, {"a": 1, "b": 2, "c": 3})
+
+
+def test_orphan_vector_from_a_torn_write_does_not_shift_later_keys(store, tmp_path):
+    store.append(["a"], _vectors(1))
+    # Crash after the vector was written but before its key: an orphan row
+    with open(store.vectors_path, "ab") as f:
+        f.write(_vectors(7).tobytes())
+    store.append(["b", "c"], _vectors(2, 3))
+    _assert_aligned(store, {"a": 1, "b": 2, "c": 3})
+    # A new process reading the files sees the same mapping
+    _assert_aligned(EmbeddingStore(store.path), {"a": 1, "b": 2, "c": 3})
+
+
+def test_partial_vector_and_torn_key_line_are_skipped(store):
+    store.append(["a"], _vectors(1))
+    with open(store.vectors_path, "ab") as f:
+        f.write(_vectors(7).tobytes()[:6])  # Half a row
+    with open(store.keys_path, "ab") as f:
+        f.write(b"orph")  # Half a key line
+    store.append(["b"], _vectors(2))
+    _assert_aligned(EmbeddingStore(store.path), {"a": 1, "b": 2})
+
+
+def test_reads_files_written_without_rows(store):
+    store.dim = DIM
+    with open(store.meta_path, "w") as f:
+        f.write('{"dim": %d}' % DIM)
+    with open(store.vectors_path, "wb") as f:
+        f.write(_vectors(1, 2).tobytes())
+    with open(store.keys_path, "w") as f:
+        f.write("a\nb\n")
+    legacy = EmbeddingStore(store.path)
+    legacy.append(["c"], _vectors(3))
+    _assert_aligned(EmbeddingStore(store.path), {"a": 1, "b": 2, "c": 3})
+
+
+class CountingEmbeddings:
+    model = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] * DIM for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))] * DIM
+
+
+def test_cached_embeddings_only_embed_misses(tmp_path):
+    embeddings = CachedEmbeddings(CountingEmbeddings(), cache_dir=str(tmp_path), batch_size=2)
+    first = embeddings.embed_documents(["one", "two  ", "three"])
+    second = embeddings.embed_documents(["two", "four", "one"])
+    assert embeddings.embeddings.calls == [["one", "two"], ["three"], ["four"]]
+    assert second[0] == first[1] and second[2] == first[0]
+    embedding_cache._stores.clear()
+
+
+def test_stats_are_counted_per_caller(tmp_path):
+    import threading
+
+    embeddings = CachedEmbeddings(CountingEmbeddings(), cache_dir=str(tmp_path))
+    embeddings.embed_documents(["shared"])
+    results = {}
+    barrier = threading.Barrier(2)
+
+    def upload(name, texts):
+        with embedding_cache.track_stats() as stats:
+            barrier.wait()
+            embeddings.embed_documents(texts)
+        results[name] = dict(stats)
+
+    threads = [
+        threading.Thread(target=upload, args=("a", ["shared", "only a"])),
+        threading.Thread(target=upload, args=("b", ["shared", "b1", "b2"])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": {"hits": 1, "misses": 1}, "b": {"hits": 1, "misses": 2}}
+    # Calls outside a tracked block are not counted anywhere
+    embeddings.embed_documents(["untracked"])
+    embedding_cache._stores.clear()
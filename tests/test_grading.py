@@ -0,0 +1,134 @@
+import threading
+
+import mongomock
+import numpy as np
+import pytest
+
+import grading
+import score_stats
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()["course"]
+    db["test_scores"].create_index([("quiz_id", 1), ("student_id", 1)], unique=True)
+    return db
+
+
+def _result(student_id, score):
+    return {"student_id": student_id, "score": score, "correct": 0, "total": 0}
+
+
+def _stats(db):
+    return score_stats.summarize_stats(db["quiz_stats"].find_one({"quiz_id": "q1"}))[0]
+
+
+def test_grade_uses_each_students_variant_key():
+    keys = {None: np.array([0, 1, 2], dtype=np.int16), "s2": np.array([2, 1], dtype=np.int16)}
+    results = grading.grade(
+        [{"student_id": "s1", "answers": [0, 1, -1]}, {"student_id": "s2", "answers": [2, 1]}],
+        keys,
+    )
+    assert results == [
+        {"student_id": "s1", "score": 66.67, "correct": 2, "total": 3},
+        {"student_id": "s2", "score": 100.0, "correct": 2, "total": 2},
+    ]
+
+
+def test_grade_skips_students_without_a_key():
+    keys = {"s1": np.array([0], dtype=np.int16)}
+    assert [r["student_id"] for r in grading.grade([{"student_id": "s9", "answers": [0]}], keys)] == []
+
+
+def test_save_scores_keeps_the_last_entry_of_a_student_in_a_batch(db):
+    grading.save_scores(db["test_scores"], db["quiz_stats"], "q1", [_result("s1", 40.0), _result("s1", 80.0)])
+    assert db["test_scores"].find_one({"student_id": "s1"})["score"] == 80.0
+    assert _stats(db)["count"] == 1
+    assert _stats(db)["mean"] == 80.0
+
+
+def test_save_scores_replaces_a_resubmitted_score_in_the_stats(db):
+    grading.save_scores(db["test_scores"], db["quiz_stats"], "q1", [_result("s1", 40.0), _result("s2", 60.0)])
+    grading.save_scores(db["test_scores"], db["quiz_stats"], "q1", [_result("s1", 100.0)])
+    summary = _stats(db)
+    assert summary["count"] == 2
+    assert summary["mean"] == 80.0
+    assert db["quiz_stats"].find_one({"quiz_id": "q1"})["histogram"]["4"] == 0
+
+
+def test_concurrent_submissions_of_a_student_are_counted_once(db):
+    barrier = threading.Barrier(4)
+
+    def submit(score):
+        barrier.wait()
+        grading.save_scores(db["test_scores"], db["quiz_stats"], "q1", [_result("s1", score)])
+
+    threads = [threading.Thread(target=submit, args=(score,)) for score in (10.0, 20.0, 30.0, 40.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stored = db["test_scores"].find_one({"student_id": "s1"})["score"]
+    summary = _stats(db)
+    assert summary["count"] == 1
+    assert summary["mean"] == stored
+
+
+class CountingCollection:
+    """Counts the calls made to a collection; before_bulk_write runs once, just before the first bulk_write."""
+
+    def __init__(self, collection, before_bulk_write=None):
+        self.collection = collection
+        self.calls = []
+        self.before_bulk_write = before_bulk_write
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            if name == "bulk_write" and self.before_bulk_write:
+                self.before_bulk_write, before = None, self.before_bulk_write
+                before()
+            return method(*args, **kwargs)
+        return call
+
+
+def test_a_batch_is_written_with_one_bulk_write(db):
+    scores = CountingCollection(db["test_scores"])
+    grading.save_scores(scores, db["quiz_stats"], "q1", [_result(f"s{i}", 50.0) for i in range(500)])
+    assert scores.calls == ["find", "bulk_write"]
+    assert db["test_scores"].count_documents({}) == 500
+
+
+def test_a_row_changed_between_read_and_write_is_read_again(db):
+    grading.save_scores(db["test_scores"], db["quiz_stats"], "q1", [_result("s1", 10.0)])
+
+    def concurrent_resubmission():
+        grading.save_scores(db["test_scores"], db["quiz_stats"], "q1", [_result("s1", 30.0)])
+
+    scores = CountingCollection(db["test_scores"], before_bulk_write=concurrent_resubmission)
+    grading.save_scores(scores, db["quiz_stats"], "q1", [_result("s1", 20.0), _result("s2", 40.0)])
+    assert scores.calls == ["find", "bulk_write", "find", "bulk_write"]
+    assert db["test_scores"].find_one({"student_id": "s1"})["score"] == 20.0
+    summary = _stats(db)
+    assert summary["count"] == 2
+    assert summary["mean"] == 30.0
+
+
+def test_shared_storage_scopes_the_bulk_write_to_the_course():
+    import course_store
+
+    client = mongomock.MongoClient()
+    client["quiz-db"]["test_scores"].create_index(
+        [("course_id", 1), ("quiz_id", 1), ("student_id", 1)], unique=True
+    )
+    for course_id in ("C1", "C2"):
+        course = {"course_id": course_id, "storage": "shared"}
+        grading.save_scores(
+            course_store.get_collection(client, course, "test_scores"),
+            course_store.get_collection(client, course, "quiz_stats"),
+            "q1", [_result("s1", 70.0)],
+        )
+    rows = list(client["quiz-db"]["test_scores"].find({}, {"_id": 0, "course_id": 1, "score": 1}))
+    assert sorted(row["course_id"] for row in rows) == ["C1", "C2"]
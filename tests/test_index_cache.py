@@ -0,0 +1,110 @@
+import os
+import shutil
+
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import embedding_backends
+import index_cache
+
+
+def _flat(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    return index, vectors
+
+
+def test_index_spec_picks_flat_or_ivf_by_size(monkeypatch):
+    monkeypatch.setattr(index_cache, "FAISS_FLAT_MAX_VECTORS", 1000)
+    assert index_cache.index_spec(1000, 384, "auto", "none") == "Flat"
+    assert index_cache.index_spec(40000, 384, "auto", "none") == "IVF800,Flat"
+    assert index_cache.index_spec(1000, 384, "ivf", "none") == "IVF25,Flat"  # At least 39 training points per list
+
+
+def test_index_spec_compression_and_hnsw():
+    assert index_cache.index_spec(100, 384, "flat", "fp16") == "SQfp16"
+    assert index_cache.index_spec(100, 384, "flat", "pq") == "SQfp16"  # Too few vectors to train PQ
+    assert index_cache.index_spec(20000, 384, "flat", "pq") == "PQ64"
+    assert index_cache.index_spec(20000, 96, "flat", "pq") == "PQ24"  # At least 4 dimensions per sub-quantizer
+    assert index_cache.index_spec(100, 384, "hnsw", "none") == f"HNSW{index_cache.FAISS_HNSW_M}"
+    assert index_cache.index_spec(100, 384, "hnsw", "fp16") == f"HNSW{index_cache.FAISS_HNSW_M}_SQfp16"
+
+
+def test_index_spec_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        index_cache.index_spec(100, 384, "tree", "none")
+    with pytest.raises(ValueError):
+        index_cache.index_spec(100, 384, "flat", "zip")
+
+
+def test_convert_index_keeps_a_flat_index():
+    index, _ = _flat(50)
+    assert index_cache.convert_index(index, "flat", "none") is index
+
+
+@pytest.mark.parametrize("index_type,compression", [("ivf", "none"), ("ivf", "fp16"), ("hnsw", "none"), ("flat", "fp16")])
+def test_convert_index_keeps_vector_ids(index_type, compression):
+    index, vectors = _flat(2000)
+    converted = index_cache.convert_index(index, index_type, compression)
+    assert converted.ntotal == index.ntotal
+    _, found = converted.search(vectors[[7, 1234]], 1)
+    assert found[:, 0].tolist() == [7, 1234]
+    # MMR reconstructs candidates by id
+    assert np.allclose(converted.reconstruct(7), vectors[7], atol=1e-2)
+
+
+def test_a_converted_index_round_trips_through_the_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_cache, "INDEX_CACHE_DIR", str(tmp_path))
+    embeddings = embedding_backends.HashedNgramEmbeddings(dim=64)
+    docs = [Document(page_content=f"Chapter {i}: topic number {i} explained.", metadata={"page": i}) for i in range(300)]
+    vector_store = index_cache.build_index(iter(docs), embeddings, index_type="ivf", compression="none")
+    index_cache.save_index("key", vector_store, embeddings)
+
+    loaded = index_cache.load_index("key", embeddings)
+    assert type(loaded.index) is type(vector_store.index)
+    assert faiss.try_extract_index_ivf(loaded.index).nprobe == index_cache.FAISS_NPROBE
+    assert loaded.similarity_search("topic number 42 explained", k=1)[0].metadata["page"] == 42
+    assert index_cache.load_index("key", embedding_backends.HashedNgramEmbeddings(dim=32)) is None
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) // 1024 for line in f if line.startswith("VmRSS"))
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc")
+@pytest.mark.parametrize("spec", ["Flat", "SQfp16", "IVF64,Flat"])
+def test_a_cached_index_is_mapped_rather_than_read_into_memory(tmp_path, spec):
+    vectors = np.random.default_rng(0).standard_normal((60000, 384)).astype(np.float32)  # 88 MB as float32
+    index = faiss.index_factory(384, spec)
+    index.train(vectors[:5000])
+    index.add(vectors)
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(index, path)
+    del index, vectors
+
+    before = _rss_mb()
+    mapped = faiss.read_index(path, index_cache.MMAP_FLAGS)
+    assert _rss_mb() - before < 10
+    assert mapped.ntotal == 60000
+
+
+def test_saving_an_index_another_process_just_saved_is_not_an_error(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_cache, "INDEX_CACHE_DIR", str(tmp_path))
+    embeddings = embedding_backends.HashedNgramEmbeddings(dim=64)
+    docs = [Document(page_content=f"Chapter {i}.", metadata={"page": i}) for i in range(20)]
+    vector_store = index_cache.build_index(iter(docs), embeddings, index_type="flat", compression="none")
+    rename = os.rename
+
+    def rename_after_another_process(src, dst):
+        # The other process's rename lands between our isdir check and our rename
+        shutil.copytree(src, dst)
+        rename(src, dst)
+
+    monkeypatch.setattr(index_cache.os, "rename", rename_after_another_process)
+    index_cache.save_index("key", vector_store, embeddings)
+    assert os.listdir(tmp_path) == ["key"]
+    assert index_cache.load_index("key", embeddings).index.ntotal == 20
@@ -0,0 +1,44 @@
+import json
+
+from json_stream import QuestionStreamParser
+
+QUIZ = {
+    "quiz_id": "q1",
+    "questions": [
+        {"question_id": 1, "question": 'Which brace is "}"?', "options": [{"option_text": "{ or }", "is_correct": True}]},
+        {"question_id": 2, "question": "Escaped \\\" quote [", "options": []},
+    ],
+    "notes": [{"ignored": True}],
+}
+
+
+def _feed_in_pieces(text, size):
+    parser = QuestionStreamParser()
+    found = []
+    for start in range(0, len(text), size):
+        found += parser.feed(text[start:start + size])
+    return found
+
+
+def test_questions_are_returned_as_they_complete_whatever_the_chunking():
+    text = json.dumps(QUIZ, indent=2)
+    for size in (1, 3, 7, len(text)):
+        assert _feed_in_pieces(text, size) == QUIZ["questions"]
+
+
+def test_a_question_is_returned_only_once_its_closing_brace_arrives():
+    text = json.dumps(QUIZ)
+    end_of_first = text.index('}]}') + 3
+    parser = QuestionStreamParser()
+    assert parser.feed(text[:end_of_first - 1]) == []
+    assert parser.feed(text[end_of_first - 1:end_of_first]) == [QUIZ["questions"][0]]
+
+
+def test_a_truncated_document_yields_the_complete_questions_only():
+    text = json.dumps(QUIZ)
+    cut = text.index('"question_id": 2') + 5
+    assert QuestionStreamParser().feed(text[:cut]) == QUIZ["questions"][:1]
+
+
+def test_objects_after_the_questions_array_are_ignored():
+    assert QuestionStreamParser().feed(json.dumps({"questions": [], "other": [{"a": 1}]})) == []
@@ -0,0 +1,59 @@
+import pytest
+
+import llm_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    llm_cache.clear()
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_TTL_HOURS", 1)
+    llm_cache.put("a", "response")
+    clock.now += 3599
+    assert llm_cache.get("a") == "response"
+    clock.now += 2
+    assert llm_cache.get("a") is None
+
+
+def test_least_recently_used_entries_are_evicted(clock, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_ENTRIES", 2)
+    llm_cache.put("a", "A")
+    clock.now += 1
+    llm_cache.put("b", "B")
+    clock.now += 1
+    assert llm_cache.get("a") == "A"  # a is now more recently used than b
+    clock.now += 1
+    llm_cache.put("c", "C")
+    assert llm_cache.get("b") is None
+    assert llm_cache.get("a") == "A"
+    assert llm_cache.get("c") == "C"
+
+
+def test_hits_and_misses_are_counted(clock):
+    before = llm_cache.stats()
+    llm_cache.put("a", "A")
+    llm_cache.get("a")
+    llm_cache.get("missing")
+    after = llm_cache.stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+
+def test_cache_key_ignores_whitespace_but_not_model_or_chunks():
+    key = llm_cache.cache_key("gpt-4", "Write  a\nquiz", ["c1"])
+    assert key == llm_cache.cache_key("gpt-4", "Write a quiz ", ["c1"])
+    assert key != llm_cache.cache_key("gpt-3.5", "Write a quiz", ["c1"])
+    assert key != llm_cache.cache_key("gpt-4", "Write a quiz", ["c2"])
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+import db_indexes
+import metrics
+
+NOW = datetime.now(timezone.utc)
+
+
+def _run(teacher, minutes_ago):
+    return {
+        "run_id": f"{teacher}-{minutes_ago}", "teacher": teacher, "started_at": NOW - timedelta(minutes=minutes_ago),
+        "seconds": 2.0, "prompt_tokens": 10, "completion_tokens": 5, "cost_usd": 0.01,
+        "spans": [{"name": "llm", "seconds": 1.5, "chunks": 4}, {"name": "llm", "seconds": 0.5}],
+        "llm_calls": [{"model": "gpt-4", "prompt_tokens": 10}],
+    }
+
+
+def test_recent_runs_filters_by_teacher_and_period_in_the_query():
+    collection = mongomock.MongoClient()["quiz-db"]["metrics"]
+    collection.insert_many([_run("ann", 5), _run("bob", 10), _run("ann", 60 * 24 * 3)])
+    runs = metrics.recent_runs(collection, NOW - timedelta(days=1), teacher="ann")
+    assert [run["run_id"] for run in runs] == ["ann-5"]
+    assert "llm_calls" not in runs[0]
+    assert runs[0]["spans"] == [{"name": "llm", "seconds": 1.5}, {"name": "llm", "seconds": 0.5}]
+    assert len(metrics.recent_runs(collection, NOW - timedelta(days=1))) == 2
+
+
+def test_stage_totals_sums_each_stage_within_a_run():
+    assert metrics.stage_totals([_run("ann", 5)]) == [
+        {"stage": "llm", "seconds": 2.0}, {"stage": "total", "seconds": 2.0},
+    ]
+
+
+class RecordingDatabase:
+    def __init__(self, database):
+        self.database = database
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self.database[name]
+
+    def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+
+def test_a_changed_retention_is_applied_to_the_existing_ttl_index(monkeypatch):
+    client = mongomock.MongoClient()
+    client["quiz-db"]["metrics"].create_indexes(db_indexes.GLOBAL_INDEXES[("quiz-db", "metrics")])
+    database = RecordingDatabase(client["quiz-db"])
+    recording = {"quiz-db": database}
+    assert not db_indexes.apply_metrics_retention(recording)
+
+    monkeypatch.setattr(db_indexes, "METRICS_RETENTION_DAYS", 7)
+    assert db_indexes.apply_metrics_retention(recording)
+    assert database.commands == [
+        (("collMod", "metrics"), {"index": {"name": "started_at_ttl", "expireAfterSeconds": 7 * 86400}}),
+    ]
+
+
+def test_each_process_writes_its_own_prometheus_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "METRICS_PROM_FILE", str(tmp_path / "quiz.prom"))
+    monkeypatch.setattr(metrics, "_stage_hist", defaultdict(metrics._stage_hist.default_factory))
+    monkeypatch.setattr(metrics, "_counters", defaultdict(float))
+    monkeypatch.setattr(metrics, "_prom_pid", None)
+    monkeypatch.setattr(metrics.atexit, "register", lambda *args: None)
+    for pid, runs in ((101, 2), (202, 1)):
+        monkeypatch.setattr(metrics.os, "getpid", lambda pid=pid: pid)
+        for _ in range(runs):
+            metrics._update_prometheus(_run("ann", 5))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["quiz.101.prom", "quiz.202.prom"]
+    assert 'quiz_generation_runs_total{pid="101"} 2' in (tmp_path / "quiz.101.prom").read_text()
+    text = (tmp_path / "quiz.202.prom").read_text()
+    assert 'quiz_generation_runs_total{pid="202"} 1' in text
+    assert 'quiz_stage_seconds_count{pid="202",stage="llm"} 2' in text
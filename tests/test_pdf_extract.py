@@ -0,0 +1,47 @@
+import fitz
+import pytest
+
+import pdf_extract
+
+
+def _pdf(pages):
+    with fitz.open() as doc:
+        for i in range(pages):
+            doc.new_page().insert_text((72, 72), f"Page number {i}" if i % 5 else "")
+        return doc.tobytes()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(pdf_extract, "PDF_WORKERS", 2)
+    monkeypatch.setattr(pdf_extract, "PAGES_PER_TASK", 4)
+    monkeypatch.setattr(pdf_extract, "_executor", None)
+    yield
+    pdf_extract._discard_executor(pdf_extract._get_executor())
+
+
+def test_pages_are_extracted_in_order_by_a_shared_spawn_pool(pool):
+    executors = []
+    for pages in (30, 17):
+        docs = list(pdf_extract.iter_pdf_pages(_pdf(pages), "book.pdf", workers=2))
+        assert [doc.metadata["page"] for doc in docs] == [i for i in range(pages) if i % 5]
+        assert all(doc.page_content.strip() == f"Page number {doc.metadata['page']}" for doc in docs)
+        executors.append(pdf_extract._executor)
+    assert executors[0] is executors[1]
+    assert executors[0]._mp_context.get_start_method() == "spawn"
+
+
+def test_stopping_early_releases_the_shared_memory(pool, monkeypatch):
+    blocks = []
+    create = pdf_extract.shared_memory.SharedMemory
+
+    def tracked(*args, **kwargs):
+        blocks.append(create(*args, **kwargs))
+        return blocks[-1]
+
+    monkeypatch.setattr(pdf_extract.shared_memory, "SharedMemory", tracked)
+    pages = pdf_extract.iter_pdf_pages(_pdf(40), "book.pdf", workers=2)
+    next(pages)
+    pages.close()
+    with pytest.raises(FileNotFoundError):
+        create(name=blocks[0].name)
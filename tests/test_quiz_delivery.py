@@ -0,0 +1,57 @@
+import mongomock
+
+import quiz_delivery
+
+
+def test_list_quizzes_returns_one_row_per_quiz_not_per_variant():
+    client = mongomock.MongoClient()
+    course = {"course_id": "C1", "storage": "shared"}
+    quiz_delivery.invalidate("C1")
+    quiz_delivery.course_store.get_collection(client, course, "quiz").insert_many([
+        {"quiz_id": "q1", "title": "Week 1"},
+        {"quiz_id": "q1", "title": "Week 1", "student_id": "s1"},
+        {"quiz_id": "q1", "title": "Week 1", "student_id": "s2"},
+        {"quiz_id": "q2"},
+    ])
+    assert quiz_delivery.list_quizzes(client, course) == [("q1", "Week 1"), ("q2", "q2")]
+
+
+WRITES = ("insert_one", "insert_many", "update_one", "update_many", "replace_one", "bulk_write", "find_one_and_update")
+
+
+def _count_writes(monkeypatch):
+    """Patch mongomock to count write calls made by the app (calls nested inside mongomock count once)."""
+    counts = {"writes": 0, "depth": 0}
+    for name in WRITES:
+        original = getattr(mongomock.collection.Collection, name)
+
+        def counted(self, *args, _original=original, **kwargs):
+            counts["writes"] += counts["depth"] == 0
+            counts["depth"] += 1
+            try:
+                return _original(self, *args, **kwargs)
+            finally:
+                counts["depth"] -= 1
+        monkeypatch.setattr(mongomock.collection.Collection, name, counted)
+    return counts
+
+
+def _flush_class(monkeypatch, students):
+    client = mongomock.MongoClient()
+    course = {"course_id": f"C{students}", "storage": "per_course", "db_name": f"course{students}"}
+    client[course["db_name"]]["test_scores"].create_index([("quiz_id", 1), ("student_id", 1)], unique=True)
+    client[course["db_name"]]["quiz"].insert_one({"quiz_id": "q1", "questions": [
+        {"question": "Q?", "options": [{"option_text": "a", "is_correct": True}, {"option_text": "b", "is_correct": False}]},
+    ]})
+    buffer = quiz_delivery.SubmissionBuffer(batch_size=10_000, flush_seconds=3600)
+    futures = [buffer.submit(client, course, "q1", f"s{i}", [i % 2]) for i in range(students)]
+    counts = _count_writes(monkeypatch)
+    buffer.flush()
+    monkeypatch.undo()
+    assert all(future.result(timeout=5)["total"] == 1 for future in futures)
+    assert client[course["db_name"]]["test_scores"].count_documents({}) == students
+    return counts["writes"]
+
+
+def test_a_flush_makes_the_same_number_of_writes_whatever_the_class_size(monkeypatch):
+    assert _flush_class(monkeypatch, 20) == _flush_class(monkeypatch, 500) == 2  # Scores and quiz_stats
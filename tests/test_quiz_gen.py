@@ -0,0 +1,139 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+import llm_cache
+import quiz_gen
+
+VALID = json.dumps({"questions": [{
+    "question_id": 1,
+    "question": "What is 2 + 2?",
+    "options": [{"option_text": "4", "is_correct": True}, {"option_text": "5", "is_correct": False}],
+}]})
+TRUNCATED = VALID[:-20]
+INVALID = json.dumps({"questions": [{
+    "question_id": 1,
+    "question": "What is 2 + 2?",
+    "options": [{"option_text": "4", "is_correct": True}, {"option_text": "5", "is_correct": True}],
+}]})
+DOCS = [Document(page_content="Arithmetic: 2 + 2 = 4.")]
+
+
+class FakeLLM:
+    model_name = "fake"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        return self.responses.pop(0)
+
+    def invoke(self, messages):
+        return SimpleNamespace(content=self._next())
+
+    def stream(self, messages):
+        text = self._next()
+        for i in range(0, len(text), 10):
+            yield SimpleNamespace(content=text[i:i + 10])
+
+
+class FakeRetriever:
+    search_kwargs = {"k": 1}
+
+    def invoke(self, prompt):
+        return DOCS
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    llm_cache.clear()
+
+
+@pytest.mark.parametrize("bad", ["not json at all", TRUNCATED, INVALID])
+def test_invoke_does_not_cache_a_response_that_fails_to_parse_or_validate(bad):
+    llm = FakeLLM(bad, VALID)
+    assert quiz_gen.invoke_cached(llm, "prompt", DOCS) == bad
+    assert quiz_gen.invoke_cached(llm, "prompt", DOCS) == VALID
+    assert llm.calls == 2
+
+
+def test_invoke_caches_a_valid_response():
+    llm = FakeLLM(VALID)
+    assert quiz_gen.invoke_cached(llm, "prompt", DOCS) == VALID
+    assert quiz_gen.invoke_cached(llm, "prompt", DOCS) == VALID
+    assert llm.calls == 1
+
+
+def test_stream_caches_only_a_valid_response():
+    llm = FakeLLM(TRUNCATED, VALID)
+    retriever = FakeRetriever()
+    assert "".join(quiz_gen.stream_quiz(llm, retriever, "prompt")) == TRUNCATED
+    assert "".join(quiz_gen.stream_quiz(llm, retriever, "prompt")) == VALID
+    assert "".join(quiz_gen.stream_quiz(llm, retriever, "prompt")) == VALID
+    assert llm.calls == 2
+
+
+def test_a_broken_entry_already_in_the_cache_is_not_replayed():
+    llm = FakeLLM(VALID)
+    llm_cache.put(quiz_gen._response_key(llm, "prompt", DOCS), TRUNCATED)
+    assert quiz_gen.invoke_cached(llm, "prompt", DOCS) == VALID
+    assert llm.calls == 1
+
+
+class FakeVectorStore:
+    def max_marginal_relevance_search(self, query, k, fetch_k):
+        return DOCS
+
+
+def _question(text, correct=1):
+    return {"question": text, "options": [
+        {"option_text": "a", "is_correct": correct >= 1}, {"option_text": "b", "is_correct": correct >= 2},
+    ]}
+
+
+def test_finalize_without_a_vector_store_does_not_claim_a_regeneration():
+    data = {"questions": [_question("Good?"), _question("Bad?", correct=2)]}
+    quiz, warning = quiz_gen.finalize_quiz(FakeLLM(), None, data, {"quiz_id": "q1"}, 2, "test")
+    assert [q["question"] for q in quiz["questions"]] == ["Good?"]
+    assert "regenerated" not in warning
+    assert "removed" in warning
+    assert "1 of 2 questions" in warning
+
+
+def test_finalize_with_a_vector_store_regenerates_invalid_questions():
+    data = {"questions": [_question("Good?"), _question("Bad?", correct=2)]}
+    llm = FakeLLM(json.dumps({"questions": [_question("Replacement?")]}))
+    quiz, warning = quiz_gen.finalize_quiz(llm, FakeVectorStore(), data, {"quiz_id": "q1"}, 2, "test")
+    assert [q["question"] for q in quiz["questions"]] == ["Good?", "Replacement?"]
+    assert warning.startswith("1 invalid question(s) were regenerated")
+    assert "left out" not in warning
+
+
+def test_finalize_of_a_valid_quiz_has_no_warning():
+    data = {"questions": [_question("Good?")]}
+    assert quiz_gen.finalize_quiz(FakeLLM(), None, data, {"quiz_id": "q1"}, 1, "test")[1] is None
+
+
+class ChunksVectorStore:
+    def __init__(self, count):
+        self.docs = [Document(page_content=f"chunk {i}") for i in range(count)]
+
+    def max_marginal_relevance_search(self, query, k, fetch_k):
+        return self.docs[:k]
+
+
+def test_retrieve_contexts_deals_chunks_out_without_repeats():
+    contexts = quiz_gen.retrieve_contexts(ChunksVectorStore(100), "query", 3, k=2)
+    assert [[doc.page_content for doc in context] for context in contexts] == [
+        ["chunk 0", "chunk 3"], ["chunk 1", "chunk 4"], ["chunk 2", "chunk 5"],
+    ]
+
+
+def test_retrieve_contexts_shares_chunks_when_there_are_fewer_than_parts():
+    contexts = quiz_gen.retrieve_contexts(ChunksVectorStore(2), "query", 5, k=4)
+    assert all(len(context) == 2 for context in contexts)
+    assert [context[0].page_content for context in contexts] == ["chunk 0", "chunk 1", "chunk 0", "chunk 1", "chunk 0"]
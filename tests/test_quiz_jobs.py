@@ -0,0 +1,115 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import mongomock.gridfs
+import pytest
+
+import db_indexes
+import quiz_jobs
+
+mongomock.gridfs.enable_gridfs_integration()
+
+PARAMS = {"quiz_fields": {"quiz_id": "q1"}, "num_questions": 5, "description": "d", "prompt": "p", "fresh": False}
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        return Future()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class BrokenExecutor(FakeExecutor):
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("a worker died")
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    client = mongomock.MongoClient()
+    db_indexes.migrate(client)
+    monkeypatch.setattr(quiz_jobs.resources, "get_mongo_client", lambda: client)
+    monkeypatch.setattr(quiz_jobs, "_get_executor", lambda executor=FakeExecutor(): executor)
+    monkeypatch.setattr(quiz_jobs, "_submitted", {})
+    monkeypatch.setattr(quiz_jobs, "_last_sweep", 0.0)
+    return quiz_jobs._collections()
+
+
+def _running(jobs, owner, lease_seconds):
+    now = datetime.now(timezone.utc)
+    return jobs.insert_one({
+        "status": "running", "owner": owner, "file_id": None, "started_at": now,
+        "lease_until": now + timedelta(seconds=lease_seconds),
+    }).inserted_id
+
+
+def test_submitting_the_same_job_twice_queues_it_once(collections):
+    jobs, _ = collections
+    first = quiz_jobs.submit_job("t", b"%PDF", "a.pdf", PARAMS)
+    assert quiz_jobs.submit_job("t", b"%PDF", "a.pdf", PARAMS) == first
+    assert quiz_jobs.submit_job("t", b"%PDF", "a.pdf", {**PARAMS, "num_questions": 6}) != first
+    assert jobs.count_documents({}) == 2
+
+
+def test_a_finished_job_can_be_submitted_again(collections):
+    jobs, files = collections
+    first = quiz_jobs.submit_job("t", b"%PDF", "a.pdf", PARAMS)
+    job = quiz_jobs._claim(jobs, first, "worker-1")
+    quiz_jobs._finish(jobs, files, job, "worker-1", {"status": "done", "result": {}})
+    assert quiz_jobs.submit_job("t", b"%PDF", "a.pdf", PARAMS) != first
+
+
+def test_a_job_is_claimed_by_one_worker(collections):
+    jobs, _ = collections
+    job_id = quiz_jobs.submit_job("t", b"%PDF", "a.pdf", PARAMS)
+    assert quiz_jobs._claim(jobs, job_id, "worker-1")["status"] == "queued"
+    assert quiz_jobs._claim(jobs, job_id, "worker-2") is None
+
+
+def test_a_running_job_with_a_live_lease_is_not_taken_over(collections):
+    jobs, _ = collections
+    job_id = _running(jobs, "worker-1", lease_seconds=60)
+    assert quiz_jobs._claim(jobs, str(job_id), "worker-2") is None
+
+
+def test_an_expired_lease_is_taken_over_and_the_old_worker_cannot_finish(collections):
+    jobs, files = collections
+    job_id = _running(jobs, "worker-1", lease_seconds=-1)
+    job = quiz_jobs._claim(jobs, str(job_id), "worker-2")
+    assert job["owner"] == "worker-1"
+    assert not quiz_jobs._finish(jobs, files, job, "worker-1", {"status": "failed", "error": "late"})
+    assert jobs.find_one({"_id": job_id})["status"] == "running"
+    assert quiz_jobs._finish(jobs, files, job, "worker-2", {"status": "done", "result": {}})
+    assert jobs.find_one({"_id": job_id})["status"] == "done"
+
+
+def test_listing_jobs_queues_jobs_left_behind_once(collections, monkeypatch):
+    jobs, _ = collections
+    executor = FakeExecutor()
+    monkeypatch.setattr(quiz_jobs, "_get_executor", lambda: executor)
+    queued = jobs.insert_one({"teacher_name": "t", "status": "queued", "created_at": datetime.now(timezone.utc)}).inserted_id
+    lost = _running(jobs, "worker-1", lease_seconds=-1)
+    _running(jobs, "worker-2", lease_seconds=60)
+
+    quiz_jobs.list_jobs("t")
+    assert sorted(executor.submitted) == sorted([(str(queued),), (str(lost),)])
+
+    # Jobs still waiting in this process's pool aren't queued again
+    monkeypatch.setattr(quiz_jobs, "_last_sweep", 0.0)
+    quiz_jobs.list_jobs("t")
+    assert len(executor.submitted) == 2
+
+
+def test_a_broken_pool_is_replaced(collections, monkeypatch):
+    executors = [BrokenExecutor(), FakeExecutor()]
+    monkeypatch.setattr(quiz_jobs, "_get_executor", lambda: executors[0])
+    monkeypatch.setattr(quiz_jobs, "_discard_executor", lambda executor: executors.remove(executor))
+    job_id = quiz_jobs.submit_job("t", b"%PDF", "a.pdf", PARAMS)
+    assert executors[0].submitted == [(job_id,)]
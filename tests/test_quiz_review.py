@@ -0,0 +1,31 @@
+from streamlit.testing.v1 import AppTest
+
+QUIZ = {"quiz_id": "q1", "questions": [
+    {"question_id": 1, "question": "First?", "options": [{"option_text": "a", "is_correct": True}]},
+    {"question_id": 2, "question": "Second?", "options": [{"option_text": "b", "is_correct": True}]},
+]}
+
+
+def _review_page():
+    import quiz_review
+    quiz_review.review_questions(None, "description")
+
+
+def test_review_shows_one_replace_checkbox_per_question():
+    app = AppTest.from_function(_review_page)
+    app.session_state["generated_quiz"] = QUIZ
+    app.run()
+    assert [expander.label for expander in app.expander] == ["Q1. First?", "Q2. Second?"]
+    assert len(app.checkbox) == 2
+    assert not app.button
+
+
+def test_regenerating_without_a_retriever_shows_an_error():
+    app = AppTest.from_function(_review_page)
+    app.session_state["generated_quiz"] = QUIZ
+    app.session_state["retriever"] = None
+    app.run()
+    app.checkbox[1].check().run()
+    app.button[0].click().run()
+    assert "Retriever is not initialized" in app.error[0].value
+    assert app.session_state["generated_quiz"] == QUIZ
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import quiz_schema
+
+
+def _question(text="What is 2 + 2?", correct=(True, False)):
+    return {"question": text, "options": [{"option_text": str(i), "is_correct": c} for i, c in enumerate(correct)]}
+
+
+def test_extract_json_strips_fences_and_surrounding_text():
+    text = "Here is the quiz:\n```json\n" + json.dumps({"questions": [_question()]}) + "\n```\nGood luck!"
+    assert quiz_schema.extract_json(text) == {"questions": [_question()]}
+
+
+def test_extract_json_repairs_trailing_commas_and_python_literals():
+    text = '{"questions": [{"question": "Q?", "options": [{"option_text": "a", "is_correct": True}, ' \
+           '{"option_text": "b", "is_correct": False},],},], "title": None}'
+    data = quiz_schema.extract_json(text)
+    assert data["title"] is None
+    assert [option["is_correct"] for option in data["questions"][0]["options"]] == [True, False]
+
+
+def test_extract_json_salvages_complete_questions_from_a_truncated_output():
+    text = json.dumps({"questions": [_question("First?"), _question("Second?")]})
+    data = quiz_schema.extract_json(text[:text.index("Second?")])
+    assert data == {"questions": [_question("First?")]}
+
+
+def test_extract_json_raises_when_nothing_is_usable():
+    with pytest.raises(ValueError):
+        quiz_schema.extract_json("I can't help with that.")
+    with pytest.raises(ValueError):
+        quiz_schema.extract_json('{"questions": [{"question": "cut')
+
+
+def test_validate_questions_reports_each_invalid_question():
+    questions = [
+        _question(),
+        _question(correct=(True, True)),
+        _question(text="  "),
+        {"question": "One option?", "options": [{"option_text": "a", "is_correct": True}]},
+    ]
+    checked, errors = quiz_schema.validate_questions(questions)
+    assert [i for i, _ in errors] == [1, 2, 3]
+    assert "exactly one option must be correct" in errors[0][1]
+    assert checked[0]["question_id"] == 1
+    assert checked[1] == {"question_id": 2, **questions[1]}  # Invalid ones are left as they came
+
+
+def test_validate_questions_accepts_the_old_question_text_field():
+    checked, errors = quiz_schema.validate_questions([{"question_text": "Old?", "options": _question()["options"]}])
+    assert not errors
+    assert checked[0]["question"] == "Old?"
+
+
+def test_normalize_quiz_keeps_known_fields_and_a_model_title():
+    quiz, errors = quiz_schema.normalize_quiz(
+        {"title": "Model title", "quiz_id": "ignored", "questions": [_question()]},
+        {"quiz_id": 7, "title": "", "course_id": "C1"},
+    )
+    assert not errors
+    assert (quiz["quiz_id"], quiz["title"], quiz["course_id"]) == ("7", "Model title", "C1")
+
+
+def test_is_valid_output_needs_a_whole_object_with_valid_questions():
+    valid = json.dumps({"questions": [_question()]})
+    assert quiz_schema.is_valid_output(valid)
+    assert not quiz_schema.is_valid_output(valid[:-10])
+    assert not quiz_schema.is_valid_output(json.dumps({"questions": []}))
+    assert not quiz_schema.is_valid_output(json.dumps({"questions": [_question(correct=(False, False))]}))
@@ -0,0 +1,39 @@
+import mongomock
+import pytest
+
+import db_indexes
+import resources
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    monkeypatch.setenv("MONGO_URI", "mongodb://localhost")
+    monkeypatch.setenv("MONGO_AUTO_MIGRATE", "1")
+    monkeypatch.setattr(resources, "MongoClient", lambda uri, **kwargs: mongomock.MongoClient())
+    resources.reset("mongo")
+    yield
+    resources.reset("mongo")
+
+
+def test_no_client_is_handed_out_when_the_migration_fails(mongo, monkeypatch):
+    def fail(client):
+        raise RuntimeError("index build failed")
+
+    monkeypatch.setattr(db_indexes, "migrate", fail)
+    with pytest.raises(RuntimeError, match="migration failed"):
+        resources.get_mongo_client()
+    assert "mongo" not in resources._resources
+
+
+def test_the_next_call_retries_the_migration(mongo, monkeypatch):
+    calls = []
+
+    def flaky(client):
+        calls.append(client)
+        if len(calls) == 1:
+            raise RuntimeError("primary stepped down")
+
+    monkeypatch.setattr(db_indexes, "migrate", flaky)
+    with pytest.raises(RuntimeError):
+        resources.get_mongo_client()
+    assert resources.get_mongo_client() is calls[1]
@@ -0,0 +1,56 @@
+import os
+import time
+
+import pytest
+
+import session_auth
+
+PROFILE = {"username": "ada", "name": "Ada Lovelace", "role": "Teacher", "course_ids": ["CS101"]}
+
+
+def test_token_round_trip():
+    assert session_auth.verify_token(session_auth.issue_token(PROFILE)) == PROFILE
+
+
+def test_tampered_token_is_rejected():
+    payload, signature = session_auth.issue_token(PROFILE).split(".")
+    forged = session_auth._b64encode(b'{"username":"ada","role":"Teacher","exp":9999999999}')
+    assert session_auth.verify_token(f"{forged}.{signature}") is None
+    assert session_auth.verify_token(f"{payload}.{signature[:-2]}xx") is None
+    assert session_auth.verify_token("not a token") is None
+    assert session_auth.verify_token(None) is None
+
+
+def test_expired_token_is_rejected():
+    assert session_auth.verify_token(session_auth.issue_token(PROFILE, minutes=-1)) is None
+
+
+def test_token_signed_with_another_key_is_rejected(monkeypatch):
+    token = session_auth.issue_token(PROFILE)
+    monkeypatch.setitem(session_auth._cookie, "key", "another-secret-" + "y" * 32)
+    assert session_auth.verify_token(token) is None
+
+
+def test_rotation_after_a_third_of_the_lifetime(monkeypatch):
+    token = session_auth.issue_token(PROFILE)
+    assert not session_auth._needs_rotation(token)
+    later = time.time() + session_auth.SESSION_TOKEN_MINUTES * 60 / 2
+    monkeypatch.setattr(session_auth.time, "time", lambda: later)
+    assert session_auth._needs_rotation(token)
+    assert session_auth._needs_rotation(None)
+
+
+@pytest.mark.parametrize("secret", ["", "short", "some_signature_key"])
+def test_refuses_to_start_without_a_usable_secret(monkeypatch, secret):
+    monkeypatch.setenv("SESSION_SECRET", secret)
+    with pytest.raises(RuntimeError):
+        session_auth._load_cookie_config()
+
+
+def test_config_key_is_not_accepted_as_secret(monkeypatch):
+    monkeypatch.setattr(session_auth, "MIN_SECRET_LENGTH", 1)
+    monkeypatch.setenv("SESSION_SECRET", "some_signature_key")
+    with pytest.raises(RuntimeError):
+        session_auth._load_cookie_config()
+    monkeypatch.setenv("SESSION_SECRET", os.urandom(8).hex())
+    assert session_auth._load_cookie_config()["key"]